@@ -0,0 +1,161 @@
+#!/usr/bin/python3
+# rxnag - Medication reminder app
+# Copyright (c) 2024-2026 Solorvox solorvox (at) epic.geek.nz
+# Source: https://github.com/solorvox/rxnag
+# License: GPL-3 https://www.gnu.org/licenses/gpl-3.0.txt
+#
+# Times the hot paths against synthetic configs on a simulated clock:
+#   python3 benchmarks/run.py [--sizes 10,1000,100000] [--days 14] [--no-ui]
+# Nothing touches your real data; every run works in a throwaway directory.
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import tempfile
+import importlib.util
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+from rxnag_core import ReminderEngine, SimulatedClock
+
+start_time = 1_700_000_000  # fixed epoch so runs are comparable
+# what --schedules hands out, from one lookup to a few phases deep
+schedule_mix = ("08:00,20:00", "weekdays 08:00,13:00,20:00", "mon,wed,fri 09:30", "every 36h", "as needed, 4h apart",
+                "taper from 2023-11-10 08:00: every 6h for 3d; every 8h for 4d; daily 08:00,20:00 for 7d; weekdays 08:00")
+
+def write_config(directory: str, count: int, rng: random.Random, schedules: float = 0.0):
+    # a mix of intervals, some overdue, some muted, schedules for that share of them
+    medications = []
+    for i in range(count):
+        interval = rng.choice((4, 6, 8, 12, 24, 24, 48))
+        medications.append({
+            "id": i + 1,
+            "name": f"Medication {i:06d}",
+            "last_taken": start_time - rng.randrange(interval * 3600 * 2),
+            "interval": interval,
+            "muted": rng.random() < 0.05,
+        })
+        if schedules and rng.random() < schedules:
+            medications[-1]["schedule"] = rng.choice(schedule_mix)
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, "config.json"), "w") as f:
+        json.dump({"notification_timer_mins": 5, "medications": medications, "next_id": count + 1}, f)
+
+def timed(function):
+    began = time.perf_counter()
+    result = function()
+    return time.perf_counter() - began, result
+
+def simulate(engine: ReminderEngine, clock: SimulatedClock, days: int, rng: random.Random, nag_secs: int = 300):
+    # jump from deadline to deadline; most doses are taken a little late,
+    # some only after being nagged a few times
+    rows = {name: row for row, name in enumerate(engine.store.names)}
+    end = clock.now() + days * 86400
+    sweeps = reminders = doses = 0
+    while True:
+        next_due = engine.next_due()
+        if next_due is None or next_due > end:
+            break
+        clock.set(max(clock.time(), next_due))
+        names = engine.check_reminders(clock.now(), nag_secs)
+        sweeps += 1
+        reminders += len(names)
+        for name in names:
+            if rng.random() < 0.8:
+                engine.mark_taken(rows[name], clock.now() + rng.randrange(600))
+                doses += 1
+    return sweeps, reminders, doses
+
+def bench_engine(directory: str, count: int, days: int, simulate_limit: int, rng: random.Random,
+                 schedules: float = 0.0) -> dict:
+    write_config(directory, count, rng, schedules)
+    clock = SimulatedClock(start_time)
+    engine = ReminderEngine(directory, clock)
+    results = {}
+    results["load_config"], _ = timed(engine.load_config)
+
+    # a full sweep: every medication's deadline has passed
+    clock.advance(49 * 3600)
+    for med_id in engine.store.ids:
+        engine.scheduler.schedule(med_id, clock.now())
+    results["sweep"], names = timed(lambda: engine.check_reminders(clock.now(), 300))
+    results["sweep_due"] = len(names)
+
+    def save():
+        engine.save_config()
+        engine.flush()
+    results["save_config"], _ = timed(save)
+    results["config_bytes"] = os.path.getsize(engine.config_file)
+
+    if count <= simulate_limit:
+        results["simulate"], (sweeps, reminders, doses) = timed(lambda: simulate(engine, clock, days, rng))
+        results["simulated"] = f"{sweeps} sweeps, {reminders} reminders, {doses} doses"
+    engine.close()
+    return results
+
+def bench_ui(directory: str, count: int, rng: random.Random, schedules: float = 0.0):
+    # RxNag reads from $HOME, so point it at a synthetic data dir
+    home = os.path.join(directory, "home")
+    write_config(os.path.join(home, ".local", "share", "rxnag"), count, rng, schedules)
+    os.environ["HOME"] = home
+    import rxnag
+    from PyQt5.QtWidgets import QApplication
+    app = QApplication.instance() or QApplication([])
+    clock = SimulatedClock(start_time)
+    elapsed, reminder = timed(lambda: rxnag.RxNag(audio_available=False, clock=clock))
+    paint, _ = timed(lambda: (reminder.show(), app.processEvents()))
+    reminder.hide()
+    reminder.timer.stop()
+    reminder.profiles.close()
+    reminder.deleteLater()
+    app.processEvents()
+    return elapsed, paint
+
+def main():
+    argparser = argparse.ArgumentParser(description="rxnag hot path benchmarks")
+    argparser.add_argument("--sizes", default="10,100,1000,10000,100000",
+                           help="comma separated medication counts")
+    argparser.add_argument("--days", type=int, default=14, help="simulated days of reminders and doses")
+    argparser.add_argument("--simulate-limit", type=int, default=1000,
+                           help="skip the simulation above this many medications")
+    argparser.add_argument("--no-ui", action="store_true", help="skip UI construction (no PyQt5 needed)")
+    argparser.add_argument("--schedules", type=float, default=0.0, metavar="SHARE",
+                           help="share of medications with a schedule instead of a plain interval, e.g. 0.5")
+    argparser.add_argument("--seed", type=int, default=1)
+    args = argparser.parse_args()
+
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    sizes = [int(size) for size in args.sizes.split(",") if size]
+    ui = not args.no_ui
+    if ui and importlib.util.find_spec("PyQt5") is None:
+        print("PyQt5 not installed, skipping UI construction", file=sys.stderr)
+        ui = False
+
+    header = f"{'meds':>8} {'load':>9} {'sweep':>9} {'save':>9} {'bytes':>10}"
+    if ui:
+        header += f" {'ui':>9} {'show':>9}"
+    header += f" {'simulate':>9}  activity"
+    print(header)
+    for count in sizes:
+        rng = random.Random(args.seed)
+        directory = tempfile.mkdtemp(prefix="rxnag-bench-")
+        try:
+            results = bench_engine(os.path.join(directory, "engine"), count, args.days, args.simulate_limit, rng,
+                                   args.schedules)
+            line = (f"{count:>8} {results['load_config'] * 1000:>7.1f}ms {results['sweep'] * 1000:>7.1f}ms "
+                    f"{results['save_config'] * 1000:>7.1f}ms {results['config_bytes']:>10}")
+            if ui:
+                ui_time, show_time = bench_ui(directory, count, rng, args.schedules)
+                line += f" {ui_time * 1000:>7.1f}ms {show_time * 1000:>7.1f}ms"
+            if "simulate" in results:
+                line += f" {results['simulate'] * 1000:>7.1f}ms  {args.days} days: {results['simulated']}"
+            else:
+                line += f" {'-':>9}"
+            print(line, flush=True)
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
@@ -3,196 +3,497 @@
 # Copyright (c) 2024-2026 Solorvox solorvox (at) epic.geek.nz
 # Source: https://github.com/solorvox/rxnag
 # License: GPL-3 https://www.gnu.org/licenses/gpl-3.0.txt
-import os
-import json
 import time
-import argparse
-import atexit
-from dateutil import parser
-from PyQt5.QtGui import QIcon, QPalette, QColor
-from PyQt5.QtCore import Qt, QTimer, pyqtSignal
+startup_time = time.perf_counter()
+import os
+import sys
+import rxnag_core
+
+if __name__ == "__main__":
+    # hand the command line to a running instance before paying for Qt
+    instance = rxnag_core.SingleInstance()
+    if not instance.acquire() and not {"-h", "--help"} & set(sys.argv[1:]):
+        sys.exit(instance.forward(sys.argv[1:]))
+    args = rxnag_core.build_arg_parser().parse_args()
+    if args.stats:
+        print("rxnag: RxNag isn't running, --stats shows the running instance's numbers", file=sys.stderr)
+        sys.exit(1)
+    if args.report is not None:
+        import rxnag_report
+        sys.exit(rxnag_report.main(args))
+    if args.export or args.import_file:
+        import rxnag_transfer
+        sys.exit(rxnag_transfer.main(args))
+    if args.headless:
+        import rxnag_headless
+        sys.exit(rxnag_headless.main(sys.argv[1:], instance))
+    # from here on, so Qt imports and building the UI are in the numbers
+    if args.profile or args.trace_memory:
+        import rxnag_diagnostics
+        if args.profile:
+            rxnag_diagnostics.profiler.start_cpu()
+        if args.trace_memory:
+            rxnag_diagnostics.profiler.start_memory()
+
+from PyQt5.QtGui import QIcon, QPalette, QFont, QPen, QBrush, QFontDatabase
+from PyQt5.QtCore import Qt, QObject, QTimer, QEvent, QRect, QSize, QModelIndex, QAbstractListModel, pyqtSignal
+from PyQt5.QtCore import QSocketNotifier
+from PyQt5.QtNetwork import QLocalServer
 from PyQt5.QtWidgets import QDialog, QVBoxLayout, QHBoxLayout, QLabel, QLineEdit, QSpinBox, QPushButton
-from PyQt5.QtWidgets import QMessageBox, QCheckBox, QSpacerItem, QSizePolicy
+from PyQt5.QtWidgets import QMessageBox, QCheckBox, QComboBox, QInputDialog
 from PyQt5.QtWidgets import QApplication, QWidget, QSystemTrayIcon, QMenu, QAction, QFileDialog
-from PyQt5.QtWidgets import QSlider, QScrollArea
-from pathlib import Path
+from PyQt5.QtWidgets import QSlider, QListView, QStyle, QStyledItemDelegate, QStyleOptionButton, QPlainTextEdit
+import bisect
+import queue
 import datetime
-
+import threading
+from rxnag_core import MedicationStore, ProfileManager, max_timer_secs, data_dir, default_profile
+from rxnag_core import ClockJumpDetector, ClockChangeWatch, clock_check_secs, StorageUnavailable
+from rxnag_diagnostics import stats, stats_file_name, profiler
+from rxnag_schedule import parse_schedule
+
+# pygame and dateutil are imported on first use to keep them off the startup path
+# (dateutil only for free-form dates, see rxnag_core.parse_timestamp)
 os.environ['PYGAME_HIDE_SUPPORT_PROMPT'] = "hide"
-import pygame
 
-pid = str(os.getpid())
-pidfile = os.path.join(os.path.sep, "tmp", "rxnag.pid")
 default_sound_file = 'reminder.wav'
 VERSION = "1.0.5"
 
-class RxNagWidget(QWidget):
-    # Signals for decoupled communication
-    taken = pyqtSignal()
-    muted_changed = pyqtSignal(bool)
-    edited = pyqtSignal()
-    delete_requested = pyqtSignal()
-    show_reminder = pyqtSignal(str)
+class MedicationListModel(QAbstractListModel):
+    # Qt view of a MedicationStore.  Unfiltered, rows map 1:1 onto store rows;
+    # with a filter set, self.rows lists the store rows shown, in store order,
+    # and follows the store's events without rescanning it.
+    quick_filters = (("All medications", None), ("Due now", "due"),
+                     ("Due in next hour", "hour"), ("Muted", "muted"))
 
-    def __init__(self, medication: str, last_taken: int, interval: int, muted: bool, parent=None):
+    def __init__(self, store: MedicationStore, parent=None):
         super().__init__(parent)
-        self.medication = medication
-        self.last_taken = last_taken  # in seconds since epoch
-        self.muted = muted
-        self.interval = interval  # in hours
-
-        # Create a container widget to hold all the other widgets
-        self.container = QWidget()
-        container_layout = QVBoxLayout()
-        self.container.setObjectName("MedicationContainer")
-        self.container.setLayout(container_layout)
-        self.container.setContentsMargins(0, 0, 0, 0)
-
-        medline_layout = QHBoxLayout()
-
-        self.medication_label = QLabel(medication)
-        medline_layout.addWidget(self.medication_label)
-
-        spacer = QSpacerItem(40, 20, QSizePolicy.Expanding, QSizePolicy.Minimum)
-        medline_layout.addItem(spacer)
-
-        self.edit_button = QPushButton("Edit")
-        self.edit_button.clicked.connect(self.edit_medication)
-        self.edit_button.setFixedWidth(80)
-        medline_layout.addWidget(self.edit_button)
-
-        # Mute checkbox
-        self.mute_checkbox = QCheckBox("Mute")
-        self.mute_checkbox.setChecked(self.muted)
-        self.mute_checkbox.toggled.connect(self.on_mute_toggled)
-        medline_layout.addWidget(self.mute_checkbox)
-
-        container_layout.addLayout(medline_layout)
-
-        time_text_layout = QHBoxLayout()
-        self.last_taken_label = QLabel(self.get_last_taken_text())
-        time_text_layout.addWidget(self.last_taken_label)
-        self.next_dose_label = QLabel(self.get_next_dose_text())
-        time_text_layout.addWidget(self.next_dose_label)
-        container_layout.addLayout(time_text_layout)
-
-        self.taken_button = QPushButton("Mark taken")
-        self.taken_button.clicked.connect(self.on_taken_clicked)
-
-        container_layout.addWidget(self.taken_button)
-
-        # keep the times updated in the gui
-        self.update_timer = QTimer(self)
-        self.update_timer.timeout.connect(self.update_time_labels)
-        self.update_timer.start(60 * 1000)  # 1 min
-
-        # Add the container widget to the main layout
-        layout = QVBoxLayout()
-        layout.addWidget(self.container)
-        layout.setContentsMargins(0, 0, 0, 0)
-        layout.setSpacing(0)
-
-        self.setLayout(layout)
-
-        # Set the initial style
-        self.update_style()
-
-    def on_taken_clicked(self):
-        self.last_taken = int(time.time())
-        self.last_taken_label.setText(self.get_last_taken_text())
-        self.next_dose_label.setText(self.get_next_dose_text())
-        self.update_style()
-        self.taken.emit()
-
-    def on_mute_toggled(self, checked):
-        self.muted = checked
-        self.muted_changed.emit(checked)
-
-    def edit_medication(self):
-        edit_dialog = EditMedicationDialog(self.medication, self.last_taken, self.interval, self.muted, self)
-        if edit_dialog.exec_():
-            if edit_dialog.was_deleted:
-                self.delete_requested.emit()
-                return
+        self.store = store
+        self.search_index = None  # built the first time a filter is set
+        self.filter_text = ""
+        self.quick_filter = None
+        self.rows = None
+        self._removing = None
+        store.subscribe(self.on_store_changed)
+
+    def set_store(self, store: MedicationStore):
+        # switching profiles swaps the whole store
+        self.beginResetModel()
+        self.store.unsubscribe(self.on_store_changed)
+        self.store = store
+        self.search_index = None
+        store.subscribe(self.on_store_changed)
+        self.rows = self._filtered_rows()
+        self.endResetModel()
+
+    def store_row(self, index) -> int:
+        return index.row() if self.rows is None else self.rows[index.row()]
+
+    def set_filter(self, text=None, quick_filter=""):
+        if text is not None:
+            self.filter_text = rxnag_core.MedicationIndex.fold(text)
+        if quick_filter != "":
+            self.quick_filter = quick_filter
+        self.refilter()
+
+    def refilter(self):
+        rows = self._filtered_rows()
+        if rows != self.rows:
+            self.beginResetModel()
+            self.rows = rows
+            self.endResetModel()
+
+    def _filtered_rows(self):
+        if not self.filter_text and self.quick_filter is None:
+            return None
+        if self.search_index is None:
+            self.search_index = rxnag_core.MedicationIndex(self.store)
+        ids = None
+        if self.filter_text:
+            ids = self.search_index.search(self.filter_text)
+        if self.quick_filter == "muted":
+            quick = self.search_index.muted()
+        elif self.quick_filter is not None:
+            quick = self.search_index.due_by(self._due_limit())
+        else:
+            quick = ids
+        ids = quick if ids is None else ids & quick
+        return sorted(map(self.store.row_of, ids))
+
+    def _due_limit(self) -> int:
+        return self.store.clock.now() + (3600 if self.quick_filter == "hour" else 0)
+
+    def accepts(self, row) -> bool:
+        store = self.store
+        if self.filter_text and not self.search_index.matches(self.filter_text, store.ids[row]):
+            return False
+        if self.quick_filter == "muted":
+            return store.is_muted(row)
+        if self.quick_filter is not None:
+            return store.next_due(row) <= self._due_limit()
+        return True
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self.store) if self.rows is None else len(self.rows)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        if role == Qt.DisplayRole:
+            return self.store.names[self.store_row(index)]
+        return None
+
+    def on_store_changed(self, event, row):
+        if self.search_index is not None:
+            self.search_index.on_store_changed(event, row)
+        if self.rows is not None:
+            self.on_filtered_store_changed(event, row)
+        elif event == rxnag_core.ABOUT_TO_INSERT:
+            self.beginInsertRows(QModelIndex(), row, row)
+        elif event == rxnag_core.INSERTED:
+            self.endInsertRows()
+        elif event == rxnag_core.ABOUT_TO_REMOVE:
+            self.beginRemoveRows(QModelIndex(), row, row)
+        elif event == rxnag_core.REMOVED:
+            self.endRemoveRows()
+        elif event == rxnag_core.ABOUT_TO_RESET:
+            self.beginResetModel()
+        elif event == rxnag_core.RESET:
+            self.endResetModel()
+        elif event == rxnag_core.CHANGED:
+            index = self.index(row)
+            self.dataChanged.emit(index, index)
+
+    def _position(self, row):
+        position = bisect.bisect_left(self.rows, row)
+        return position if position < len(self.rows) and self.rows[position] == row else None
+
+    def on_filtered_store_changed(self, event, row):
+        # a change can move a row in or out of the filter
+        rows = self.rows
+        if event == rxnag_core.ABOUT_TO_RESET:
+            self.beginResetModel()
+        elif event == rxnag_core.RESET:
+            self.rows = self._filtered_rows()
+            self.endResetModel()
+        elif event == rxnag_core.INSERTED:
+            if self.accepts(row):
+                # new rows are appended to the store, so they go last
+                self.beginInsertRows(QModelIndex(), len(rows), len(rows))
+                rows.append(row)
+                self.endInsertRows()
+        elif event == rxnag_core.ABOUT_TO_REMOVE:
+            self._removing = self._position(row)
+            if self._removing is not None:
+                self.beginRemoveRows(QModelIndex(), self._removing, self._removing)
+        elif event == rxnag_core.REMOVED:
+            position, self._removing = self._removing, None
+            if position is not None:
+                del rows[position]
+            # later store rows moved up by one
+            for later in range(bisect.bisect_left(rows, row), len(rows)):
+                rows[later] -= 1
+            if position is not None:
+                self.endRemoveRows()
+        elif event == rxnag_core.CHANGED:
+            position = self._position(row)
+            accepted = self.accepts(row)
+            if position is not None and accepted:
+                index = self.index(position)
+                self.dataChanged.emit(index, index)
+            elif position is not None:
+                self.beginRemoveRows(QModelIndex(), position, position)
+                del rows[position]
+                self.endRemoveRows()
+            elif accepted:
+                position = bisect.bisect_left(rows, row)
+                self.beginInsertRows(QModelIndex(), position, position)
+                rows.insert(position, row)
+                self.endInsertRows()
+
+class MedicationDelegate(QStyledItemDelegate):
+    # Paints each medication row (name, Edit, Mute, times, Mark taken) directly,
+    # so only the rows in view cost anything.  Clicks are hit-tested here.
+    edit_clicked = pyqtSignal(QModelIndex)
+    mute_clicked = pyqtSignal(QModelIndex)
+    taken_clicked = pyqtSignal(QModelIndex)
+
+    margin = 9
+    spacing = 6
+    edit_width = 80
 
-            self.medication = edit_dialog.medication_input.text()
-            strtime = edit_dialog.last_taken_input.text()
-            self.last_taken = int(parser.parse(strtime).timestamp())
-            self.interval = edit_dialog.interval_input.value()
-            self.medication_label.setText(self.medication)
-            self.last_taken_label.setText(self.get_last_taken_text())
-            self.update_time_labels()
-            self.update_style()
-            self.edited.emit()
-
-    def check_reminder(self):
-        next_due = self.last_taken + (self.interval * 3600)
-        now = int(time.time())
-        if now >= next_due and not self.muted:
-            self.show_reminder.emit(self.medication)
-        self.update_style()
-
-    def update_time_labels(self):
-        self.last_taken_label.setText(self.get_last_taken_text())
-        self.next_dose_label.setText(self.get_next_dose_text())
-
-    def update_style(self):
-        now = int(time.time())
-        next_due = self.last_taken + (self.interval * 3600)
-
-        # Get the current desktop theme's color
-        palette = self.palette()
-        border_color = palette.color(QPalette.Highlight)
-
-        # Darken the border color a bit
-        dark_color = palette.color(QPalette.Window).darker(64)
-
-        if now >= next_due:
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._pressed = None  # (store row, part) while a painted button is held down
+        self._due_style = None  # (pen, brush) for due rows, rebuilt on palette change
+
+    def invalidate_style(self):
+        self._due_style = None
+
+    def _get_due_style(self, palette):
+        if self._due_style is None:
+            # border in the desktop theme's highlight color, darkened background
+            border_color = palette.color(QPalette.Highlight)
+            dark_color = palette.color(QPalette.Window).darker(64)
+            self._due_style = (QPen(border_color, 2), QBrush(dark_color))
+        return self._due_style
+
+    def _metrics(self, option):
+        line_h = option.fontMetrics.height()
+        button_h = line_h + 12
+        return line_h, button_h
+
+    def _layout(self, option):
+        rect = option.rect.adjusted(self.margin, self.margin, -self.margin, -self.margin)
+        line_h, button_h = self._metrics(option)
+        style = option.widget.style() if option.widget else QApplication.style()
+        indicator_w = style.pixelMetric(QStyle.PM_IndicatorWidth)
+        mute_w = indicator_w + option.fontMetrics.horizontalAdvance("Mute") + 12
+        top = QRect(rect.x(), rect.y(), rect.width(), button_h)
+        mute = QRect(top.right() - mute_w + 1, top.y(), mute_w, button_h)
+        edit = QRect(mute.x() - self.spacing - self.edit_width, top.y(), self.edit_width, button_h)
+        name = QRect(top.x(), top.y(), edit.x() - self.spacing - top.x(), button_h)
+        times = QRect(rect.x(), top.bottom() + 1 + self.spacing, rect.width(), line_h)
+        half = times.width() // 2
+        last_taken = QRect(times.x(), times.y(), half, line_h)
+        next_dose = QRect(times.x() + half, times.y(), times.width() - half, line_h)
+        taken = QRect(rect.x(), times.bottom() + 1 + self.spacing, rect.width(), button_h)
+        return {"name": name, "edit": edit, "mute": mute, "last_taken": last_taken,
+                "next_dose": next_dose, "taken": taken}
+
+    def sizeHint(self, option, index):
+        line_h, button_h = self._metrics(option)
+        height = 2 * self.margin + 2 * button_h + line_h + 2 * self.spacing
+        return QSize(400, height)
+
+    def paint(self, painter, option, index):
+        model = index.model()
+        store = model.store
+        row = model.store_row(index)
+        widget = option.widget
+        style = widget.style() if widget else QApplication.style()
+        palette = option.palette
+        rects = self._layout(option)
+        now = store.clock.now()
+        is_due = store.due[row]
+
+        painter.save()
+        if is_due:
             # Set the border when the medication is due
-            style = "QWidget#MedicationContainer {"
-            style += "border: 2px solid "
-            style += f"{border_color.name(QColor.HexRgb)}; "
-            style += " background-color: "
-            style += f"{dark_color.name(QColor.HexRgb)};}}"
-            self.container.setStyleSheet(style)
-        else:
-            # Reset the style to the default
-            self.container.setStyleSheet("")
-
-    def get_last_taken_text(self):
-        if self.last_taken > 0:
-            time_diff = int(time.time()) - self.last_taken
-            time_string = Utils.format_time(time_diff)
-            return f"Last taken: {time_string} ago"
-        else:
-            return "Last taken: Never"
+            pen, brush = self._get_due_style(palette)
+            painter.setPen(pen)
+            painter.setBrush(brush)
+            painter.drawRect(option.rect.adjusted(1, 1, -1, -1))
+
+        painter.setPen(palette.color(QPalette.WindowText))
+        name = store.names[row]
+        if store.schedules[row] is not None:
+            name += f" ({store.schedule_text(row)})"
+        painter.drawText(rects["name"], Qt.AlignLeft | Qt.AlignVCenter,
+                         option.fontMetrics.elidedText(name, Qt.ElideRight, rects["name"].width()))
+        painter.drawText(rects["last_taken"], Qt.AlignLeft | Qt.AlignVCenter, store.last_taken_text(row, now))
+        next_font = QFont(option.font)
+        next_font.setBold(is_due)
+        painter.setFont(next_font)
+        painter.drawText(rects["next_dose"], Qt.AlignLeft | Qt.AlignVCenter, store.next_dose_text(row, now))
+        painter.restore()
+
+        for part, text in (("edit", "Edit"), ("taken", "Mark taken")):
+            button = QStyleOptionButton()
+            button.rect = rects[part]
+            button.text = text
+            button.palette = palette
+            button.fontMetrics = option.fontMetrics
+            button.state = QStyle.State_Enabled | QStyle.State_Raised
+            if self._pressed == (row, part):
+                button.state = QStyle.State_Enabled | QStyle.State_Sunken
+            style.drawControl(QStyle.CE_PushButton, button, painter, widget)
+
+        checkbox = QStyleOptionButton()
+        checkbox.rect = rects["mute"]
+        checkbox.text = "Mute"
+        checkbox.palette = palette
+        checkbox.fontMetrics = option.fontMetrics
+        checkbox.state = QStyle.State_Enabled | (QStyle.State_On if store.is_muted(row) else QStyle.State_Off)
+        style.drawControl(QStyle.CE_CheckBox, checkbox, painter, widget)
+
+    def _part_at(self, option, pos):
+        for part, rect in self._layout(option).items():
+            if part in ("edit", "mute", "taken") and rect.contains(pos):
+                return part
+        return None
+
+    def editorEvent(self, event, model, option, index):
+        if event.type() == QEvent.MouseButtonPress and event.button() == Qt.LeftButton:
+            part = self._part_at(option, event.pos())
+            if part:
+                self._pressed = (model.store_row(index), part)
+                model.dataChanged.emit(index, index)
+                return True
+        elif event.type() == QEvent.MouseButtonRelease and event.button() == Qt.LeftButton:
+            pressed, self._pressed = self._pressed, None
+            if pressed is None:
+                return False
+            model.dataChanged.emit(index, index)
+            part = self._part_at(option, event.pos())
+            if pressed != (model.store_row(index), part):
+                return True
+            if part == "edit":
+                self.edit_clicked.emit(index)
+            elif part == "mute":
+                self.mute_clicked.emit(index)
+            elif part == "taken":
+                self.taken_clicked.emit(index)
+            return True
+        return super().editorEvent(event, model, option, index)
+
+class StartupProfile:
+    # wall time spent in each startup phase, printed with --startup-profile
+    def __init__(self, start: float):
+        self.start = self.last = start
+        self.phases = []
+
+    def mark(self, phase: str):
+        now = time.perf_counter()
+        self.phases.append((phase, now - self.last))
+        self.last = now
+
+    def report(self) -> str:
+        lines = [f"{phase:<20} {secs * 1000:8.1f} ms" for phase, secs in self.phases]
+        lines.append(f"{'total':<20} {(self.last - self.start) * 1000:8.1f} ms")
+        return "\n".join(lines)
+
+startup_profile = StartupProfile(startup_time)
+
+class SoundCache:
+    # Keeps the decoded pygame Sound for the notification file so reminders
+    # don't re-read and re-decode it.  Keyed by (path, mtime, size) so an
+    # edited or replaced file is picked up on the next play.  Only used from
+    # the SoundPlayer thread.
+    def __init__(self):
+        self._key = None
+        self._sound = None
+
+    def get(self, path: str, volume: float):
+        st = os.stat(path)
+        key = (path, st.st_mtime_ns, st.st_size)
+        if key != self._key:
+            import pygame
+            self._sound = None
+            self._sound = pygame.mixer.Sound(path)
+            self._key = key
+        self._sound.set_volume(volume)
+        return self._sound
+
+    def set_volume(self, volume: float):
+        if self._sound is not None:
+            self._sound.set_volume(volume)
+
+    def stop(self):
+        if self._sound is not None:
+            self._sound.stop()
+
+    def invalidate(self):
+        self._key = None
+        self._sound = None
+
+class SoundPlayer(QObject):
+    # Opening, decoding and playing sounds happen on a worker thread fed by a
+    # command queue, so a slow disk or a stalled mixer never holds up the
+    # event loop.  The thread and the pygame mixer start with the first
+    # command; failures come back as queued signals.
+    failed = pyqtSignal(str, str)  # path, error ("" when the file is missing)
+    unavailable = pyqtSignal()  # no pygame or no audio device
 
-    def get_next_dose_text(self):
-        next_dose_secs = self.last_taken + (self.interval * 3600) - int(time.time())
-        if next_dose_secs <= 0:
-            return "Next dose: <b>now</b>"
-        else:
-            time_string = Utils.format_time(next_dose_secs)
-            return f"Next dose: {time_string}"
-
-class Utils:
-    @staticmethod
-    def format_time(seconds: int) -> str:
-        if seconds < 0:
-            return "0 Seconds"
-        days, rem = divmod(seconds, 86400)
-        hours, rem = divmod(rem, 3600)
-        minutes, secs = divmod(rem, 60)
-        parts = []
-        if days: parts.append(f"{days} {'Day' if days == 1 else 'Days'}")
-        if hours: parts.append(f"{hours} {'Hour' if hours == 1 else 'Hours'}")
-        if minutes and not days: parts.append(f"{minutes} {'Minute' if minutes == 1 else 'Minutes'}")
-        if secs and not (days or hours or minutes):
-            parts.append(f"{secs} Seconds")
-        return ", ".join(parts) if parts else "0 Seconds"
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.volume = 0.75
+        self._commands = queue.Queue()
+        self._thread = None
+
+    def _send(self, *command):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="rxnag-sound", daemon=True)
+            self._thread.start()
+        self._commands.put(command)
+
+    def play(self, path: str, volume=None):
+        if volume is not None:
+            self.volume = volume
+        self._send("play", path, self.volume)
+
+    def stop(self):
+        self._send("stop")
+
+    def set_volume(self, volume: float):
+        self.volume = volume
+        if self._thread is not None:
+            self._send("volume", volume)
+
+    def preload(self, path: str):
+        self._send("preload", path, self.volume)
+
+    def close(self):
+        if self._thread is not None:
+            self._commands.put(None)
+            self._thread.join(1.0)
+            self._thread = None
+
+    def _take_commands(self) -> list:
+        # everything queued so far; only the last play and volume count
+        commands = [self._commands.get()]
+        while True:
+            try:
+                commands.append(self._commands.get_nowait())
+            except queue.Empty:
+                break
+        if None in commands:
+            return [None]
+        last = {}
+        for position, command in enumerate(commands):
+            last[command[0]] = position
+        return [command for position, command in enumerate(commands)
+                if command[0] not in ("play", "volume") or last[command[0]] == position]
+
+    def _run(self):
+        # worker thread: the only place pygame is touched
+        try:
+            import pygame
+            pygame.mixer.init()
+        except Exception:
+            self.unavailable.emit()
+            return
+        cache = SoundCache()
+        while True:
+            for command in self._take_commands():
+                if command is None:
+                    pygame.mixer.quit()
+                    return
+                action = command[0]
+                try:
+                    if action == "play":
+                        with stats.timed("sound_load_seconds"):
+                            sound = cache.get(command[1], command[2])
+                        with stats.timed("sound_play_seconds"):
+                            sound.play()
+                    elif action == "preload":
+                        with stats.timed("sound_load_seconds"):
+                            cache.get(command[1], command[2])
+                    elif action == "volume":
+                        cache.set_volume(command[1])
+                    elif action == "stop":
+                        cache.stop()
+                except FileNotFoundError:
+                    cache.invalidate()
+                    self.failed.emit(command[1], "")
+                except Exception as e:
+                    cache.invalidate()
+                    self.failed.emit(command[1], str(e) or type(e).__name__)
 
 class RxNag(QWidget):
-    def __init__(self, audio_available: bool):
+    def __init__(self, audio_available: bool = True, clock=rxnag_core.system_clock):
         super().__init__()
         self.setWindowTitle("RxNag - Medication Reminder")
         # Larger default size
@@ -204,94 +505,212 @@ class RxNag(QWidget):
         self.sound_file = default_sound_file
         self.sound_volume = 0.75  # default 75%
         self.has_played_audio = False
+        self.sound_player = SoundPlayer(self)
+        self.sound_player.failed.connect(self.on_sound_failed)
+        self.sound_player.unavailable.connect(self.on_audio_unavailable)
+        self.sound_warning = None
         self.setWindowIcon(QIcon(os.path.join(get_script_path(), 'icon.png')))
         self.mute_all = False
         self.start_minimized = False
+        self.write_stats = False  # rxnag.prom in the data dir
         self.medication_interval_default = 6  # number of hours a dose defaults
-
-        self.config_file = os.path.join(Path.home(), ".local", "share", "rxnag", "config.json")
+        self.refresh_timer = QTimer(self)
+        self.refresh_timer.setSingleShot(True)
+        self.refresh_timer.timeout.connect(lambda: stats.count("wakeups_total", label="refresh"))
+        self.refresh_timer.timeout.connect(self.refresh_time_labels)
+
+        # scheduling and persistence live in the Qt-free engine, one per profile;
+        # self.engine and self.store are the profile in view
+        self.clock = clock
+        self.profiles = ProfileManager(data_dir(), clock, timer=stats.timed, on_save=stats.saved)
+        self.profiles.default.get_settings = self.collect_settings
         self.load_config()
+        startup_profile.mark("config load")
+        app = QApplication.instance()
+        if app is not None:
+            app.aboutToQuit.connect(self.profiles.flush)
+            app.aboutToQuit.connect(self.finish_profiling)
 
         self.tray_icon = QSystemTrayIcon(QIcon(os.path.join(get_script_path(), 'icon.png')), self)
         self.tray_icon.setToolTip("RxNag")
 
-        self.create_ui()
+        # the window's contents are built when it is first shown, see setVisible
+        self.ui_built = False
         self.create_tray_menu()
+        startup_profile.mark("tray menu")
 
         # Single tray activation connection
         self.tray_icon.activated.connect(self.on_tray_activated)
         self.tray_icon.show()
+        startup_profile.mark("tray show")
 
+        # single-shot timer armed for the earliest deadline in the scheduler
         self.timer = QTimer()
+        self.timer.setSingleShot(True)
+        self.timer.setTimerType(Qt.PreciseTimer)
+        self.timer.timeout.connect(lambda: stats.count("wakeups_total", label="reminder"))
+        self.timer.timeout.connect(self.check_all_reminders)
+
+        # the timers count monotonic time; after a suspend or a clock step the
+        # deadlines are re-checked straight away instead of when they fire
+        self.clock_jumps = ClockJumpDetector(clock)
+        self.clock_watch = ClockChangeWatch.open()
+        if self.clock_watch is not None:
+            self.clock_notifier = QSocketNotifier(self.clock_watch.fileno(), QSocketNotifier.Read, self)
+            self.clock_notifier.activated.connect(self.on_clock_changed)
         self.start_notification_timer()
 
-    def play_notification_sound(self):
-        # Check if sound is enabled and pygame/audio is available
+    def setVisible(self, visible):
+        # a start to the tray only pays for the tray icon and the reminder
+        # engine; the toolbar, list and model wait until there is a window
+        if visible and not self.ui_built:
+            self.create_ui()
+            startup_profile.mark("ui build")
+        super().setVisible(visible)
+
+    def changeEvent(self, event):
+        super().changeEvent(event)
+        if event.type() == QEvent.PaletteChange and self.ui_built:
+            self.meds_delegate.invalidate_style()
+            self.meds_view.viewport().update()
+
+    def showEvent(self, event):
+        super().showEvent(event)
+        # catch up on labels that went stale while hidden, then resume the clock
+        self.refresh_time_labels()
+
+    def hideEvent(self, event):
+        super().hideEvent(event)
+        self.refresh_timer.stop()
+
+    def start_refresh_timer(self):
+        # fire on the next minute boundary so every label ticks together
+        self.refresh_timer.start(60 * 1000 - int(self.clock.time() * 1000) % (60 * 1000))
+
+    def refresh_time_labels(self):
+        # one shared clock keeps the times updated in the gui, only while shown
+        if not self.isVisible():
+            return
+        # labels are painted on demand, so only the rows in view are redrawn
+        if self.model.quick_filter in ("due", "hour"):
+            self.model.refilter()  # rows come into the due window as time passes
+        self.meds_view.viewport().update()
+        self.start_refresh_timer()
+
+    def sound_path(self) -> str:
+        # If using relative path, ensure we append script's directory
+        if self.sound_file == default_sound_file:
+            return os.path.join(get_script_path(), default_sound_file)
+        return self.sound_file
+
+    def play_notification_sound(self, again=False):
+        # Check if sound is enabled and pygame/audio is available;
+        # once per reminder cycle unless asked to play it again
         if not (self.play_sound and self.audio_available):
             return
+        if again or not self.has_played_audio:
+            self.sound_player.play(self.sound_path(), self.sound_volume)
+            self.has_played_audio = self.has_played_audio or not again
 
-        try:
-            if not self.has_played_audio:
-                snd_file = self.sound_file
-                # If using relative path, ensure we append script's directory
-                if snd_file == default_sound_file:
-                    snd_file = os.path.join(get_script_path(), default_sound_file)
-                sound = pygame.mixer.Sound(snd_file)
-                sound.set_volume(self.sound_volume)
-                sound.play()
-                self.has_played_audio = True
-        except FileNotFoundError:
-            self.has_played_audio = False
-            QMessageBox.warning(self, "Sound File Not Found",
-                                f"The sound file '{self.sound_file}' could not be found.")
-        except Exception:
-            self.has_played_audio = False
+    def on_sound_failed(self, path, error):
+        self.has_played_audio = False
+        if error:
+            print(f"rxnag: could not play {path}: {error}", file=sys.stderr)
+            return
+        # non-modal, so a reminder sweep never waits on it; one box at a time
+        if self.sound_warning is None:
+            self.sound_warning = QMessageBox(QMessageBox.Warning, "Sound File Not Found", "", QMessageBox.Ok, self)
+            self.sound_warning.setModal(False)
+        self.sound_warning.setText(f"The sound file '{self.sound_file}' could not be found.")
+        self.sound_warning.show()
+
+    def on_audio_unavailable(self):
+        self.audio_available = False
 
     def start_notification_timer(self):
-        self.timer.timeout.connect(self.check_all_reminders)
-        self.timer.start(self.notification_timer_mins * 60 * 1000)
+        next_due = self.profiles.next_due()
+        if next_due is None:
+            # nothing can be late; a jump is caught at the next check anyway
+            self.timer.stop()
+            return
+        # without a clock change watch, wake up now and then to look for jumps
+        limit = max_timer_secs if self.clock_watch is not None else clock_check_secs
+        self.timer.start(max(0, min(limit, next_due - self.clock.now())) * 1000)
 
     def restart_timer(self):
         self.timer.stop()
         self.start_notification_timer()
 
+    def on_clock_changed(self):
+        stats.count("wakeups_total", label="clock_change")
+        self.clock_watch.acknowledge()
+        self.check_all_reminders()
+
     def check_all_reminders(self):
+        jump = self.clock_jumps.check()
+        if jump:
+            self.profiles.reschedule(jump)
+            self.refresh_time_labels()
         self.has_played_audio = False  # reset audio status for this cycle
-        for medication_widget in self.medication_list:
-            medication_widget.check_reminder()
-
-    # Signal handlers (decoupled from widgets)
-    def on_med_taken(self, widget):
-        self.save_config()
-
-    def on_med_muted(self, widget, checked):
-        self.save_config()
+        due = self.profiles.check_reminders(self.clock.now(), self.notification_timer_mins * 60)
+        if due:
+            self.on_show_reminder(due)  # one notification for the whole cycle
+        self.start_notification_timer()
+        if self.write_stats:
+            stats.write_due(os.path.join(data_dir(), stats_file_name))
+
+    # Delegate click handlers
+    def on_taken_clicked(self, index):
+        self.mark_taken(self.model.store_row(index))
+
+    def mark_taken(self, row):
+        self.engine.mark_taken(row)
+        self.restart_timer()
+
+    def on_mute_clicked(self, index):
+        row = self.model.store_row(index)
+        self.engine.set_muted(row, not self.store.is_muted(row))
+        self.restart_timer()
+
+    def edit_medication(self, index):
+        store = self.store
+        row = self.model.store_row(index)
+        med_id = store.ids[row]
+        edit_dialog = EditMedicationDialog(store.names[row], store.last_taken[row], store.intervals[row],
+                                           store.is_muted(row), self, clock=self.clock,
+                                           schedule=store.schedule_text(row))
+        if edit_dialog.exec_():
+            if edit_dialog.was_deleted:
+                self.on_med_delete_requested(med_id)
+                return
 
-    def on_med_edited(self, widget):
-        self.save_config()
+            self.engine.edit(store.row_of(med_id),
+                             name=edit_dialog.medication_input.text(),
+                             last_taken=edit_dialog.last_taken,
+                             interval=edit_dialog.interval_input.value(),
+                             schedule=edit_dialog.schedule)
+            self.restart_timer()
 
-    def on_med_delete_requested(self, widget):
+    def on_med_delete_requested(self, med_id):
         msg = QMessageBox(self)
         msg.setIcon(QMessageBox.Warning)
-        msg.setText(f"Are you sure you wish to remove {widget.medication}?")
+        msg.setText(f"Are you sure you wish to remove {self.store.names[self.store.row_of(med_id)]}?")
         msg.setWindowTitle("Confirm delete medication?")
         msg.setStandardButtons(QMessageBox.Yes | QMessageBox.No)
         msg.setDefaultButton(QMessageBox.No)
 
         if msg.exec_() == QMessageBox.Yes:
-            self.medication_list.remove(widget)
-            self.meds_layout.removeWidget(widget)
-            widget.deleteLater()
-            self.save_config()
+            self.engine.remove(self.store.row_of(med_id))
+            self.restart_timer()
 
-    def on_show_reminder(self, medication_name):
+    def on_show_reminder(self, due):
         if self.mute_all:
             return
 
         self.play_notification_sound()
         self.tray_icon.showMessage(
             "Medication Reminder",
-            f"💊 Time to take {medication_name}",
+            rxnag_core.Utils.reminder_message(due),
             QSystemTrayIcon.Information,
             self.notification_shown_secs * 1000
         )
@@ -302,10 +721,25 @@ class RxNag(QWidget):
 
         # Top toolbar
         toolbar_layout = QHBoxLayout()
+        self.profile_combo = QComboBox()
+        self.profile_combo.setToolTip("Profile")
+        self.profile_combo.addItems(self.profiles.names())
+        self.profile_combo.setCurrentText(self.profiles.active)
+        self.profile_combo.currentTextChanged.connect(self.switch_profile)
+        toolbar_layout.addWidget(self.profile_combo, 1)
+
+        self.new_profile_button = QPushButton("New &profile")
+        self.new_profile_button.clicked.connect(self.new_profile)
+        toolbar_layout.addWidget(self.new_profile_button)
+
         self.config_button = QPushButton("&Config")
         self.config_button.clicked.connect(self.show_config_dialog)
         toolbar_layout.addWidget(self.config_button)
 
+        self.report_button = QPushButton("&Report")
+        self.report_button.clicked.connect(self.show_report_dialog)
+        toolbar_layout.addWidget(self.report_button)
+
         self.about_button = QPushButton("A&bout")
         self.about_button.clicked.connect(self.show_about_dialog)
         toolbar_layout.addWidget(self.about_button)
@@ -313,6 +747,7 @@ class RxNag(QWidget):
         self.mute_all_button = QPushButton("&Mute all")
         self.mute_all_button.clicked.connect(self.toggle_mute_all)
         self.mute_all_button.setCheckable(True)
+        self.mute_all_button.setChecked(self.mute_all)
         toolbar_layout.addWidget(self.mute_all_button)
 
         self.exit_button = QPushButton("&Exit")
@@ -331,38 +766,153 @@ class RxNag(QWidget):
         add_layout.addWidget(self.add_button)
         main_layout.addLayout(add_layout)
 
-        # Scrollable area for medications
-        scroll = QScrollArea()
-        scroll.setWidgetResizable(True)
-        scroll.setHorizontalScrollBarPolicy(Qt.ScrollBarAsNeeded)
-        scroll.setVerticalScrollBarPolicy(Qt.ScrollBarAsNeeded)
-
-        # Container widget whose layout will hold all RxNagWidgets
-        self.scroll_container = QWidget()
-        self.meds_layout = QVBoxLayout()
-        self.meds_layout.setContentsMargins(0, 0, 0, 0)
-        self.meds_layout.setSpacing(4)
-        self.scroll_container.setLayout(self.meds_layout)
-        scroll.setWidget(self.scroll_container)
-
-        main_layout.addWidget(scroll, 1)  # stretches to fill available space
-
-        # Store list; don't call removeWidget/removeLater here; we'll manage via meds_layout
-        self.medication_list = []
-
-        # Load existing medications
-        for med in self.config:
-            widget = RxNagWidget(*med, self)
-            self.medication_list.append(widget)
-            self.meds_layout.addWidget(widget)
-
-            # Connect signals (fixed lambda signatures to match emitted args)
-            w = widget
-            w.taken.connect(lambda w=w: self.on_med_taken(w))
-            w.muted_changed.connect(lambda checked, w=w: self.on_med_muted(w, checked))
-            w.edited.connect(lambda w=w: self.on_med_edited(w))
-            w.delete_requested.connect(lambda w=w: self.on_med_delete_requested(w))
-            w.show_reminder.connect(self.on_show_reminder)
+        # Filter row; matches come from an index kept up to date as medications change
+        filter_layout = QHBoxLayout()
+        self.filter_input = QLineEdit()
+        self.filter_input.setPlaceholderText("Filter medications")
+        self.filter_input.setClearButtonEnabled(True)
+        self.filter_input.textChanged.connect(self.on_filter_changed)
+        self.quick_filter_combo = QComboBox()
+        self.quick_filter_combo.setToolTip("Show")
+        for label, quick_filter in MedicationListModel.quick_filters:
+            self.quick_filter_combo.addItem(label, quick_filter)
+        self.quick_filter_combo.currentIndexChanged.connect(self.on_quick_filter_changed)
+        filter_layout.addWidget(self.filter_input, 1)
+        filter_layout.addWidget(self.quick_filter_combo)
+        main_layout.addLayout(filter_layout)
+
+        # The model observes the store that load_config filled
+        self.model = MedicationListModel(self.store, self)
+
+        # Virtualized list; the delegate paints and hit-tests only the rows in view
+        self.meds_view = QListView()
+        self.meds_view.setModel(self.model)
+        self.meds_view.setUniformItemSizes(True)
+        self.meds_view.setSelectionMode(QListView.NoSelection)
+        self.meds_view.setVerticalScrollMode(QListView.ScrollPerPixel)
+        self.meds_view.setSpacing(2)
+        self.meds_delegate = MedicationDelegate(self.meds_view)
+        self.meds_delegate.edit_clicked.connect(self.edit_medication)
+        self.meds_delegate.mute_clicked.connect(self.on_mute_clicked)
+        self.meds_delegate.taken_clicked.connect(self.on_taken_clicked)
+        self.meds_view.setItemDelegate(self.meds_delegate)
+
+        main_layout.addWidget(self.meds_view, 1)  # stretches to fill available space
+        self.ui_built = True
+
+    def on_filter_changed(self, text):
+        self.model.set_filter(text=text)
+
+    def on_quick_filter_changed(self, _):
+        self.model.set_filter(quick_filter=self.quick_filter_combo.currentData())
+
+    def switch_profile(self, name):
+        if not name or name == self.profiles.active:
+            return
+        self.engine = self.profiles.activate(name)
+        self.store = self.engine.store
+        if self.ui_built:
+            self.model.set_store(self.store)
+            if self.profile_combo.currentText() != name:
+                self.profile_combo.setCurrentText(name)
+        self.restart_timer()
+        self.save_config()  # remember the profile in view
+
+    def new_profile(self):
+        name, ok = QInputDialog.getText(self, "New profile", "Profile name:")
+        name = name.strip()
+        if not ok or not name:
+            return
+        existing = self.profiles.find(name)
+        if existing is None:
+            try:
+                self.profiles.create(name)
+            except (ValueError, OSError) as e:
+                QMessageBox.warning(self, "New profile", f"Could not create profile {name}: {e}")
+                return
+            self.profile_combo.blockSignals(True)
+            self.profile_combo.clear()
+            self.profile_combo.addItems(self.profiles.names())
+            self.profile_combo.setCurrentText(self.profiles.active)
+            self.profile_combo.blockSignals(False)
+            existing = name
+        self.switch_profile(existing)
+
+    def start_command_server(self, socket_path):
+        # later launches forward their command line here, see SingleInstance
+        self.command_server = QLocalServer(self)
+        QLocalServer.removeServer(socket_path)  # stale socket, we hold the lock
+        if not self.command_server.listen(socket_path):
+            print(f"rxnag: could not listen on {socket_path}: {self.command_server.errorString()}",
+                  file=sys.stderr)
+            return
+        self.command_server.newConnection.connect(self.on_command_connection)
+
+    def on_command_connection(self):
+        while self.command_server.hasPendingConnections():
+            conn = self.command_server.nextPendingConnection()
+            conn.disconnected.connect(conn.deleteLater)
+            conn.readyRead.connect(lambda conn=conn: self.on_command_ready(conn))
+
+    def on_command_ready(self, conn):
+        if not conn.canReadLine():
+            return
+        try:
+            request = rxnag_core.decode_message(bytes(conn.readLine()))
+            code, message = self.run_command_line([str(arg) for arg in request.get("argv", [])],
+                                                  str(request.get("cwd") or "/"))
+        except (ValueError, TypeError) as e:
+            code, message = 2, f"bad request: {e}"
+        conn.write(rxnag_core.encode_message({"code": code, "message": message}))
+        conn.flush()
+        conn.disconnectFromServer()
+
+    def run_command_line(self, argv, cwd):
+        args, error = rxnag_core.parse_command_line(argv)
+        if error:
+            return error
+        messages = []
+        if args.profile:
+            messages.append(profiler.toggle_cpu(data_dir()))
+        if args.trace_memory:
+            messages.append(profiler.toggle_memory(data_dir()))
+        if not (args.show or args.take or args.report is not None or args.export or args.import_file or args.stats):
+            if messages:
+                return 0, "\n".join(messages)
+            return 1, "RxNag is already running, use --show to raise its window"
+        code, message = self.run_commands(args, cwd)
+        return code, "\n".join(messages + [message] if message else messages)
+
+    def run_commands(self, args, cwd=None):
+        # returns (exit code, message) for the launching command line;
+        # cwd is the launching shell's when the command was forwarded
+        code, messages = self.profiles.take(args.take, args.profile_name)
+        if args.take:
+            self.restart_timer()
+        if args.show:
+            if args.profile_name:
+                name = self.profiles.find(args.profile_name)
+                if name is None:
+                    code = 1
+                    messages.append(f"No profile named {args.profile_name}")
+                else:
+                    self.switch_profile(name)
+            self.show_window()
+        if args.report is not None:
+            import rxnag_report
+            report_code, text = rxnag_report.run_profile(self.profiles, args.profile_name, args.report)
+            code = max(code, report_code)
+            messages.append(text)
+        if args.export or args.import_file:
+            import rxnag_transfer
+            transfer_code, text = rxnag_transfer.run_profile(self.profiles, args, cwd)
+            code = max(code, transfer_code)
+            messages.append(text)
+            if args.import_file:
+                self.restart_timer()
+        if args.stats:
+            messages.append(stats.summary())
+        return code, "\n".join(messages)
 
     def handle_exit(self):
         msg_box = QMessageBox(self)
@@ -386,6 +936,14 @@ class RxNag(QWidget):
         about_dialog = AboutDialog(self)
         about_dialog.exec_()
 
+    def show_report_dialog(self):
+        import rxnag_report
+        code, text = rxnag_report.run_profile(self.profiles, None, "")
+        if code:
+            QMessageBox.warning(self, "Adherence report", text)
+            return
+        ReportDialog(text, self).exec_()
+
     def show_config_dialog(self):
         config_dialog = ConfigDialog(self, self)
         if config_dialog.exec_():
@@ -401,29 +959,53 @@ class RxNag(QWidget):
         show_action.triggered.connect(self.show_window)
         exit_action = QAction("Exit", self)
         exit_action.triggered.connect(self.quit_app)
+        # only shown while Shift is held as the menu opens
+        self.profile_cpu_action = QAction(self)
+        self.profile_cpu_action.triggered.connect(self.toggle_cpu_profile)
+        self.profile_memory_action = QAction(self)
+        self.profile_memory_action.triggered.connect(self.toggle_memory_trace)
         tray_menu.addAction(about_action)
         tray_menu.addAction(show_action)
+        tray_menu.addAction(self.profile_cpu_action)
+        tray_menu.addAction(self.profile_memory_action)
         tray_menu.addAction(exit_action)
+        tray_menu.aboutToShow.connect(self.on_tray_menu_about_to_show)
+        self.on_tray_menu_about_to_show()
         self.tray_icon.setContextMenu(tray_menu)
 
+    def on_tray_menu_about_to_show(self):
+        shift = bool(QApplication.keyboardModifiers() & Qt.ShiftModifier)
+        self.profile_cpu_action.setText("Stop CPU profile and save" if profiler.cpu_running
+                                        else "Start CPU profile")
+        self.profile_memory_action.setText("Stop memory trace and save" if profiler.memory_running
+                                           else "Start memory trace")
+        self.profile_cpu_action.setVisible(shift or profiler.cpu_running)
+        self.profile_memory_action.setVisible(shift or profiler.memory_running)
+
+    def toggle_cpu_profile(self):
+        self.show_profiling_message(profiler.toggle_cpu, "CPU profile")
+
+    def toggle_memory_trace(self):
+        self.show_profiling_message(profiler.toggle_memory, "Memory trace")
+
+    def show_profiling_message(self, toggle, title):
+        self.tray_icon.showMessage(title, toggle(data_dir()), QSystemTrayIcon.Information,
+                                   self.notification_shown_secs * 1000)
+
+    def finish_profiling(self):
+        for message in profiler.finish(data_dir()):
+            print(message)
+
     def add_medication(self, muted=False):
         medication = self.medication_input.text().strip()
         if medication:
-            medication_widget = RxNagWidget(medication, int(time.time()),
-                                            self.medication_interval_default, muted, self)
-            self.medication_list.append(medication_widget)
-            self.meds_layout.addWidget(medication_widget)
-
-            # Connect signals (fixed lambda signatures)
-            w = medication_widget
-            w.taken.connect(lambda w=w: self.on_med_taken(w))
-            w.muted_changed.connect(lambda checked, w=w: self.on_med_muted(w, checked))
-            w.edited.connect(lambda w=w: self.on_med_edited(w))
-            w.delete_requested.connect(lambda w=w: self.on_med_delete_requested(w))
-            w.show_reminder.connect(self.on_show_reminder)
-
+            try:
+                self.engine.add(medication, self.clock.now(), self.medication_interval_default, muted)
+            except StorageUnavailable as e:
+                QMessageBox.warning(self, "Add medication", str(e))
+                return
+            self.restart_timer()
             self.medication_input.clear()
-            self.save_config()
 
     def show_window(self):
         # Used by tray menu "Show"
@@ -448,19 +1030,22 @@ class RxNag(QWidget):
         self.hide()
 
     def quit_app(self):
-        self.save_config()
-        QApplication.instance().quit()
+        # quit even if saving fails, the error is already on stderr
+        try:
+            self.save_config()
+            self.profiles.close()
+            self.sound_player.close()
+            if self.write_stats:
+                stats.write(os.path.join(data_dir(), stats_file_name))
+            if self.clock_watch is not None:
+                self.clock_notifier.setEnabled(False)
+                self.clock_watch.close()
+        finally:
+            QApplication.instance().quit()
 
-    def save_config(self):
+    def collect_settings(self):
         geo = self.geometry()
-        config = {
-            "medications": [
-                {"name": widget.medication,
-                 "last_taken": widget.last_taken,
-                 "interval": widget.interval,
-                 "muted": widget.muted}
-                for widget in self.medication_list
-            ],
+        return {
             "window_geometry": {
                 "x": geo.x(),
                 "y": geo.y(),
@@ -473,54 +1058,52 @@ class RxNag(QWidget):
             "sound_file": self.sound_file,
             "sound_volume": self.sound_volume,
             "start_minimized": self.start_minimized,
+            "write_stats": self.write_stats,
+            "profile": self.profiles.active,
         }
-        os.makedirs(os.path.dirname(self.config_file), exist_ok=True)
-        with open(self.config_file, "w") as f:
-            json.dump(config, f)
+
+    def save_config(self):
+        # settings are kept with the default profile
+        self.profiles.default.save_config()
 
     def load_config(self):
-        try:
-            with open(self.config_file, "r") as f:
-                config = json.load(f)
-            self.config = [
-                (
-                    medication["name"],
-                    medication["last_taken"],
-                    medication["interval"],
-                    medication.get("muted", False)
-                )
-                for medication in config.get("medications", [])
-            ]
-
-            # Restore saved window position/size
-            geo = config.get("window_geometry")
-            if geo and isinstance(geo, dict):
-                self.setGeometry(
-                    geo.get("x", 600),
-                    geo.get("y", 200),
-                    geo.get("w", 1000),
-                    geo.get("h", 700)
-                )
-
-            self.notification_timer_mins = config.get("notification_timer_mins", 5)
-            self.notification_shown_secs = config.get("notification_shown_secs", 10)
-            self.play_sound = config.get("play_sound", True)
-            self.sound_file = config.get("sound_file", default_sound_file)
-            self.sound_volume = config.get("sound_volume", 0.75)
-            self.sound_volume = max(0.0, min(1.0, self.sound_volume))
-            self.start_minimized = config.get("start_minimized", False)
-        except (FileNotFoundError, json.JSONDecodeError, ValueError):
-            self.config = []
-            self.sound_file = default_sound_file
+        config = self.profiles.load()
+
+        # Restore saved window position/size
+        geo = config.get("window_geometry")
+        if geo and isinstance(geo, dict):
+            self.setGeometry(
+                geo.get("x", 600),
+                geo.get("y", 200),
+                geo.get("w", 1000),
+                geo.get("h", 700)
+            )
+
+        self.notification_timer_mins = config.get("notification_timer_mins", 5)
+        self.notification_shown_secs = config.get("notification_shown_secs", 10)
+        self.play_sound = config.get("play_sound", True)
+        self.sound_file = config.get("sound_file", default_sound_file)
+        self.sound_volume = config.get("sound_volume", 0.75)
+        self.sound_volume = max(0.0, min(1.0, self.sound_volume))
+        self.start_minimized = config.get("start_minimized", False)
+        self.write_stats = config.get("write_stats", False)
 
         self.notification_timer_mins = max(1, min(60, self.notification_timer_mins))
         self.notification_shown_secs = max(1, min(60, self.notification_shown_secs))
 
+        self.engine = self.profiles.activate(self.profiles.find(str(config.get("profile", default_profile)))
+                                             or default_profile)
+        self.store = self.engine.store
+
 class EditMedicationDialog(QDialog):
-    def __init__(self, medication, last_taken, interval, muted, parent=None):
+    def __init__(self, medication, last_taken, interval, muted, parent=None, clock=rxnag_core.system_clock,
+                 schedule=""):
         super().__init__(parent)
         self.setWindowTitle("Edit Medication")
         self.was_deleted = False
+        self.last_taken = last_taken
+        self.schedule = None
+        self.clock = clock
 
         layout = QVBoxLayout()
 
@@ -540,6 +1123,12 @@ class EditMedicationDialog(QDialog):
         last_taken_layout.addWidget(self.last_taken_input)
         layout.addLayout(last_taken_layout)
 
+        # shown when Last Taken or Schedule can't be parsed, instead of closing the dialog
+        self.error_label = QLabel()
+        self.error_label.setStyleSheet("color: red")
+        self.error_label.hide()
+        layout.addWidget(self.error_label)
+
         interval_layout = QHBoxLayout()
         interval_label = QLabel("Interval (hours):")
         self.interval_input = QSpinBox()
@@ -550,6 +1139,25 @@ class EditMedicationDialog(QDialog):
         interval_layout.addWidget(self.interval_input)
         layout.addLayout(interval_layout)
 
+        # blank for every interval hours
+        schedule_layout = QHBoxLayout()
+        schedule_label = QLabel("Schedule:")
+        self.schedule_input = QLineEdit(schedule)
+        self.schedule_input.setPlaceholderText("every Interval hours")
+        self.schedule_input.setToolTip(
+            "Leave blank to use the interval, or e.g.\n"
+            "08:00,20:00\n"
+            "weekdays 09:00\n"
+            "mon,wed,fri 08:00\n"
+            "every 36h (or 90m, 2d)\n"
+            "as needed, 4h apart\n"
+            "taper from 2026-11-01 08:00: every 8h for 3d; every 12h for 3d; daily 08:00 for 4d")
+        self.schedule_input.textChanged.connect(lambda text: self.interval_input.setEnabled(not text.strip()))
+        self.interval_input.setEnabled(not schedule)
+        schedule_layout.addWidget(schedule_label)
+        schedule_layout.addWidget(self.schedule_input)
+        layout.addLayout(schedule_layout)
+
         button_layout = QHBoxLayout()
         self.delete_button = QPushButton("Delete")
         self.delete_button.clicked.connect(self.delete)
@@ -565,6 +1173,27 @@ class EditMedicationDialog(QDialog):
 
         self.setLayout(layout)
 
+    def accept(self):
+        if not self.was_deleted:
+            try:
+                self.last_taken = rxnag_core.parse_timestamp(self.last_taken_input.text(), self.clock)
+            except ValueError as e:
+                self.show_error(str(e), self.last_taken_input)
+                return
+            try:
+                text = self.schedule_input.text()
+                self.schedule = parse_schedule(text) if text.strip() else None
+            except ValueError as e:
+                self.show_error(str(e), self.schedule_input)
+                return
+        super().accept()
+
+    def show_error(self, message, field):
+        self.error_label.setText(message)
+        self.error_label.show()
+        field.setFocus()
+        field.selectAll()
+
     def delete(self):
         self.was_deleted = True
         self.accept()
@@ -646,6 +1275,24 @@ class ConfigDialog(QDialog):
         start_minimized_layout.addWidget(self.start_minimized_toggle)
         layout.addLayout(start_minimized_layout)
 
+        # stats file
+        stats_layout = QHBoxLayout()
+        stats_label = QLabel(f"Write wakeup and timing stats to {stats_file_name}: ")
+        self.stats_toggle = QCheckBox("")
+        self.stats_toggle.setChecked(self.parent_widget.write_stats)
+        stats_layout.addWidget(stats_label)
+        stats_layout.addWidget(self.stats_toggle)
+        layout.addLayout(stats_layout)
+
+        # dose history database
+        database_layout = QHBoxLayout()
+        database_label = QLabel("Keep dose history in a database (SQLite), all profiles: ")
+        self.database_toggle = QCheckBox("")
+        self.database_toggle.setChecked(self.parent_widget.profiles.default.storage == "sqlite")
+        database_layout.addWidget(database_label)
+        database_layout.addWidget(self.database_toggle)
+        layout.addLayout(database_layout)
+
         button_layout = QHBoxLayout()
         self.save_button = QPushButton("&Save")
         self.save_button.setDefault(True)
@@ -666,6 +1313,8 @@ class ConfigDialog(QDialog):
             if selected_files:
                 selected_file = selected_files[0]
                 self.parent_widget.sound_file = selected_file
+                if self.parent_widget.audio_available:
+                    self.parent_widget.sound_player.preload(selected_file)  # decoded before it's needed
                 self.sound_file_label.setText(os.path.basename(selected_file))
 
     def toggle_play_sound(self):
@@ -675,16 +1324,20 @@ class ConfigDialog(QDialog):
         self.parent_widget.start_minimized = not self.parent_widget.start_minimized
 
     def adjust_volume_feedback(self):
-        self.parent_widget.play_notification_sound()
-        self.parent_widget.has_played_audio = False
+        self.parent_widget.play_notification_sound(again=True)
 
     def update_volume(self):
         self.parent_widget.sound_volume = self.volume_slider.value() / 100.0
+        self.parent_widget.sound_player.set_volume(self.parent_widget.sound_volume)
 
     def save_and_update(self):
         self.parent_widget.notification_timer_mins = self.notification_timer_mins_input.value()
         self.parent_widget.notification_shown_secs = self.notification_shown_secs_input.value()
         self.update_volume()
+        self.parent_widget.write_stats = self.stats_toggle.isChecked()
+        errors = self.parent_widget.profiles.set_storage("sqlite" if self.database_toggle.isChecked() else "json")
+        if errors:
+            QMessageBox.warning(self, "Database", "\n".join(errors))
         self.parent_widget.restart_timer()
         self.parent_widget.save_config()
         self.accept()
@@ -713,47 +1366,50 @@ class AboutDialog(QDialog):
         layout.addLayout(button_layout)
         self.setLayout(layout)
 
-def single_instance_check():
-    if os.path.isfile(pidfile):
-        with open(pidfile, "r") as f:
-            running_pid = f.read().strip()
-        if running_pid and os.path.exists("/proc/" + running_pid):
-            print(f"Another instance of the script is already running with PID {running_pid}")
-            exit(1)
+class ReportDialog(QDialog):
+    def __init__(self, text, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("Adherence Report")
+        self.resize(760, 520)
 
-    with open(pidfile, "w") as f:
-        f.write(pid)
+        layout = QVBoxLayout()
+        self.text = QPlainTextEdit(text)
+        self.text.setReadOnly(True)
+        self.text.setLineWrapMode(QPlainTextEdit.NoWrap)
+        self.text.setFont(QFontDatabase.systemFont(QFontDatabase.FixedFont))
+        layout.addWidget(self.text)
 
-    def cleanup_pid():
-        try:
-            os.remove(pidfile)
-        except FileNotFoundError:
-            pass
-    atexit.register(cleanup_pid)
+        button_layout = QHBoxLayout()
+        self.ok_button = QPushButton("OK")
+        self.ok_button.clicked.connect(self.accept)
+        button_layout.addWidget(self.ok_button)
+        layout.addLayout(button_layout)
+        self.setLayout(layout)
 
 def get_script_path():
     return os.path.dirname(os.path.realpath(__file__))
 
 if __name__ == "__main__":
-    single_instance_check()
-    argparser = argparse.ArgumentParser()
-    argparser.add_argument("--minimized", action="store_true")
-    argparser.add_argument("--show", action="store_true")
-    args = argparser.parse_args()
-
-    audio_available = False
-    try:
-        pygame.mixer.init()
-        audio_available = True
-    except Exception:
-        audio_available = False
+    startup_profile.mark("imports")
 
     app = QApplication([])
     app.setQuitOnLastWindowClosed(False)
-    reminder = RxNag(audio_available)
+    startup_profile.mark("qapplication")
+    reminder = RxNag()
+    reminder.start_command_server(instance.socket_path)
+    code, message = reminder.run_commands(args)
+    if message:
+        print(message, file=sys.stderr if code else sys.stdout)
 
     # if not set to minimize, show the main window
     if args.show or (not args.minimized and not reminder.start_minimized):
         reminder.show()
+        startup_profile.mark("window show")
+
+    if args.startup_profile:
+        def print_startup_profile():
+            startup_profile.mark("first event loop")
+            print(startup_profile.report(), flush=True)
+        QTimer.singleShot(0, print_startup_profile)
 
     app.exec_()
@@ -0,0 +1,1805 @@
+# rxnag - Medication reminder app
+# Copyright (c) 2024-2026 Solorvox solorvox (at) epic.geek.nz
+# Source: https://github.com/solorvox/rxnag
+# License: GPL-3 https://www.gnu.org/licenses/gpl-3.0.txt
+#
+# Qt-free core: medication state, due-time math, the deadline scheduler,
+# persistence and the command line shared by the GUI and headless mode.
+# The GUI observes a MedicationStore; nothing in here needs a display.
+import io
+import os
+import sys
+import json
+import argparse
+import bisect
+import contextlib
+import time
+import datetime
+import fcntl
+import heapq
+import socket
+import stat
+import struct
+import itertools
+import sqlite3
+import tempfile
+import threading
+from array import array
+from collections import OrderedDict, defaultdict
+from rxnag_schedule import parse_schedule
+
+# store change notifications, sent to observers as (event, row)
+ABOUT_TO_INSERT = "about_to_insert"
+INSERTED = "inserted"
+ABOUT_TO_REMOVE = "about_to_remove"
+REMOVED = "removed"
+CHANGED = "changed"
+ABOUT_TO_RESET = "about_to_reset"
+RESET = "reset"
+
+# journal operations, one fixed-size record each
+OP_TAKEN = 1        # value: time taken
+OP_MUTED = 2        # value: 0 or 1
+OP_LAST_TAKEN = 3   # value: edited last taken time
+OP_INTERVAL = 4     # value: hours
+
+max_timer_secs = 24 * 3600  # timers are int ms, re-check at least daily
+journal_compact_records = 256  # rewrite the config snapshot after this many journal records
+default_profile = "default"  # lives directly in the data dir, as before profiles existed
+max_loaded_profiles = 8  # profiles kept in memory besides the ones in view
+# without ClockChangeWatch, how often to look for clock jumps while a deadline
+# is pending; about as often as the default nag, nothing else wakes for it
+clock_check_secs = 300
+never_due = 2 ** 62  # next_due of as-needed medications and finished tapers
+database_retry_secs = 60  # how often a profile whose rxnag.db won't open tries it again
+
+# seq, medication id, op, value
+JOURNAL_RECORD = struct.Struct("<QIB3xq")
+# seq, medication id, taken at
+HISTORY_RECORD = struct.Struct("<QI4xq")
+
+class StorageUnavailable(OSError):
+    # a profile's rxnag.db couldn't be opened; it takes no changes until it can
+    pass
+
+class SystemClock:
+    # Wall-clock time source.  Everything that asks what time it is goes
+    # through a clock, so simulations and benchmarks can run on SimulatedClock.
+    def time(self) -> float:
+        return time.time()
+
+    def now(self) -> int:
+        return int(self.time())
+
+    def monotonic(self) -> float:
+        # stops while suspended and ignores clock changes, like Qt's timers
+        return time.monotonic()
+
+class SimulatedClock(SystemClock):
+    # only moves when told to; set() steps the wall clock like date -s would,
+    # advance() is time actually passing
+    def __init__(self, start=None):
+        self._time = time.time() if start is None else float(start)
+        self._monotonic = 0.0
+
+    def time(self) -> float:
+        return self._time
+
+    def monotonic(self) -> float:
+        return self._monotonic
+
+    def advance(self, seconds: float):
+        self._time += seconds
+        self._monotonic += seconds
+
+    def set(self, when: float):
+        self._time = float(when)
+
+system_clock = SystemClock()
+
+class ClockJumpDetector:
+    # Timers count monotonic time, deadlines are wall clock times.  Wall time
+    # passing without monotonic time (a suspend) or the other way round (the
+    # clock stepped back) is a jump, and timers armed before it are wrong.
+    def __init__(self, clock: SystemClock = system_clock, tolerance: float = 2.0):
+        self.clock = clock
+        self.tolerance = tolerance
+        self._wall = clock.time()
+        self._monotonic = clock.monotonic()
+
+    def check(self) -> float:
+        # seconds the wall clock jumped since the last check, 0 if it didn't
+        wall, monotonic = self.clock.time(), self.clock.monotonic()
+        jump = (wall - self._wall) - (monotonic - self._monotonic)
+        self._wall, self._monotonic = wall, monotonic
+        return jump if abs(jump) > self.tolerance else 0.0
+
+class ClockChangeWatch:
+    # Linux timerfd on CLOCK_REALTIME with TFD_TIMER_CANCEL_ON_SET: its fd turns
+    # readable when the clock is set (NTP step, date -s) or the machine
+    # resumes, so a front end can watch it instead of polling.  open() returns
+    # None where there is no timerfd; use clock_check_secs polling then.
+    CLOCK_REALTIME = 0
+    TFD_TIMER_ABSTIME = 1
+    TFD_TIMER_CANCEL_ON_SET = 2
+
+    def __init__(self):
+        import ctypes
+        self._libc = ctypes.CDLL(None, use_errno=True)
+        self._itimerspec = ctypes.c_long * 4  # interval and value, each seconds and nanoseconds
+        self.fd = self._libc.timerfd_create(self.CLOCK_REALTIME, os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "timerfd_create failed")
+
+    @classmethod
+    def open(cls):
+        if not sys.platform.startswith("linux"):
+            return None
+        try:
+            watch = cls()
+        except (OSError, AttributeError):
+            return None
+        try:
+            watch.arm()
+        except OSError:
+            watch.close()
+            return None
+        return watch
+
+    def fileno(self) -> int:
+        return self.fd
+
+    def arm(self):
+        # a year out, absolute; only the cancellation matters
+        spec = self._itimerspec(0, 0, int(time.time()) + 365 * 86400, 0)
+        if self._libc.timerfd_settime(self.fd, self.TFD_TIMER_ABSTIME | self.TFD_TIMER_CANCEL_ON_SET,
+                                      spec, None) < 0:
+            import ctypes
+            raise OSError(ctypes.get_errno(), "timerfd_settime failed")
+
+    def acknowledge(self):
+        # the read fails with ECANCELED after a clock change; re-arm either way
+        try:
+            os.read(self.fd, 8)
+        except OSError:
+            pass
+        self.arm()
+
+    def close(self):
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+# tried in order after fromisoformat, before falling back to dateutil
+timestamp_formats = ("%Y/%m/%d %H:%M", "%Y/%m/%d %H:%M:%S", "%d.%m.%Y %H:%M", "%Y%m%d %H%M")
+time_of_day_formats = ("%H:%M", "%H:%M:%S")
+
+def parse_timestamp(text: str, clock: SystemClock = system_clock) -> int:
+    # local date/time text to epoch seconds, ValueError if it can't be read.
+    # The edit dialog's own "%Y-%m-%d %H:%M" is ISO and never reaches dateutil.
+    text = text.strip()
+    if not text:
+        raise ValueError("no date or time given")
+    try:
+        try:
+            return int(datetime.datetime.fromisoformat(text).timestamp())
+        except ValueError:
+            pass
+        for fmt in timestamp_formats:
+            try:
+                return int(datetime.datetime.strptime(text, fmt).timestamp())
+            except ValueError:
+                pass
+        for fmt in time_of_day_formats:
+            try:
+                parsed = datetime.datetime.strptime(text, fmt).time()
+            except ValueError:
+                continue
+            today = datetime.datetime.fromtimestamp(clock.time()).date()
+            return int(datetime.datetime.combine(today, parsed).timestamp())
+        try:
+            from dateutil import parser  # free-form input only
+        except ImportError:
+            raise ValueError("dateutil is not installed") from None
+        return int(parser.parse(text).timestamp())
+    except (ValueError, OverflowError, OSError) as e:
+        raise ValueError(f"unrecognized date/time \"{text}\", use YYYY-MM-DD HH:MM") from e
+
+class Utils:
+    @staticmethod
+    def format_time(seconds: int) -> str:
+        if seconds < 0:
+            return "0 Seconds"
+        days, rem = divmod(seconds, 86400)
+        hours, rem = divmod(rem, 3600)
+        minutes, secs = divmod(rem, 60)
+        parts = []
+        if days: parts.append(f"{days} {'Day' if days == 1 else 'Days'}")
+        if hours: parts.append(f"{hours} {'Hour' if hours == 1 else 'Hours'}")
+        if minutes and not days: parts.append(f"{minutes} {'Minute' if minutes == 1 else 'Minutes'}")
+        if secs and not (days or hours or minutes):
+            parts.append(f"{secs} Seconds")
+        return ", ".join(parts) if parts else "0 Seconds"
+
+    @staticmethod
+    def join_names(names: list, limit: int = 3) -> str:
+        # "A", "A and B", "A, B and C", "A, B and 8 more"
+        if len(names) > limit:
+            return f"{', '.join(names[:limit - 1])} and {len(names) - limit + 1} more"
+        if len(names) > 1:
+            return f"{', '.join(names[:-1])} and {names[-1]}"
+        return names[0] if names else ""
+
+    @staticmethod
+    def reminder_message(due: list, limit: int = 3) -> str:
+        # due is [(profile, names)]; profiles are only named when it matters
+        if len(due) == 1 and due[0][0] == default_profile:
+            return f"💊 Time to take {Utils.join_names(due[0][1])}"
+        lines = [f"💊 {profile}: {Utils.join_names(names)}" for profile, names in due[:limit]]
+        if len(due) > limit:
+            lines.append(f"and {len(due) - limit} more profiles")
+        return "\n".join(lines)
+
+def read_schedule(spec):
+    # stored schedule text to a rule; one that no longer parses falls back to
+    # the interval rather than losing the medication
+    if not spec:
+        return None
+    try:
+        return parse_schedule(spec)
+    except ValueError as e:
+        print(f"rxnag: {e}, using the interval instead", file=sys.stderr)
+        return None
+
+_unchanged = object()
+
+class MedicationStore:
+    # Column store: one typed array per field instead of an object per
+    # medication.  Rows shift on removal; ids are stable and are what the
+    # scheduler and the on-disk formats refer to.  A medication with a
+    # schedule rule is due by that rule, otherwise every interval hours.
+    __slots__ = ("ids", "names", "last_taken", "intervals", "muted", "schedules", "due", "clock",
+                 "_rows", "_next_id", "_observers", "_bulk")
+
+    def __init__(self, clock: SystemClock = system_clock):
+        self.ids = array('q')
+        self.names = []
+        self.last_taken = array('q')  # in seconds since epoch
+        self.intervals = array('l')  # in hours
+        self.muted = bytearray()
+        self.schedules = []  # rxnag_schedule rule or None
+        self.due = bytearray()  # due state as of the last update or refresh_due
+        self.clock = clock
+        self._rows = {}  # id -> row
+        self._next_id = 1
+        self._observers = []
+        self._bulk = False
+
+    def __len__(self):
+        return len(self.ids)
+
+    def subscribe(self, callback):
+        self._observers.append(callback)
+
+    def unsubscribe(self, callback):
+        self._observers.remove(callback)
+
+    def _notify(self, event, row=-1):
+        if self._bulk:
+            return
+        for callback in self._observers:
+            callback(event, row)
+
+    @contextlib.contextmanager
+    def bulk(self):
+        # many changes, observers hear one reset instead of a signal per row
+        self._notify(ABOUT_TO_RESET)
+        self._bulk = True
+        try:
+            yield self
+        finally:
+            self._bulk = False
+            self._notify(RESET)
+
+    @property
+    def next_id(self) -> int:
+        return self._next_id
+
+    def load(self, records, next_id: int = 1):
+        # records are (name, last_taken, interval, muted[, id[, schedule]])
+        # tuples; next_id keeps ids of deleted medications from being handed
+        # out again
+        self._notify(ABOUT_TO_RESET)
+        self.ids = array('q')
+        self.names = []
+        self.last_taken = array('q')
+        self.intervals = array('l')
+        self.muted = bytearray()
+        self.schedules = []
+        self.due = bytearray()
+        self._rows = {}
+        self._next_id = max(1, int(next_id))
+        for record in records:
+            self._append(*record)
+        self._notify(RESET)
+
+    def apply(self, med_id: int, op: int, value: int) -> bool:
+        # apply a journal operation; records for deleted medications are ignored
+        row = self._rows.get(med_id)
+        if row is None:
+            return False
+        if op in (OP_TAKEN, OP_LAST_TAKEN):
+            self.update(row, last_taken=value)
+        elif op == OP_MUTED:
+            self.update(row, muted=bool(value))
+        elif op == OP_INTERVAL:
+            self.update(row, interval=value)
+        else:
+            return False
+        return True
+
+    def _append(self, name, last_taken, interval, muted=False, med_id=None, schedule=None):
+        if med_id is None or med_id in self._rows:
+            med_id = self._next_id
+        self._next_id = max(self._next_id, med_id + 1)
+        row = len(self.ids)
+        self.ids.append(med_id)
+        self.names.append(name)
+        self.last_taken.append(int(last_taken))
+        self.intervals.append(int(interval))
+        self.muted.append(1 if muted else 0)
+        self.schedules.append(read_schedule(schedule) if isinstance(schedule, str) else schedule)
+        self.due.append(1 if self.clock.now() >= self.next_due(row) else 0)
+        self._rows[med_id] = row
+        return row
+
+    def add(self, name: str, last_taken: int, interval: int, muted: bool = False, med_id=None,
+            schedule=None) -> int:
+        row = len(self.ids)
+        self._notify(ABOUT_TO_INSERT, row)
+        self._append(name, last_taken, interval, muted, med_id, schedule)
+        self._notify(INSERTED, row)
+        return row
+
+    def remove(self, row: int):
+        self._notify(ABOUT_TO_REMOVE, row)
+        del self._rows[self.ids[row]]
+        del self.ids[row]
+        del self.names[row]
+        del self.last_taken[row]
+        del self.intervals[row]
+        del self.muted[row]
+        del self.schedules[row]
+        del self.due[row]
+        for later in range(row, len(self.ids)):
+            self._rows[self.ids[later]] = later
+        self._notify(REMOVED, row)
+
+    def update(self, row: int, name=None, last_taken=None, interval=None, muted=None, schedule=_unchanged):
+        # schedule=None drops back to the interval
+        if name is not None:
+            self.names[row] = name
+        if last_taken is not None:
+            self.last_taken[row] = int(last_taken)
+        if interval is not None:
+            self.intervals[row] = int(interval)
+        if muted is not None:
+            self.muted[row] = 1 if muted else 0
+        if schedule is not _unchanged:
+            self.schedules[row] = schedule
+        self.due[row] = 1 if self.clock.now() >= self.next_due(row) else 0
+        self._notify(CHANGED, row)
+
+    def refresh_due(self, row: int, now: int) -> bool:
+        # observers only hear about due/not-due transitions
+        due = 1 if now >= self.next_due(row) else 0
+        if due == self.due[row]:
+            return False
+        self.due[row] = due
+        self._notify(CHANGED, row)
+        return True
+
+    def row_of(self, med_id: int) -> int:
+        return self._rows[med_id]
+
+    def is_muted(self, row: int) -> bool:
+        return bool(self.muted[row])
+
+    def next_due(self, row: int) -> int:
+        schedule = self.schedules[row]
+        if schedule is None:
+            return self.last_taken[row] + (self.intervals[row] * 3600)
+        due = schedule.next_due(self.last_taken[row])
+        return never_due if due is None else due
+
+    def following_due(self, row: int, due: int) -> int:
+        # the dose after one taken right on time at due
+        schedule = self.schedules[row]
+        if schedule is None:
+            return due + self.intervals[row] * 3600
+        due = schedule.next_due(due)
+        return never_due if due is None else due
+
+    def schedule_text(self, row: int) -> str:
+        schedule = self.schedules[row]
+        return "" if schedule is None else str(schedule)
+
+    def is_due(self, row: int, now: int) -> bool:
+        return now >= self.next_due(row)
+
+    def reminder_time(self, row: int, now: int):
+        # when the scheduler should next look at this row, None if never
+        next_due = self.next_due(row)
+        if next_due == never_due:
+            return None
+        if self.muted[row] and next_due <= now:
+            return None  # already due, nothing to nag about until unmuted
+        return max(next_due, now)
+
+    def last_taken_text(self, row: int, now: int) -> str:
+        last_taken = self.last_taken[row]
+        if last_taken > 0:
+            return f"Last taken: {Utils.format_time(now - last_taken)} ago"
+        else:
+            return "Last taken: Never"
+
+    def next_dose_text(self, row: int, now: int) -> str:
+        schedule = self.schedules[row]
+        if schedule is not None and schedule.as_needed:
+            allowed_secs = schedule.allowed_at(self.last_taken[row]) - now
+            if allowed_secs <= 0:
+                return "As needed: allowed now"
+            return f"As needed: allowed in {Utils.format_time(allowed_secs)}"
+        next_due = self.next_due(row)
+        if next_due == never_due:
+            return "Next dose: schedule finished"
+        next_dose_secs = next_due - now
+        if next_dose_secs <= 0:
+            return "Next dose: now"
+        else:
+            return f"Next dose: {Utils.format_time(next_dose_secs)}"
+
+    def to_records(self) -> list:
+        return self.snapshot().to_records()
+
+    def snapshot(self) -> "StoreSnapshot":
+        return StoreSnapshot(self)
+
+class StoreSnapshot:
+    # Frozen copy of the store columns.  Copying arrays is a memcpy, so this
+    # is cheap to take on the GUI thread; building records is left to the
+    # thread that serializes it.
+    __slots__ = ("ids", "names", "last_taken", "intervals", "muted", "schedules", "next_id")
+
+    def __init__(self, store: MedicationStore):
+        self.next_id = store.next_id
+        self.ids = array('q', store.ids)
+        self.names = list(store.names)
+        self.last_taken = array('q', store.last_taken)
+        self.intervals = array('l', store.intervals)
+        self.muted = bytes(store.muted)
+        self.schedules = list(store.schedules)  # rules are immutable
+
+    def schedule_texts(self):
+        return (None if schedule is None else str(schedule) for schedule in self.schedules)
+
+    def to_records(self) -> list:
+        records = [
+            {"id": self.ids[row],
+             "name": self.names[row],
+             "last_taken": self.last_taken[row],
+             "interval": self.intervals[row],
+             "muted": bool(self.muted[row])}
+            for row in range(len(self.ids))
+        ]
+        for record, schedule in zip(records, self.schedule_texts()):
+            if schedule is not None:
+                record["schedule"] = schedule
+        return records
+
+class MedicationIndex:
+    # Search index over one store for the filter box, kept in step by feeding
+    # it the store's observer events: folded names, trigrams of them for
+    # substring search, and sorted (next_due, id) pairs for the due-time quick
+    # filters.  All keyed by id.  Every query matches anywhere in the name;
+    # 1-2 letter ones have no trigram and scan the names.  The trigrams are
+    # the costly part and wait for the first long query.
+    def __init__(self, store: MedicationStore):
+        self.store = store
+        self.rebuild()
+
+    @staticmethod
+    def fold(text: str) -> str:
+        return text.strip().casefold()
+
+    @staticmethod
+    def trigrams(text: str) -> set:
+        return {text[i:i + 3] for i in range(len(text) - 2)}
+
+    def rebuild(self):
+        self._names = {}  # id -> folded name
+        self._trigrams = None  # trigram -> set of ids
+        self._due_times = []  # (next_due, id)
+        self._due_of = {}  # id -> next_due
+        self._muted = set()
+        self._last = None  # (query, ids) of the last search, narrowed while typing
+        for row in range(len(self.store)):
+            self._add_name(row)
+            self._add_due(row, False)
+        self._due_times.sort()
+
+    def _add_name(self, row: int):
+        med_id = self.store.ids[row]
+        name = self.fold(self.store.names[row])
+        self._names[med_id] = name
+        if self._trigrams is not None:
+            for gram in self.trigrams(name):
+                self._trigrams[gram].add(med_id)
+
+    def _discard_name(self, med_id: int):
+        name = self._names.pop(med_id)
+        if self._trigrams is not None:
+            for gram in self.trigrams(name):
+                ids = self._trigrams[gram]
+                ids.discard(med_id)
+                if not ids:
+                    del self._trigrams[gram]
+
+    def _add_due(self, row: int, keep_sorted: bool = True):
+        med_id = self.store.ids[row]
+        next_due = self.store.next_due(row)
+        self._due_of[med_id] = next_due
+        if keep_sorted:
+            bisect.insort(self._due_times, (next_due, med_id))
+        else:
+            self._due_times.append((next_due, med_id))
+        if self.store.muted[row]:
+            self._muted.add(med_id)
+        else:
+            self._muted.discard(med_id)
+
+    def _discard_due(self, med_id: int):
+        next_due = self._due_of.pop(med_id)
+        del self._due_times[bisect.bisect_left(self._due_times, (next_due, med_id))]
+        self._muted.discard(med_id)
+
+    def on_store_changed(self, event, row):
+        self._last = None
+        if event == RESET:
+            self.rebuild()
+            return
+        if event not in (INSERTED, ABOUT_TO_REMOVE, CHANGED):
+            return
+        med_id = self.store.ids[row]
+        if event == INSERTED:
+            self._add_name(row)
+            self._add_due(row)
+        elif event == ABOUT_TO_REMOVE:
+            self._discard_name(med_id)
+            self._discard_due(med_id)
+        else:
+            # only the parts that changed are reindexed
+            if self._names[med_id] != self.fold(self.store.names[row]):
+                self._discard_name(med_id)
+                self._add_name(row)
+            if self._due_of[med_id] != self.store.next_due(row) or \
+                    (med_id in self._muted) != bool(self.store.muted[row]):
+                self._discard_due(med_id)
+                self._add_due(row)
+
+    def matches(self, query: str, med_id: int) -> bool:
+        # query already folded
+        return query in self._names[med_id]
+
+    def search(self, text: str) -> set:
+        query = self.fold(text)
+        last = self._last
+        if last is not None and last[0] in query:
+            # typing on: the new matches are among the last ones
+            ids = {med_id for med_id in last[1] if query in self._names[med_id]}
+        elif len(query) >= 3:
+            if self._trigrams is None:
+                self._trigrams = defaultdict(set)
+                for med_id, name in self._names.items():
+                    for gram in self.trigrams(name):
+                        self._trigrams[gram].add(med_id)
+            candidates = sorted((self._trigrams.get(gram, ()) for gram in self.trigrams(query)), key=len)
+            ids = set(candidates[0]).intersection(*candidates[1:])
+            ids = {med_id for med_id in ids if query in self._names[med_id]}  # trigrams in order
+        else:
+            ids = {med_id for med_id, name in self._names.items() if query in name}
+        self._last = (query, ids)
+        return ids
+
+    def due_by(self, when: int) -> set:
+        position = bisect.bisect_right(self._due_times, (when, float("inf")))
+        return {med_id for _, med_id in self._due_times[:position]}
+
+    def muted(self) -> set:
+        return set(self._muted)
+
+def dump_config(config: dict) -> bytes:
+    def encode(obj):
+        if isinstance(obj, StoreSnapshot):
+            return obj.to_records()
+        raise TypeError(f"{type(obj).__name__} is not JSON serializable")
+    return json.dumps(config, default=encode).encode("utf-8")
+
+def atomic_write(path: str, data: bytes):
+    # write a sibling temp file, fsync it, then rename over the original so a
+    # crash leaves either the old or the new file, never a torn one
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix="." + os.path.basename(path) + ".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except FileNotFoundError:
+            pass
+        raise
+    try:
+        dir_fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(dir_fd)
+    except OSError:
+        pass
+    finally:
+        os.close(dir_fd)
+
+class WriteBehindSaver:
+    # Coalesces config snapshots submitted within `delay` seconds into a single
+    # write.  Serialization and the atomic write happen on a background
+    # thread; flush() writes anything pending synchronously on the caller.
+    # request_sync() has sync() run the same way, so journal appends made
+    # within `delay` of each other share one fsync.
+    def __init__(self, path: str, delay: float = 0.5, serialize=dump_config, after_write=None, on_save=None,
+                 sync=None):
+        self.path = path
+        self.delay = delay
+        self.serialize = serialize
+        self.after_write = after_write  # called with the snapshot once it is on disk
+        self.on_save = on_save  # called with (seconds, bytes) after each write, for --stats
+        self.sync = sync
+        self._cond = threading.Condition()
+        self._write_lock = threading.Lock()  # keeps writes in submission order
+        self._pending = None
+        self._sync_wanted = False
+        self._deadline = None
+        self._closed = False
+        self._thread = None
+
+    def submit(self, snapshot):
+        with self._cond:
+            self._pending = snapshot
+            self._wake()
+
+    def request_sync(self):
+        with self._cond:
+            self._sync_wanted = True
+            self._wake()
+
+    def _wake(self):
+        # caller holds self._cond
+        if self._deadline is None:
+            self._deadline = time.monotonic() + self.delay
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="rxnag-saver", daemon=True)
+            self._thread.start()
+        self._cond.notify()
+
+    def _take_pending(self):
+        with self._cond:
+            snapshot, self._pending, self._deadline = self._pending, None, None
+            sync_wanted, self._sync_wanted = self._sync_wanted, False
+        if sync_wanted and self.sync is not None:
+            try:
+                self.sync()
+            except OSError as e:
+                print(f"rxnag: could not sync the journal: {e}", file=sys.stderr)
+                with self._cond:
+                    self._sync_wanted = True  # retried with the next write
+        return snapshot
+
+    def _write(self, snapshot):
+        try:
+            began = time.perf_counter()
+            data = self.serialize(snapshot)
+            atomic_write(self.path, data)
+            if self.on_save is not None:
+                self.on_save(time.perf_counter() - began, len(data))
+            if self.after_write is not None:
+                self.after_write(snapshot)
+        except (OSError, TypeError, ValueError, sqlite3.Error) as e:
+            print(f"rxnag: could not save {self.path}: {e}", file=sys.stderr)
+            # retried by the next submit or flush, unless a newer snapshot
+            # already replaced it
+            with self._cond:
+                if self._pending is None:
+                    self._pending = snapshot
+
+    def _run(self):
+        while True:
+            with self._cond:
+                # a snapshot put back after a failed write waits for a submit
+                while self._deadline is None and not self._closed:
+                    self._cond.wait()
+                if self._closed:
+                    return
+                while self._deadline is not None and time.monotonic() < self._deadline:
+                    self._cond.wait(self._deadline - time.monotonic())
+            with self._write_lock:
+                snapshot = self._take_pending()
+                if snapshot is not None:
+                    self._write(snapshot)
+
+    def flush(self) -> bool:
+        # True if everything submitted is now on disk
+        with self._write_lock:
+            snapshot = self._take_pending()
+            if snapshot is not None:
+                self._write(snapshot)
+            with self._cond:
+                return self._pending is None
+
+    def close(self):
+        self.flush()
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+
+def read_records(path: str, record: struct.Struct) -> list:
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+    except FileNotFoundError:
+        return []
+    # a torn record at the end from a crash mid-append is ignored
+    usable = len(data) - len(data) % record.size
+    return list(record.iter_unpack(memoryview(data)[:usable]))
+
+def iter_records(path: str, record: struct.Struct, chunk_records: int = 4096):
+    # like read_records, a chunk at a time
+    try:
+        f = open(path, "rb")
+    except FileNotFoundError:
+        return
+    with f:
+        while True:
+            data = f.read(record.size * chunk_records)
+            usable = len(data) - len(data) % record.size
+            yield from record.iter_unpack(memoryview(data)[:usable])
+            if len(data) < record.size * chunk_records:
+                return
+
+class DoseHistoryFile:
+    # Append-only file of fixed-size (seq, medication id, taken at) records.
+    def __init__(self, path: str):
+        self.path = path
+
+    def last_seq(self) -> int:
+        # the last record has the highest seq: compaction and imports (which
+        # wait for an empty journal) both append in seq order
+        try:
+            with open(self.path, "rb") as f:
+                size = f.seek(0, os.SEEK_END)
+                size -= size % HISTORY_RECORD.size
+                if size == 0:
+                    return 0
+                f.seek(size - HISTORY_RECORD.size)
+                return HISTORY_RECORD.unpack(f.read(HISTORY_RECORD.size))[0]
+        except FileNotFoundError:
+            return 0
+
+    def archive(self, doses: list):
+        # doses are (seq, med_id, taken_at); anything already archived by an
+        # interrupted compaction is skipped
+        if not doses:
+            return
+        seqs = {dose[0] for dose in doses}
+        archived = {record[0] for record in self.iter_all() if record[0] in seqs}
+        data = b"".join(HISTORY_RECORD.pack(*dose) for dose in doses if dose[0] not in archived)
+        if not data:
+            return
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with open(self.path, "ab") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+
+    def read_all(self) -> list:
+        return read_records(self.path, HISTORY_RECORD)
+
+    def iter_all(self):
+        return iter_records(self.path, HISTORY_RECORD)
+
+    def doses(self, med_id: int, since: int = 0, until=None) -> list:
+        return [taken_at for seq, dose_id, taken_at in self.read_all()
+                if dose_id == med_id and taken_at >= since and (until is None or taken_at < until)]
+
+class DoseSet:
+    # Which (medication id, taken at) pairs a dose history already holds, at
+    # 8 bytes a dose: the pairs packed into one sorted array, plus a set for
+    # the ones added since.  Times are kept modulo 2**40 seconds.
+    def __init__(self, doses):
+        self._keys = array('q', sorted(self.key(med_id, taken_at) for seq, med_id, taken_at in doses))
+        self._added = set()
+
+    @staticmethod
+    def key(med_id: int, taken_at: int) -> int:
+        return (med_id << 40) | (taken_at & (2 ** 40 - 1))
+
+    def add(self, med_id: int, taken_at: int) -> bool:
+        # False if the dose was already there
+        key = self.key(med_id, taken_at)
+        index = bisect.bisect_left(self._keys, key)
+        if (index < len(self._keys) and self._keys[index] == key) or key in self._added:
+            return False
+        self._added.add(key)
+        return True
+
+class DoseDatabase:
+    # Optional SQLite backend: medications plus the full dose history, indexed
+    # for range queries.  Writes come from the saver thread in one batched
+    # transaction per snapshot.
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS medications (
+            id INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            last_taken INTEGER NOT NULL,
+            interval INTEGER NOT NULL,
+            muted INTEGER NOT NULL DEFAULT 0,
+            row INTEGER NOT NULL,
+            schedule TEXT
+        );
+        CREATE TABLE IF NOT EXISTS doses (
+            seq INTEGER PRIMARY KEY,
+            medication_id INTEGER NOT NULL,
+            taken_at INTEGER NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS doses_medication_taken ON doses (medication_id, taken_at);
+        CREATE TABLE IF NOT EXISTS meta (
+            key TEXT PRIMARY KEY,
+            value INTEGER NOT NULL
+        );
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(self.SCHEMA)
+        columns = [column[1] for column in self._conn.execute("PRAGMA table_info(medications)")]
+        if "schedule" not in columns:  # databases from before schedules
+            self._conn.execute("ALTER TABLE medications ADD COLUMN schedule TEXT")
+
+    def load(self):
+        # (records, next_id, journal_seq), or None if no snapshot was ever stored
+        with self._lock:
+            meta = dict(self._conn.execute("SELECT key, value FROM meta"))
+            if "journal_seq" not in meta:
+                return None
+            records = self._conn.execute(
+                "SELECT name, last_taken, interval, muted, id, schedule FROM medications ORDER BY row").fetchall()
+        return records, meta.get("next_id", 1), meta["journal_seq"]
+
+    def write(self, snapshot: StoreSnapshot, journal_seq: int, doses: list):
+        with self._lock:
+            conn = self._conn
+            conn.execute("BEGIN")
+            try:
+                conn.execute("DELETE FROM medications")
+                conn.executemany(
+                    "INSERT INTO medications (id, name, last_taken, interval, muted, row, schedule)"
+                    " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    zip(snapshot.ids, snapshot.names, snapshot.last_taken, snapshot.intervals,
+                        snapshot.muted, range(len(snapshot.ids)), snapshot.schedule_texts()))
+                conn.executemany("INSERT OR IGNORE INTO doses (seq, medication_id, taken_at) VALUES (?, ?, ?)", doses)
+                conn.executemany("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+                                 (("next_id", snapshot.next_id), ("journal_seq", journal_seq)))
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+
+    def archive(self, doses: list):
+        with self._lock:
+            conn = self._conn
+            conn.execute("BEGIN")
+            try:
+                conn.executemany("INSERT OR IGNORE INTO doses (seq, medication_id, taken_at) VALUES (?, ?, ?)", doses)
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+
+    def read_all(self) -> list:
+        with self._lock:
+            return self._conn.execute("SELECT seq, medication_id, taken_at FROM doses ORDER BY seq").fetchall()
+
+    def last_seq(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COALESCE(MAX(seq), 0) FROM doses").fetchone()[0]
+
+    def iter_all(self, chunk_records: int = 4096):
+        # keyset pages, so the saver thread is never locked out for long
+        seq = 0
+        while True:
+            with self._lock:
+                rows = self._conn.execute(
+                    "SELECT seq, medication_id, taken_at FROM doses WHERE seq > ? ORDER BY seq LIMIT ?",
+                    (seq, chunk_records)).fetchall()
+            yield from rows
+            if len(rows) < chunk_records:
+                return
+            seq = rows[-1][0]
+
+    def doses(self, med_id: int, since: int = 0, until=None) -> list:
+        if until is None:
+            until = 2 ** 62
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT taken_at FROM doses WHERE medication_id = ? AND taken_at >= ? AND taken_at < ?"
+                " ORDER BY taken_at", (med_id, since, until)).fetchall()
+        return [taken_at for taken_at, in rows]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+class DoseJournal:
+    # Append-only log of fixed-size taken/mute/edit records kept next to
+    # config.json.  The config snapshot records the last sequence number it
+    # includes; loading replays only newer records.  Compaction, run once a
+    # snapshot is durable, moves taken records into the dose history and
+    # drops everything the snapshot already covers.
+    def __init__(self, path: str, history):
+        self.path = path
+        self.history = history  # DoseHistoryFile or DoseDatabase
+        self.last_seq = 0
+        self.pending = 0  # records written since the last compaction
+        self._file = None
+        self._unsynced = False  # appended since the last fsync
+        self._lock = threading.Lock()
+
+    def replay(self, after_seq: int) -> list:
+        # (seq, med_id, op, value) records newer than the snapshot
+        with self._lock:
+            records = [r for r in read_records(self.path, JOURNAL_RECORD) if r[0] > after_seq]
+            self.last_seq = max([after_seq] + [r[0] for r in records])
+            self.pending = len(records)
+        return records
+
+    def _open(self):
+        if self._file is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            self._file = open(self.path, "ab")
+            size = self._file.tell()
+            if size % JOURNAL_RECORD.size:
+                self._file.truncate(size - size % JOURNAL_RECORD.size)
+        return self._file
+
+    def append(self, med_id: int, op: int, value: int) -> int:
+        with self._lock:
+            f = self._open()
+            self.last_seq += 1
+            f.write(JOURNAL_RECORD.pack(self.last_seq, med_id, op, int(value)))
+            f.flush()  # enough to survive rxnag crashing; sync() covers power loss
+            self._unsynced = True
+            self.pending += 1
+            return self.last_seq
+
+    def sync(self):
+        # off the GUI thread: one fsync for every append since the last
+        with self._lock:
+            if self._file is None or not self._unsynced:
+                return
+            self._unsynced = False
+            fd = os.dup(self._file.fileno())  # appends carry on while this syncs
+        try:
+            os.fsync(fd)
+        except OSError:
+            with self._lock:
+                self._unsynced = True
+            raise
+        finally:
+            os.close(fd)
+
+    def compact(self, upto_seq: int, archive=None):
+        # archive(doses) receives the taken records the snapshot covers; it
+        # defaults to appending them to the dose history
+        with self._lock:
+            records = read_records(self.path, JOURNAL_RECORD)
+            doses = [(seq, med_id, value) for seq, med_id, op, value in records
+                     if op == OP_TAKEN and seq <= upto_seq]
+            (archive or self.history.archive)(doses)
+            if not records:
+                self.pending = 0
+                return
+            keep = [r for r in records if r[0] > upto_seq]
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            atomic_write(self.path, b"".join(JOURNAL_RECORD.pack(*r) for r in keep))
+            self._unsynced = False  # atomic_write synced what is kept
+            self.pending = len(keep)
+
+    def pending_doses(self, med_id: int) -> list:
+        # taken times still in the journal, not yet moved to the history
+        with self._lock:
+            return [value for seq, dose_id, op, value in read_records(self.path, JOURNAL_RECORD)
+                    if op == OP_TAKEN and dose_id == med_id]
+
+    def iter_doses(self):
+        # every recorded dose as (seq, med_id, taken_at), streamed from the
+        # history, then the journal's doses the history doesn't hold yet
+        with self._lock:
+            pending = {seq: (seq, med_id, value) for seq, med_id, op, value in read_records(self.path, JOURNAL_RECORD)
+                       if op == OP_TAKEN}
+        for dose in self.history.iter_all():
+            pending.pop(dose[0], None)
+            yield dose
+        yield from pending.values()
+
+    def reserve(self, count: int) -> int:
+        # first of count sequence numbers for doses written straight to the history
+        with self._lock:
+            first = self.last_seq + 1
+            self.last_seq += count
+            return first
+
+    def all_doses(self) -> list:
+        # (seq, med_id, taken_at) for every recorded dose, history and journal
+        doses = dict((dose[0], dose) for dose in self.history.read_all())
+        with self._lock:
+            for seq, med_id, op, value in read_records(self.path, JOURNAL_RECORD):
+                if op == OP_TAKEN:
+                    doses[seq] = (seq, med_id, value)
+        return list(doses.values())
+
+    def doses(self, med_id: int, since: int = 0, until=None) -> list:
+        pending = [taken_at for taken_at in self.pending_doses(med_id)
+                   if taken_at >= since and (until is None or taken_at < until)]
+        return sorted(set(self.history.doses(med_id, since, until)) | set(pending))
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                if self._unsynced:
+                    os.fsync(self._file.fileno())
+                    self._unsynced = False
+                self._file.close()
+                self._file = None
+
+class ReminderScheduler:
+    # Min-heap of (due, seq, key) deadlines.  Rescheduling a key marks its old
+    # entry stale and pushes a new one, so updates stay O(log n); stale entries
+    # are discarded when they reach the top of the heap.
+    _REMOVED = object()
+
+    def __init__(self):
+        self._heap = []
+        self._entries = {}
+        self._counter = itertools.count()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def due(self, key):
+        entry = self._entries.get(key)
+        return entry[0] if entry is not None else None
+
+    def schedule(self, key, due: int):
+        self.unschedule(key)
+        entry = [due, next(self._counter), key]
+        self._entries[key] = entry
+        heapq.heappush(self._heap, entry)
+        # rebuild if stale entries dominate the heap
+        if len(self._heap) > 2 * len(self._entries) + 64:
+            self._heap = [e for e in self._heap if e[2] is not self._REMOVED]
+            heapq.heapify(self._heap)
+
+    def unschedule(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            entry[2] = self._REMOVED
+
+    def clear(self):
+        self._heap.clear()
+        self._entries.clear()
+
+    def items(self) -> list:
+        return [(key, entry[0]) for key, entry in self._entries.items()]
+
+    def next_due(self):
+        heap = self._heap
+        while heap and heap[0][2] is self._REMOVED:
+            heapq.heappop(heap)
+        return heap[0][0] if heap else None
+
+    def pop_due(self, now: int) -> list:
+        due = []
+        heap = self._heap
+        while heap and heap[0][0] <= now:
+            entry = heapq.heappop(heap)
+            key = entry[2]
+            if key is not self._REMOVED:
+                del self._entries[key]
+                due.append(key)
+        return due
+
+class ReminderEngine:
+    # Reminder timing and persistence shared by the GUI and headless mode.
+    # Front ends own their settings; get_settings() supplies them whenever the
+    # engine writes a snapshot so they round-trip through config.json.
+    def __init__(self, data_dir: str, clock: SystemClock = system_clock, on_save=None):
+        self.clock = clock
+        self.config_file = os.path.join(data_dir, "config.json")
+        self.database_file = os.path.join(data_dir, "rxnag.db")
+        self.history_file = DoseHistoryFile(os.path.join(data_dir, "doses.dat"))
+        self.journal = DoseJournal(os.path.join(data_dir, "journal.dat"), self.history_file)
+        self.store = MedicationStore(clock)
+        self.scheduler = ReminderScheduler()  # keyed by medication id
+        self.storage = "json"  # or "sqlite" to keep medications and dose history in rxnag.db
+        self.database = None
+        self.read_only = False  # rxnag.db wouldn't open, see load_config
+        self.retry_at = None
+        self.settings = {}
+        self.get_settings = lambda: self.settings
+        self.saver = WriteBehindSaver(self.config_file, serialize=self.serialize_config,
+                                      after_write=self.on_config_written, on_save=on_save,
+                                      sync=self.journal.sync)
+
+    def load_config(self) -> dict:
+        # fills the store and scheduler; returns the front end settings
+        journal_seq = 0
+        self.read_only = False
+        try:
+            with open(self.config_file, "r") as f:
+                config = json.load(f)
+            settings = {key: value for key, value in config.items()
+                        if key not in ("medications", "next_id", "journal_seq", "storage")}
+            self.storage = config.get("storage", "json")
+            if self.storage == "sqlite" and not self.open_database():
+                # the medications are in rxnag.db: hold none and save nothing
+                # until it opens, rather than save an empty list over them
+                self.read_only = True
+                self.retry_at = self.clock.now() + database_retry_secs
+                self.store.load([])
+                self.scheduler.clear()
+                self.settings = settings
+                return dict(self.settings)
+            self.store.load(
+                [
+                    (
+                        medication["name"],
+                        medication["last_taken"],
+                        medication["interval"],
+                        medication.get("muted", False),
+                        medication.get("id"),
+                        medication.get("schedule")
+                    )
+                    for medication in config.get("medications", [])
+                ],
+                config.get("next_id", 1)
+            )
+            journal_seq = config.get("journal_seq", 0)
+            if self.database is not None:
+                stored = self.database.load()
+                if stored is not None:
+                    # otherwise still migrating, keep what config.json had
+                    records, next_id, journal_seq = stored
+                    self.store.load(records, next_id)
+            self.settings = settings
+        except (FileNotFoundError, json.JSONDecodeError, ValueError, sqlite3.Error):
+            self.store.load([])
+            self.settings = {}
+
+        # replay taken/mute/edit events recorded after the snapshot
+        for seq, med_id, op, value in self.journal.replay(journal_seq):
+            self.store.apply(med_id, op, value)
+        # an import interrupted before its snapshot may have used later seqs
+        self.journal.last_seq = max(self.journal.last_seq, self.journal.history.last_seq())
+
+        self.scheduler.clear()
+        for med_id in self.store.ids:
+            self.schedule_reminder(med_id)
+        return dict(self.settings)
+
+    def save_config(self):
+        if self.read_only:
+            return
+        self.settings = dict(self.get_settings())
+        config = dict(self.settings)
+        config.update({
+            "medications": self.store.snapshot(),
+            "next_id": self.store.next_id,
+            "journal_seq": self.journal.last_seq,
+            "storage": self.storage,
+        })
+        # coalesced and written atomically off the calling thread
+        self.saver.submit(config)
+
+    def flush(self):
+        self.saver.flush()
+
+    def close(self):
+        self.saver.close()
+        self.journal.close()
+        if self.database is not None:
+            try:
+                self.database.close()
+            except sqlite3.Error as e:
+                print(f"rxnag: could not close {self.database_file}: {e}", file=sys.stderr)
+
+    def serialize_config(self, config):
+        # saver thread: with the database enabled config.json only holds settings
+        if self.database is not None:
+            config = {key: value for key, value in config.items() if key not in ("medications", "next_id")}
+        return dump_config(config)
+
+    def on_config_written(self, config):
+        # saver thread: the snapshot covers journal records up to journal_seq
+        journal_seq = config["journal_seq"]
+        database = self.database
+        if database is not None:
+            # medications and the covered doses land in one transaction
+            self.journal.compact(journal_seq,
+                                 lambda doses: database.write(config["medications"], journal_seq, doses))
+        else:
+            self.journal.compact(journal_seq)
+
+    def open_database(self) -> bool:
+        try:
+            self.database = DoseDatabase(self.database_file)
+        except sqlite3.Error as e:
+            print(f"rxnag: could not open {self.database_file}: {e}", file=sys.stderr)
+            self.database = None
+            return False
+        self.journal.history = self.database
+        return True
+
+    def check_writable(self):
+        # before any change: a read-only profile tries rxnag.db again, and
+        # raises StorageUnavailable if it still won't open
+        if self.read_only:
+            self.load_config()
+            if self.read_only:
+                raise StorageUnavailable(f"{self.database_file} can't be opened, "
+                                         "this profile can't be changed until it can")
+
+    def set_storage(self, storage: str):
+        self.check_writable()
+        if storage == self.storage:
+            return
+        self.saver.flush()  # finish writing against the old backend first
+        if storage == "sqlite":
+            if not self.open_database():
+                return
+            self.database.archive(self.history_file.read_all())
+        else:
+            database, self.database = self.database, None
+            self.journal.history = self.history_file
+            self.history_file.archive(database.read_all())
+            database.close()
+        self.storage = storage
+        self.save_config()
+
+    def record_event(self, med_id: int, op: int, value: int):
+        # O(1) append instead of rewriting the whole config
+        try:
+            self.journal.append(med_id, op, value)
+        except OSError:
+            self.save_config()
+            return
+        self.saver.request_sync()  # fsynced on the saver thread, batched with any others
+        if self.journal.pending >= journal_compact_records:
+            self.save_config()  # compacts the journal once the snapshot is written
+
+    def schedule_reminder(self, med_id: int):
+        row = self.store.row_of(med_id)
+        reminder_time = self.store.reminder_time(row, self.clock.now())
+        if reminder_time is None:
+            self.scheduler.unschedule(med_id)
+        else:
+            self.scheduler.schedule(med_id, reminder_time)
+
+    def next_due(self):
+        if self.read_only:
+            return self.retry_at  # check_reminders tries rxnag.db again then
+        return self.scheduler.next_due()
+
+    def reschedule(self):
+        # after a clock jump: due states and every deadline from the current time
+        now = self.clock.now()
+        for row in range(len(self.store)):
+            self.store.refresh_due(row, now)
+        self.scheduler.clear()
+        for med_id in self.store.ids:
+            self.schedule_reminder(med_id)
+
+    def check_reminder(self, row: int, now: int) -> bool:
+        return self.store.is_due(row, now) and not self.store.is_muted(row)
+
+    def check_reminders(self, now: int, nag_secs: int) -> list:
+        # names of every medication to remind about this cycle
+        if self.read_only and now >= self.retry_at:
+            self.load_config()
+        store = self.store
+        due_names = []
+        for med_id in self.scheduler.pop_due(now):
+            row = store.row_of(med_id)
+            store.refresh_due(row, now)  # observers hear only about transitions
+            if self.check_reminder(row, now):
+                due_names.append(store.names[row])
+            next_due = store.next_due(row)
+            if next_due == never_due:
+                self.scheduler.unschedule(med_id)  # as needed, or the taper is over
+            elif next_due > now:
+                self.scheduler.schedule(med_id, next_due)
+            elif not store.is_muted(row):
+                # overdue, nag again after the notification interval
+                self.scheduler.schedule(med_id, now + nag_secs)
+        return due_names
+
+    def mark_taken(self, row: int, taken_at=None):
+        self.check_writable()
+        taken_at = self.clock.now() if taken_at is None else int(taken_at)
+        med_id = self.store.ids[row]
+        self.store.update(row, last_taken=taken_at)
+        self.record_event(med_id, OP_TAKEN, taken_at)
+        self.schedule_reminder(med_id)
+
+    def set_muted(self, row: int, muted: bool):
+        self.check_writable()
+        med_id = self.store.ids[row]
+        self.store.update(row, muted=muted)
+        self.record_event(med_id, OP_MUTED, int(muted))
+        self.schedule_reminder(med_id)
+
+    def edit(self, row: int, name: str, last_taken: int, interval: int, schedule=_unchanged):
+        self.check_writable()
+        store = self.store
+        med_id = store.ids[row]
+        renamed = name != store.names[row]
+        rescheduled = schedule is not _unchanged and schedule != store.schedules[row]
+        if last_taken != store.last_taken[row]:
+            self.record_event(med_id, OP_LAST_TAKEN, last_taken)
+        if interval != store.intervals[row]:
+            self.record_event(med_id, OP_INTERVAL, interval)
+        store.update(row, name=name, last_taken=last_taken, interval=interval, schedule=schedule)
+        if renamed or rescheduled:
+            self.save_config()  # names and schedules don't fit in a fixed-size journal record
+        self.schedule_reminder(med_id)
+
+    def add(self, name: str, last_taken: int, interval: int, muted: bool = False, schedule=None) -> int:
+        self.check_writable()
+        row = self.store.add(name, last_taken, interval, muted, schedule=schedule)
+        self.schedule_reminder(self.store.ids[row])
+        self.save_config()
+        return row
+
+    def remove(self, row: int):
+        self.check_writable()
+        self.scheduler.unschedule(self.store.ids[row])
+        self.store.remove(row)
+        self.save_config()
+
+    def import_doses(self, doses) -> int:
+        # (med_id, taken_at) pairs straight into the dose history, a chunk per
+        # write; doses already recorded are skipped, so importing the same
+        # file twice adds nothing.  Returns how many were new.  The journal is
+        # compacted first, so no pending dose sits under the seqs reserved here
+        # and the history stays in seq order.
+        self.check_writable()
+        self.save_before_import()
+        saved_next_id = self.store.next_id
+        recorded = DoseSet(self.journal.iter_doses())
+        history = self.journal.history
+        count = 0
+        chunk = []
+        for dose in itertools.chain(doses, [None]):
+            if dose is not None:
+                if recorded.add(*dose):
+                    chunk.append(dose)
+                if len(chunk) < 4096:
+                    continue
+            if chunk:
+                if self.store.next_id != saved_next_id:
+                    # medications added by the import reach disk before their
+                    # doses, or an interrupted import would orphan them
+                    self.save_before_import()
+                    saved_next_id = self.store.next_id
+                first = self.journal.reserve(len(chunk))
+                history.archive([(first + i, med_id, taken_at) for i, (med_id, taken_at) in enumerate(chunk)])
+                count += len(chunk)
+                chunk = []
+        return count
+
+    def save_before_import(self):
+        self.save_config()
+        if not self.saver.flush() or self.journal.pending:
+            raise OSError(f"could not save {self.config_file}, import stopped")
+
+    def take(self, names: list):
+        # --take on the command line: (exit code, messages)
+        try:
+            self.check_writable()
+        except StorageUnavailable as e:
+            return 1, [str(e)]
+        code = 0
+        messages = []
+        for name in names:
+            row = self.find_medication(name)
+            if row is None:
+                messages.append(f"No medication named {name}")
+                code = 1
+            else:
+                self.mark_taken(row)
+                messages.append(f"Marked {self.store.names[row]} taken")
+        return code, messages
+
+    def find_medication(self, name: str):
+        names = self.store.names
+        if name in names:
+            return names.index(name)
+        folded = name.casefold()
+        for row, candidate in enumerate(names):
+            if candidate.casefold() == folded:
+                return row
+        return None
+
+class ProfileManager:
+    # One ReminderEngine per profile (e.g. per resident in a care home).  The
+    # default profile keeps its files in the data dir itself, others live in
+    # profiles/NAME/.  Only pinned profiles (the one in view and the default,
+    # which carries the front end settings) plus a few recently checked ones
+    # stay loaded; every other profile is just its earliest deadline in one
+    # global scheduler, saved to profiles/index.json so startup doesn't have
+    # to load them either.  timer(name) and on_save(seconds, bytes) are the
+    # front end's hooks for timing sweeps and saves.
+    def __init__(self, data_dir: str, clock: SystemClock = system_clock, timer=None, on_save=None):
+        self.data_dir = data_dir
+        self.clock = clock
+        self.timer = timer
+        self.on_save = on_save
+        self.profiles_dir = os.path.join(data_dir, "profiles")
+        self.index_file = os.path.join(self.profiles_dir, "index.json")
+        self.engines = OrderedDict()  # loaded profiles, least recently used first
+        self.pinned = {default_profile}
+        self.deadlines = ReminderScheduler()  # keyed by profile name
+        self.active = default_profile
+
+    @property
+    def default(self) -> ReminderEngine:
+        return self.engine(default_profile)
+
+    def names(self) -> list:
+        try:
+            others = sorted(entry.name for entry in os.scandir(self.profiles_dir)
+                            if entry.is_dir() and self.valid_name(entry.name))
+        except FileNotFoundError:
+            others = []
+        return [default_profile] + others
+
+    @staticmethod
+    def valid_name(name: str) -> bool:
+        return bool(name) and name != default_profile and not name.startswith(".") \
+            and "/" not in name and "\0" not in name
+
+    def find(self, name: str):
+        names = self.names()
+        if name in names:
+            return name
+        folded = name.casefold()
+        for candidate in names:
+            if candidate.casefold() == folded:
+                return candidate
+        return None
+
+    def path_of(self, name: str) -> str:
+        return self.data_dir if name == default_profile else os.path.join(self.profiles_dir, name)
+
+    def load(self) -> dict:
+        # loads the default profile and indexes the rest; returns its settings
+        settings = self.default.settings
+        try:
+            with open(self.index_file, "r") as f:
+                index = json.load(f)
+            index_mtime = os.stat(self.index_file).st_mtime_ns
+        except (FileNotFoundError, json.JSONDecodeError):
+            index, index_mtime = {}, 0
+        for name in self.names():
+            if name in self.engines:
+                continue
+            if name in index and not self._changed_since(name, index_mtime):
+                self._set_deadline(name, index[name])
+            else:
+                self.engine(name)  # unknown or written after the index, look at it once
+        self.save_index()
+        return dict(settings)
+
+    def _changed_since(self, name: str, mtime_ns: int) -> bool:
+        for file_name in ("config.json", "journal.dat", "rxnag.db-wal"):
+            try:
+                if os.stat(os.path.join(self.path_of(name), file_name)).st_mtime_ns > mtime_ns:
+                    return True
+            except FileNotFoundError:
+                pass
+        return False
+
+    def engine(self, name: str) -> ReminderEngine:
+        engine = self.engines.get(name)
+        if engine is None:
+            engine = ReminderEngine(self.path_of(name), self.clock, self.on_save)
+            engine.load_config()
+            self.engines[name] = engine
+            self.evict()
+        self.engines.move_to_end(name)
+        return engine
+
+    def create(self, name: str) -> ReminderEngine:
+        if not self.valid_name(name):
+            raise ValueError(f"invalid profile name {name!r}")
+        os.makedirs(self.path_of(name), exist_ok=True)
+        engine = self.engine(name)
+        engine.save_config()
+        engine.set_storage(self.default.storage)  # storage is the same for every profile
+        return engine
+
+    def activate(self, name: str) -> ReminderEngine:
+        # the profile shown in the front end stays loaded until another replaces it
+        if self.active != default_profile:
+            self.pinned.discard(self.active)
+        self.active = name
+        self.pinned.add(name)
+        engine = self.engine(name)
+        self.evict()
+        return engine
+
+    def set_storage(self, storage: str) -> list:
+        # switches every profile, loading each in turn; returns the errors
+        # for those that can't be switched now
+        errors = []
+        for name in self.names():
+            try:
+                self.engine(name).set_storage(storage)
+            except StorageUnavailable as e:
+                errors.append(f"{name}: {e}")
+        return errors
+
+    def evict(self):
+        unpinned = [name for name in self.engines if name not in self.pinned]
+        for name in unpinned[:max(0, len(unpinned) - max_loaded_profiles)]:
+            engine = self.engines.pop(name)
+            self._set_deadline(name, engine.next_due())
+            engine.close()  # everything it changed is already saved or journaled
+
+    def _set_deadline(self, name: str, due):
+        if due is None:
+            self.deadlines.unschedule(name)
+        else:
+            self.deadlines.schedule(name, due)
+
+    def next_due(self):
+        # loaded engines move their own deadlines; fold them in first
+        for name, engine in self.engines.items():
+            self._set_deadline(name, engine.next_due())
+        return self.deadlines.next_due()
+
+    def reschedule(self, jump: float):
+        # after the wall clock jumped by jump seconds.  Profiles not loaded only
+        # have a deadline; when the clock went back it moves with it, since a
+        # nag due in five minutes is still five minutes away.  Too early is
+        # harmless, the profile is just checked and rescheduled then.
+        now = self.clock.now()
+        for engine in self.engines.values():
+            engine.reschedule()
+        if jump < 0:
+            for name, due in self.deadlines.items():
+                if name not in self.engines:
+                    self.deadlines.schedule(name, max(now, int(due + jump)))
+
+    def check_reminders(self, now: int, nag_secs: int) -> list:
+        # (profile, medication names) for every profile with doses due
+        if self.timer is None:
+            return self._check_reminders(now, nag_secs)
+        with self.timer("sweep_seconds"):
+            return self._check_reminders(now, nag_secs)
+
+    def _check_reminders(self, now: int, nag_secs: int) -> list:
+        self.next_due()
+        due = []
+        for name in self.deadlines.pop_due(now):
+            engine = self.engine(name)
+            names = engine.check_reminders(now, nag_secs)
+            if names:
+                due.append((name, names))
+            self._set_deadline(name, engine.next_due())
+        due.sort(key=lambda entry: (entry[0] != self.active, entry[0]))
+        return due
+
+    def lookup(self, profile=None):
+        # --for PROFILE, or the active profile when not given; None if unknown
+        return self.active if profile is None else self.find(profile)
+
+    def take(self, names: list, profile=None):
+        # --take on the command line, against --for PROFILE or the active one
+        if not names:
+            return 0, []
+        name = self.lookup(profile)
+        if name is None:
+            return 1, [f"No profile named {profile}"]
+        return self.engine(name).take(names)
+
+    def save_index(self):
+        if not os.path.isdir(self.profiles_dir):
+            return  # a single-profile install has nothing to index
+        self.next_due()
+        index = {name: self.deadlines.due(name) for name in self.names() if name in self.deadlines}
+        try:
+            atomic_write(self.index_file, json.dumps(index).encode("utf-8"))
+        except OSError as e:
+            print(f"rxnag: could not write {self.index_file}: {e}", file=sys.stderr)
+
+    def flush(self):
+        for engine in self.engines.values():
+            engine.flush()
+        self.save_index()
+
+    def close(self):
+        for engine in self.engines.values():
+            engine.save_config()
+        self.next_due()
+        for name, engine in self.engines.items():
+            # one profile failing to close mustn't keep the others from saving
+            try:
+                engine.close()
+            except (OSError, sqlite3.Error) as e:
+                print(f"rxnag: could not close profile {name}: {e}", file=sys.stderr)
+        self.engines.clear()
+        self.save_index()
+
+def data_dir() -> str:
+    # configuration and all data live here
+    return os.path.join(os.path.expanduser("~"), ".local", "share", "rxnag")
+
+def runtime_dir() -> str:
+    # per-user directory for the instance lock and command socket
+    base = os.environ.get("XDG_RUNTIME_DIR")
+    if base and os.path.isdir(base):
+        return base
+    base = os.path.join(tempfile.gettempdir(), f"rxnag-{os.getuid()}")
+    try:
+        os.makedirs(base, mode=0o700, exist_ok=True)
+        info = os.lstat(base)
+    except OSError:
+        info = None
+    # anyone can create it first in /tmp, so only trust our own private directory
+    if info is None or not stat.S_ISDIR(info.st_mode) or info.st_uid != os.getuid() \
+            or stat.S_IMODE(info.st_mode) != 0o700:
+        print(f"rxnag: not using {base}, it isn't a private directory of ours", file=sys.stderr)
+        base = data_dir()
+        os.makedirs(base, exist_ok=True)
+    return base
+
+def encode_message(message: dict) -> bytes:
+    # command socket framing: one JSON object per line
+    return json.dumps(message).encode("utf-8") + b"\n"
+
+def decode_message(line: bytes) -> dict:
+    message = json.loads(line.decode("utf-8"))
+    if not isinstance(message, dict):
+        raise ValueError("message is not an object")
+    return message
+
+class SingleInstance:
+    # The first process takes an flock on rxnag.lock and serves commands on
+    # rxnag.sock; later ones forward their command line over the socket and
+    # exit.  The kernel drops the lock when its holder dies, so there is no
+    # stale-pid or pid-reuse case to get wrong.
+    def __init__(self, directory=None):
+        directory = directory or runtime_dir()
+        self.lock_path = os.path.join(directory, "rxnag.lock")
+        self.socket_path = os.path.join(directory, "rxnag.sock")
+        self._lock_file = None
+
+    def acquire(self) -> bool:
+        f = open(self.lock_path, "a")
+        try:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            f.close()
+            return False
+        self._lock_file = f  # held for the life of the process
+        return True
+
+    def forward(self, argv: list, timeout: float = 2.0) -> int:
+        # send argv to the running instance, print its reply, return its exit code
+        deadline = time.monotonic() + timeout
+        while True:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.settimeout(timeout)
+            try:
+                sock.connect(self.socket_path)
+                break
+            except (FileNotFoundError, ConnectionRefusedError):
+                # the running instance holds the lock but may not be listening yet
+                sock.close()
+                if time.monotonic() >= deadline:
+                    print("rxnag: another instance is running but not answering", file=sys.stderr)
+                    return 1
+                time.sleep(0.05)
+        with sock:
+            try:
+                # an --import or --export can keep the instance busy for a while
+                sock.settimeout(None)
+                sock.sendall(encode_message({"argv": list(argv), "cwd": os.getcwd()}))
+                reply = b""
+                while not reply.endswith(b"\n"):
+                    chunk = sock.recv(4096)
+                    if not chunk:
+                        break
+                    reply += chunk
+                reply = decode_message(reply)
+            except (OSError, ValueError) as e:
+                print(f"rxnag: no reply from the running instance: {e}", file=sys.stderr)
+                return 1
+        code = int(reply.get("code", 0))
+        message = reply.get("message", "")
+        if message:
+            print(message.rstrip("\n"), file=sys.stderr if code else sys.stdout)
+        return code
+
+def build_arg_parser():
+    argparser = argparse.ArgumentParser(prog="rxnag.py")
+    argparser.add_argument("--minimized", action="store_true")
+    argparser.add_argument("--show", action="store_true")
+    argparser.add_argument("--take", action="append", default=[], metavar="NAME",
+                           help="mark a medication taken (forwarded to a running instance)")
+    argparser.add_argument("--for", dest="profile_name", metavar="PROFILE",
+                           help="profile that --take and --show act on (default: the one in view)")
+    argparser.add_argument("--report", nargs="?", const="", metavar="DAYS",
+                           help="print an adherence report over the last DAYS (comma separated, default 7,30,90)")
+    argparser.add_argument("--export", metavar="FILE",
+                           help="write medications and dose history to FILE (- for stdout)")
+    argparser.add_argument("--import", dest="import_file", metavar="FILE",
+                           help="add or update medications and doses from FILE (- for stdin)")
+    argparser.add_argument("--format", choices=("csv", "jsonl", "ics"),
+                           help="--export/--import format, default from the file extension")
+    argparser.add_argument("--stats", action="store_true",
+                           help="print timer wakeups and hot path timings of the running instance")
+    argparser.add_argument("--profile", action="store_true",
+                           help="profile CPU time with cProfile until exit; toggles it in a running instance")
+    argparser.add_argument("--trace-memory", action="store_true",
+                           help="trace allocations with tracemalloc until exit; toggles it in a running instance")
+    argparser.add_argument("--startup-profile", action="store_true",
+                           help="print how long each startup phase took")
+    argparser.add_argument("--headless", action="store_true",
+                           help="run the reminder engine without any windows or tray icon")
+    argparser.add_argument("--sink", action="append", default=[], metavar="SINK",
+                           help="where headless reminders go: stdout, notify or socket:PATH (repeatable)")
+    return argparser
+
+def parse_command_line(argv: list):
+    # parse a forwarded command line without exiting the running instance;
+    # returns (args, None) or (None, (exit code, usage/error text))
+    output = io.StringIO()
+    try:
+        with contextlib.redirect_stdout(output), contextlib.redirect_stderr(output):
+            return build_arg_parser().parse_args(argv), None
+    except SystemExit as e:
+        return None, ((e.code if isinstance(e.code, int) else 2), output.getvalue())
@@ -0,0 +1,264 @@
+# rxnag - Medication reminder app
+# Copyright (c) 2024-2026 Solorvox solorvox (at) epic.geek.nz
+# Source: https://github.com/solorvox/rxnag
+# License: GPL-3 https://www.gnu.org/licenses/gpl-3.0.txt
+#
+# Diagnostics: always-on wakeup and hot path stats (--stats, rxnag.prom) and
+# opt-in cProfile/tracemalloc profiling (--profile, --trace-memory).  The
+# front ends hand stats.timed and stats.saved to the core's ProfileManager,
+# which never imports this module.
+import os
+import sys
+import time
+import bisect
+import datetime
+import itertools
+import contextlib
+import threading
+from rxnag_core import Utils, atomic_write
+
+stats_file_name = "rxnag.prom"  # in the data dir, when enabled in the config
+stats_write_secs = 300
+
+class Histogram:
+    # Prometheus-style cumulative buckets, plus the max for the --stats dump
+    __slots__ = ("buckets", "counts", "count", "sum", "max")
+
+    def __init__(self, buckets: tuple):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float):
+        position = bisect.bisect_left(self.buckets, value)
+        if position < len(self.counts):
+            self.counts[position] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def quantile(self, q: float) -> float:
+        # upper bound of the bucket holding the q-th observation
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return self.max
+
+class Stats:
+    # Counters and latency histograms for what rxnag costs while idle: timer
+    # wakeups, reminder sweeps, config saves and sounds.  Cheap enough to
+    # always be on; shown by --stats and optionally written to rxnag.prom.
+    # Updated from the saver and sound threads too, hence the lock.
+    latency_buckets = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                       0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+    descriptions = {
+        "wakeups_total": "Timer wakeups, by timer",
+        "sweep_seconds": "Time spent checking reminders per wakeup",
+        "save_seconds": "Time to serialize and write config.json",
+        "save_bytes_total": "Bytes written to config.json",
+        "sound_load_seconds": "Time to open and decode (or find cached) the notification sound",
+        "sound_play_seconds": "Time to start playing the notification sound",
+    }
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.counters = {}  # (name, label) -> value
+        self.histograms = {}
+        self.written = 0.0
+        self._lock = threading.Lock()
+
+    def count(self, name: str, amount: int = 1, label: str = ""):
+        key = (name, label)
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def observe(self, name: str, seconds: float):
+        with self._lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram(self.latency_buckets)
+            histogram.observe(seconds)
+
+    @contextlib.contextmanager
+    def timed(self, name: str):
+        began = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - began)
+
+    def saved(self, seconds: float, size: int):
+        # the saver thread's on_save hook
+        self.observe("save_seconds", seconds)
+        self.count("save_bytes_total", size)
+
+    def uptime(self) -> float:
+        # monotonic, so time spent suspended doesn't count
+        return time.monotonic() - self.started
+
+    def summary(self) -> str:
+        # the --stats dump
+        hours = max(self.uptime(), 1.0) / 3600
+        lines = [f"RxNag stats, {Utils.format_time(int(self.uptime()))} awake"]
+        with self._lock:
+            counters = sorted(self.counters.items())
+            histograms = sorted(self.histograms.items())
+        wakeups = [(label, value) for (name, label), value in counters if name == "wakeups_total"]
+        total = sum(value for _, value in wakeups)
+        lines.append(f"Timer wakeups: {total} ({total / hours:.1f}/hour)")
+        for label, value in wakeups:
+            lines.append(f"  {label}: {value} ({value / hours:.1f}/hour)")
+        for name, histogram in histograms:
+            if not histogram.count:
+                continue
+            lines.append(f"{self.descriptions.get(name, name)}: {histogram.count} times, "
+                         f"mean {histogram.sum / histogram.count * 1000:.2f}ms, "
+                         f"p95 under {histogram.quantile(0.95) * 1000:g}ms, max {histogram.max * 1000:.2f}ms")
+        for (name, label), value in counters:
+            if name == "save_bytes_total":
+                lines.append(f"Bytes written to config.json: {value}")
+        return "\n".join(lines)
+
+    def prometheus_text(self) -> str:
+        # text exposition format, e.g. for node_exporter's textfile collector
+        lines = ["# HELP rxnag_uptime_seconds Time running, not counting suspend",
+                 "# TYPE rxnag_uptime_seconds gauge",
+                 f"rxnag_uptime_seconds {self.uptime():.0f}"]
+        with self._lock:
+            counters = sorted(self.counters.items())
+            histograms = sorted(self.histograms.items())
+        for name in sorted({name for (name, _), _ in counters}):
+            lines.append(f"# HELP rxnag_{name} {self.descriptions.get(name, name)}")
+            lines.append(f"# TYPE rxnag_{name} counter")
+            for (counter, label), value in counters:
+                if counter == name:
+                    lines.append(f'rxnag_{name}{{timer="{label}"}} {value}' if label else f"rxnag_{name} {value}")
+        for name, histogram in histograms:
+            lines.append(f"# HELP rxnag_{name} {self.descriptions.get(name, name)}")
+            lines.append(f"# TYPE rxnag_{name} histogram")
+            cumulative = 0
+            for bound, count in zip(histogram.buckets, histogram.counts):
+                cumulative += count
+                lines.append(f'rxnag_{name}_bucket{{le="{bound:g}"}} {cumulative}')
+            lines.append(f'rxnag_{name}_bucket{{le="+Inf"}} {histogram.count}')
+            lines.append(f"rxnag_{name}_sum {histogram.sum:.6f}")
+            lines.append(f"rxnag_{name}_count {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+    def write_due(self, path: str, every: float = stats_write_secs) -> bool:
+        # called from wakeups that happen anyway, so the file never adds one
+        if time.monotonic() - self.written < every:
+            return False
+        self.write(path)
+        return True
+
+    def write(self, path: str):
+        self.written = time.monotonic()
+        try:
+            atomic_write(path, self.prometheus_text().encode("utf-8"))
+        except OSError as e:
+            print(f"rxnag: could not write {path}: {e}", file=sys.stderr)
+
+stats = Stats()
+
+class Profiler:
+    # Opt-in cProfile and tracemalloc for chasing stutters in a live instance:
+    # started with --profile/--trace-memory, toggled by repeating them against
+    # the running instance.  Results land in the data dir as rxnag-TIME.prof
+    # (python3 -m pstats) and rxnag-TIME-memory.txt plus a .tracemalloc
+    # snapshot that tracemalloc.Snapshot.load() can compare.
+    top_allocations = 40
+
+    def __init__(self):
+        self.cpu = None
+
+    @property
+    def cpu_running(self) -> bool:
+        return self.cpu is not None
+
+    @property
+    def memory_running(self) -> bool:
+        import tracemalloc
+        return tracemalloc.is_tracing()
+
+    @staticmethod
+    def _path(directory: str, suffix: str) -> str:
+        os.makedirs(directory, exist_ok=True)
+        base = os.path.join(directory, f"rxnag-{datetime.datetime.now():%Y%m%d-%H%M%S}")
+        path = base + suffix
+        for number in itertools.count(2):
+            if not os.path.exists(path):
+                return path
+            path = f"{base}-{number}{suffix}"
+
+    def start_cpu(self):
+        # only the thread calling this, i.e. the GUI or event loop thread
+        if self.cpu is None:
+            import cProfile
+            self.cpu = cProfile.Profile()
+            self.cpu.enable()
+
+    def stop_cpu(self, directory: str) -> str:
+        cpu, self.cpu = self.cpu, None
+        cpu.disable()
+        path = self._path(directory, ".prof")
+        cpu.dump_stats(path)
+        return f"CPU profile written to {path} (view with python3 -m pstats {path})"
+
+    def start_memory(self, frames: int = 10):
+        import tracemalloc
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(frames)
+
+    def stop_memory(self, directory: str) -> str:
+        import tracemalloc
+        current, peak = tracemalloc.get_traced_memory()
+        # leave out what tracing and profiling allocate themselves
+        ignore = [tracemalloc.__file__] + [sys.modules[name].__file__ for name in ("cProfile", "pstats")
+                                           if name in sys.modules]
+        snapshot = tracemalloc.take_snapshot().filter_traces([tracemalloc.Filter(False, path) for path in ignore])
+        tracemalloc.stop()
+        path = self._path(directory, "-memory.txt")
+        snapshot.dump(path[:-len(".txt")] + ".tracemalloc")
+        top = snapshot.statistics("lineno")
+        lines = [f"traced now {current / 1024:.1f} KiB, peak {peak / 1024:.1f} KiB, "
+                 f"top {min(len(top), self.top_allocations)} of {len(top)} allocation sites", ""]
+        lines += [str(statistic) for statistic in top[:self.top_allocations]]
+        with open(path, "w", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+        return f"Memory allocations written to {path}"
+
+    @staticmethod
+    def _save(stop, directory: str) -> str:
+        try:
+            return stop(directory)
+        except OSError as e:
+            return f"rxnag: could not save to {directory}: {e}"
+
+    def toggle_cpu(self, directory: str) -> str:
+        if self.cpu_running:
+            return self._save(self.stop_cpu, directory)
+        self.start_cpu()
+        return "CPU profiling started, toggle it off (or --profile) to save it"
+
+    def toggle_memory(self, directory: str) -> str:
+        if self.memory_running:
+            return self._save(self.stop_memory, directory)
+        self.start_memory()
+        return "Memory tracing started, toggle it off (or --trace-memory) to save it"
+
+    def finish(self, directory: str) -> list:
+        # on exit: save whatever is still running
+        messages = []
+        if self.cpu_running:
+            messages.append(self._save(self.stop_cpu, directory))
+        if "tracemalloc" in sys.modules and self.memory_running:
+            messages.append(self._save(self.stop_memory, directory))
+        return messages
+
+profiler = Profiler()
@@ -0,0 +1,234 @@
+# rxnag - Medication reminder app
+# Copyright (c) 2024-2026 Solorvox solorvox (at) epic.geek.nz
+# Source: https://github.com/solorvox/rxnag
+# License: GPL-3 https://www.gnu.org/licenses/gpl-3.0.txt
+#
+# Headless mode: the same reminder engine and config.json on an asyncio loop,
+# with no Qt import at all.  Reminders go to pluggable sinks.
+import os
+import sys
+import time
+import shutil
+import signal
+import socket
+import asyncio
+import datetime
+import subprocess
+import rxnag_core
+from rxnag_core import ProfileManager, ClockJumpDetector, ClockChangeWatch, max_timer_secs, clock_check_secs, data_dir
+from rxnag_diagnostics import stats, stats_file_name, profiler
+
+class StdoutSink:
+    def send(self, due: list, message: str):
+        print(f"{datetime.datetime.now():%Y-%m-%d %H:%M} {message}", flush=True)
+
+class SocketSink:
+    # one JSON line per reminder to whatever listens on a local Unix socket
+    def __init__(self, path: str):
+        self.path = path
+
+    def send(self, due: list, message: str):
+        event = {"event": "reminder", "time": int(time.time()),
+                 "medications": [name for profile, names in due for name in names],
+                 "profiles": dict(due), "message": message}
+        try:
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+                sock.settimeout(1.0)
+                sock.connect(self.path)
+                sock.sendall(rxnag_core.encode_message(event))
+        except OSError as e:
+            print(f"rxnag: socket sink {self.path}: {e}", file=sys.stderr)
+
+class NotifySink:
+    # org.freedesktop.Notifications.Notify through gdbus, so no D-Bus bindings
+    # are needed; each reminder replaces the previous popup
+    def __init__(self, shown_secs: int = 10):
+        self.shown_secs = shown_secs
+        self.replaces_id = 0
+        self.icon = os.path.join(os.path.dirname(os.path.realpath(__file__)), "icon.png")
+
+    @staticmethod
+    def _string(text: str) -> str:
+        # GVariant text format string literal
+        return '"' + text.replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+    def send(self, due: list, message: str):
+        gdbus = shutil.which("gdbus")
+        if gdbus is None:
+            print(f"rxnag: gdbus not found, {message}", file=sys.stderr)
+            return
+        command = [gdbus, "call", "--session",
+                   "--dest", "org.freedesktop.Notifications",
+                   "--object-path", "/org/freedesktop/Notifications",
+                   "--method", "org.freedesktop.Notifications.Notify",
+                   self._string("RxNag"), str(self.replaces_id), self._string(self.icon),
+                   self._string("Medication Reminder"), self._string(message),
+                   "[]", "{}", str(self.shown_secs * 1000)]
+        try:
+            result = subprocess.run(command, capture_output=True, text=True, timeout=5)
+        except (OSError, subprocess.TimeoutExpired) as e:
+            print(f"rxnag: notify sink: {e}", file=sys.stderr)
+            return
+        if result.returncode != 0:
+            print(f"rxnag: notify sink: {result.stderr.strip()}", file=sys.stderr)
+            return
+        # reply looks like "(uint32 7,)"
+        digits = "".join(c for c in result.stdout.split(" ")[-1] if c.isdigit())
+        if digits:
+            self.replaces_id = int(digits)
+
+def make_sink(spec: str, settings: dict):
+    if spec == "stdout":
+        return StdoutSink()
+    if spec == "notify":
+        return NotifySink(max(1, min(60, settings.get("notification_shown_secs", 10))))
+    if spec.startswith("socket:") and len(spec) > len("socket:"):
+        return SocketSink(spec[len("socket:"):])
+    raise ValueError(f"unknown sink {spec!r}, use stdout, notify or socket:PATH")
+
+class HeadlessReminders:
+    def __init__(self, profiles: ProfileManager, sinks: list, instance=None):
+        self.profiles = profiles
+        self.sinks = sinks
+        self.instance = instance
+        self.stopping = False
+        self.wakeup = None
+        self.stats_file = os.path.join(data_dir(), stats_file_name) \
+            if profiles.default.settings.get("write_stats", False) else None
+
+    def nag_secs(self) -> int:
+        return max(1, min(60, self.profiles.default.settings.get("notification_timer_mins", 5))) * 60
+
+    def stop(self):
+        self.stopping = True
+        self.wakeup.set()
+
+    def dispatch(self, due: list):
+        message = rxnag_core.Utils.reminder_message(due)
+        for sink in self.sinks:
+            sink.send(due, message)
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        self.wakeup = asyncio.Event()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, self.stop)
+        server = None
+        if self.instance is not None:
+            try:
+                os.remove(self.instance.socket_path)  # stale socket, we hold the lock
+            except FileNotFoundError:
+                pass
+            server = await asyncio.start_unix_server(self.handle_client, path=self.instance.socket_path)
+        # asyncio sleeps in monotonic time too; a suspend or clock step wakes us
+        # through the watch, or is noticed within clock_check_secs without one
+        # (only while a deadline is pending, nothing can be late otherwise)
+        clock = self.profiles.clock
+        clock_jumps = ClockJumpDetector(clock)
+        clock_watch = ClockChangeWatch.open()
+        limit = max_timer_secs
+        if clock_watch is not None:
+            loop.add_reader(clock_watch.fileno(), self.on_clock_changed, clock_watch)
+        else:
+            limit = clock_check_secs
+        try:
+            while not self.stopping:
+                jump = clock_jumps.check()
+                if jump:
+                    self.profiles.reschedule(jump)
+                due = self.profiles.check_reminders(clock.now(), self.nag_secs())
+                if due:
+                    self.dispatch(due)
+                if self.stats_file:
+                    stats.write_due(self.stats_file)
+                # sleep until the earliest deadline in any profile or a forwarded command
+                next_due = self.profiles.next_due()
+                delay = None if next_due is None else max(0, min(limit, next_due - clock.time()))
+                self.wakeup.clear()
+                try:
+                    await asyncio.wait_for(self.wakeup.wait(), delay)
+                    stats.count("wakeups_total", label="event")
+                except asyncio.TimeoutError:
+                    stats.count("wakeups_total", label="reminder")
+        finally:
+            if clock_watch is not None:
+                loop.remove_reader(clock_watch.fileno())
+                clock_watch.close()
+            if server is not None:
+                server.close()
+                await server.wait_closed()
+            self.profiles.close()
+            if self.stats_file:
+                stats.write(self.stats_file)
+
+    def on_clock_changed(self, clock_watch):
+        clock_watch.acknowledge()
+        self.wakeup.set()
+
+    async def handle_client(self, reader, writer):
+        try:
+            request = rxnag_core.decode_message(await reader.readline())
+            code, message = self.run_command_line([str(arg) for arg in request.get("argv", [])],
+                                                  str(request.get("cwd") or "/"))
+        except (ValueError, TypeError) as e:
+            code, message = 2, f"bad request: {e}"
+        writer.write(rxnag_core.encode_message({"code": code, "message": message}))
+        try:
+            await writer.drain()
+        finally:
+            writer.close()
+
+    def run_command_line(self, argv: list, cwd: str):
+        args, error = rxnag_core.parse_command_line(argv)
+        if error:
+            return error
+        messages = []
+        if args.profile:
+            messages.append(profiler.toggle_cpu(data_dir()))
+        if args.trace_memory:
+            messages.append(profiler.toggle_memory(data_dir()))
+        if messages and not (args.show or args.take or args.report is not None or args.export
+                             or args.import_file or args.stats):
+            return 0, "\n".join(messages)
+        code, message = self.run_commands(args, cwd)
+        return code, "\n".join(messages + [message] if message else messages)
+
+    def run_commands(self, args, cwd: str):
+        if args.show:
+            return 1, "RxNag is running headless, there is no window to show"
+        if args.stats:
+            return 0, stats.summary()
+        if args.report is not None:
+            import rxnag_report
+            return rxnag_report.run_profile(self.profiles, args.profile_name, args.report)
+        if args.export or args.import_file:
+            import rxnag_transfer
+            result = rxnag_transfer.run_profile(self.profiles, args, cwd)
+            self.wakeup.set()  # an import moves deadlines
+            return result
+        if not args.take:
+            return 1, "RxNag is already running headless"
+        code, messages = self.profiles.take(args.take, args.profile_name)
+        self.wakeup.set()  # deadlines moved
+        return code, "\n".join(messages)
+
+def main(argv: list, instance=None) -> int:
+    args = rxnag_core.build_arg_parser().parse_args(argv)
+    if args.profile:
+        profiler.start_cpu()
+    if args.trace_memory:
+        profiler.start_memory()
+    profiles = ProfileManager(data_dir(), timer=stats.timed, on_save=stats.saved)
+    settings = profiles.load()
+    try:
+        sinks = [make_sink(spec, settings) for spec in args.sink or ["stdout"]]
+    except ValueError as e:
+        print(f"rxnag: {e}", file=sys.stderr)
+        return 2
+    code, messages = profiles.take(args.take, args.profile_name)
+    for message in messages:
+        print(message, file=sys.stderr if code else sys.stdout)
+    asyncio.run(HeadlessReminders(profiles, sinks, instance).run())
+    for message in profiler.finish(data_dir()):
+        print(message)
+    return code
@@ -0,0 +1,262 @@
+# rxnag - Medication reminder app
+# Copyright (c) 2024-2026 Solorvox solorvox (at) epic.geek.nz
+# Source: https://github.com/solorvox/rxnag
+# License: GPL-3 https://www.gnu.org/licenses/gpl-3.0.txt
+#
+# Adherence report over the recorded dose history.  Every dose is due one
+# interval after the dose before it, or when its schedule says after that dose
+# (the same rule the reminders use); the numbers are computed for all
+# medications at once with NumPy, which is optional like pygame is for sound.
+# Medications on the same schedule share a rule, and each rule works out the
+# due times of all its doses at once: an interval added, or a search over the
+# rule's fixed times of day.
+import sys
+import datetime
+from rxnag_core import ProfileManager, ReminderEngine, data_dir, never_due
+from rxnag_schedule import IntervalRule, TimesRule, TaperRule
+
+default_windows = (7, 30, 90)
+grace_secs = 30 * 60  # taken this long after due still counts as on time
+
+def parse_windows(spec: str) -> tuple:
+    if not spec:
+        return default_windows
+    try:
+        windows = tuple(int(part) for part in spec.split(",") if part.strip())
+    except ValueError:
+        raise ValueError(f"--report wants whole days like 7,30,90, not {spec!r}") from None
+    if not windows or min(windows) < 1:
+        raise ValueError("--report days must be 1 or more")
+    return windows
+
+def _grouped_percentile(values, groups, count: int, q: float):
+    # nearest-rank percentile of values within each group
+    import numpy as np
+    result = np.zeros(count)
+    if not len(values):
+        return result
+    order = np.lexsort((values, groups))
+    sizes = np.bincount(groups, minlength=count)
+    starts = np.cumsum(sizes) - sizes
+    present = sizes > 0
+    ranks = np.ceil(q * sizes[present]).astype(np.int64) - 1
+    result[present] = values[order][starts[present] + ranks]
+    return result
+
+def _streaks(good, groups, count: int):
+    # (longest run of good per group, run of good ending at each group's last entry)
+    import numpy as np
+    longest = np.zeros(count, dtype=np.int64)
+    current = np.zeros(count, dtype=np.int64)
+    if not len(good):
+        return longest, current
+    new_group = np.empty(len(groups), dtype=bool)
+    new_group[0] = True
+    new_group[1:] = groups[1:] != groups[:-1]
+    run_id = np.cumsum(~good | new_group)
+    run_length = np.bincount(run_id[good], minlength=run_id[-1] + 1)
+    run_group = np.zeros(run_id[-1] + 1, dtype=np.int64)
+    run_group[run_id] = groups
+    np.maximum.at(longest, run_group, run_length)
+    last = np.flatnonzero(np.append(new_group[1:], True))
+    current[groups[last]] = np.where(good[last], run_length[run_id[last]], 0)
+    return longest, current
+
+def _next_due(rule, previous, not_before):
+    # rule.next_due for arrays of last doses and earliest due times; never_due
+    # where no dose is due
+    import numpy as np
+    if isinstance(rule, IntervalRule):
+        return np.maximum(previous + rule.secs, not_before)
+    if isinstance(rule, TimesRule):
+        after = np.maximum(previous + rule.early, not_before - 1)
+        if not len(after):
+            return after
+        slots = np.array(rule.slots(int(after.min()), int(after.max())), dtype=np.int64)
+        return slots[np.searchsorted(slots, after, side="right")]
+    due = np.full(len(previous), never_due, dtype=np.int64)
+    if isinstance(rule, TaperRule):
+        # the first phase from the one the dose was in that has a dose due before it ends
+        first = np.searchsorted(np.array(rule.starts, dtype=np.int64), previous, side="right") - 1
+        for index, (phase, secs) in enumerate(rule.phases):
+            pending = np.flatnonzero((due == never_due) & (first <= index))
+            if not len(pending):
+                continue
+            candidate = _next_due(phase, previous[pending], np.maximum(not_before[pending], rule.starts[index]))
+            end = rule.ends[index]
+            found = candidate != never_due if end is None else candidate < end
+            due[pending[found]] = candidate[found]
+    return due  # as needed is never due
+
+def _spacing(rule, when):
+    # rule.spacing for an array of times; only tapers change it over time
+    import numpy as np
+    if not isinstance(rule, TaperRule):
+        return np.full(len(when), rule.spacing(0), dtype=np.int64)
+    phase = np.maximum(np.searchsorted(np.array(rule.starts, dtype=np.int64), when, side="right") - 1, 0)
+    spacing = np.zeros(len(when), dtype=np.int64)
+    for index, (phase_rule, secs) in enumerate(rule.phases):
+        inside = np.flatnonzero(phase == index)
+        spacing[inside] = _spacing(phase_rule, when[inside])
+    return spacing
+
+def _by_rule(numbers, count: int) -> list:
+    # (rule number, indexes of the entries with it) for each of count rules in use
+    import numpy as np
+    order = np.argsort(numbers, kind="stable")
+    bounds = np.searchsorted(numbers[order], np.arange(count + 1))
+    return [(number, order[bounds[number]:bounds[number + 1]])
+            for number in range(count) if bounds[number] < bounds[number + 1]]
+
+def adherence(engine: ReminderEngine, windows=default_windows, grace: int = grace_secs) -> dict:
+    import numpy as np
+    store = engine.store
+    count = len(store)
+    now = engine.clock.now()
+    ids = np.array(store.ids, dtype=np.int64)
+    intervals = np.array(store.intervals, dtype=np.int64) * 3600
+    # medications on one schedule share a rule; -1 is a plain interval
+    rules = {}
+    rule_numbers = np.array([-1 if schedule is None else rules.setdefault(schedule, len(rules))
+                             for schedule in store.schedules], dtype=np.int64)
+    rules = list(rules)
+    doses = np.array(engine.journal.all_doses(), dtype=np.int64).reshape(-1, 3)
+
+    # doses of medications that still exist, plus each one's current last_taken
+    order = np.argsort(ids)
+    position = np.minimum(np.searchsorted(ids[order], doses[:, 1]), max(count - 1, 0))
+    known = ids[order][position] == doses[:, 1] if count else np.zeros(len(doses), dtype=bool)
+    rows = np.concatenate((order[position[known]], np.arange(count)))
+    taken = np.concatenate((doses[known, 2], np.array(store.last_taken, dtype=np.int64)))
+    order = np.lexsort((taken, rows))
+    rows, taken = rows[order], taken[order]
+    unique = np.ones(len(rows), dtype=bool)
+    unique[1:] = (rows[1:] != rows[:-1]) | (taken[1:] != taken[:-1])
+    rows, taken = rows[unique], taken[unique]
+
+    # one entry per dose that has a dose before it
+    follows = np.zeros(len(rows), dtype=bool)
+    follows[1:] = rows[1:] == rows[:-1]
+    gap_rows = rows[follows]
+    gap_taken = taken[follows]
+    previous = taken[np.flatnonzero(follows) - 1]
+    interval = intervals[gap_rows]
+    due = previous + interval
+    for number, at in _by_rule(rule_numbers[gap_rows], len(rules)):
+        next_due = _next_due(rules[number], previous[at], np.zeros(len(at), dtype=np.int64))
+        due[at] = np.where(next_due == never_due, gap_taken[at], next_due)  # as needed is never late
+        interval[at] = np.maximum(_spacing(rules[number], previous[at]), 1)
+    lateness = np.maximum(gap_taken - due, 0)
+    missed = lateness // interval
+    on_time = lateness <= grace
+    good = on_time & (missed == 0)
+
+    # time since the latest dose counts too: an overdue dose ends the streak
+    last_taken = np.full(count, np.iinfo(np.int64).min)
+    np.maximum.at(last_taken, rows, taken)
+    overdue_by = np.maximum(now - last_taken - intervals, 0)
+    for number, at in _by_rule(rule_numbers, len(rules)):
+        next_due = _next_due(rules[number], last_taken[at], np.zeros(len(at), dtype=np.int64))
+        overdue_by[at] = np.where(next_due == never_due, 0, np.maximum(now - next_due, 0))
+        intervals[at] = _spacing(rules[number], np.full(len(at), now, dtype=np.int64))
+    trailing_missed = overdue_by // np.maximum(intervals, 1)
+    overdue = overdue_by > grace
+
+    _, current = _streaks(good, gap_rows, count)
+    current[overdue] = 0
+
+    result = {"names": list(store.names), "now": now, "grace": grace, "current_streak": current, "windows": {}}
+    for days in windows:
+        span = days * 86400
+        inside = gap_taken >= now - span
+        rows_in = gap_rows[inside]
+        late_in = lateness[inside]
+        taken_count = np.bincount(rows_in, minlength=count)
+        on_time_count = np.bincount(rows_in[on_time[inside]], minlength=count)
+        missed_count = np.bincount(rows_in, weights=missed[inside], minlength=count).astype(np.int64) \
+            + np.minimum(trailing_missed, span // np.maximum(intervals, 1))
+        late_sum = np.bincount(rows_in, weights=late_in, minlength=count)
+        longest, _ = _streaks(good[inside], rows_in, count)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            result["windows"][days] = {
+                "doses": taken_count,
+                "on_time": np.where(taken_count > 0, on_time_count / taken_count, np.nan),
+                "mean_late": np.where(taken_count > 0, late_sum / taken_count, np.nan),
+                "p95_late": np.where(taken_count > 0, _grouped_percentile(late_in, rows_in, count, 0.95), np.nan),
+                "missed": missed_count,
+                "best_streak": longest,
+                "all": {
+                    "doses": int(taken_count.sum()),
+                    "on_time": on_time_count.sum() / taken_count.sum() if taken_count.sum() else np.nan,
+                    "mean_late": late_in.mean() if len(late_in) else np.nan,
+                    "p95_late": _grouped_percentile(late_in, np.zeros(len(late_in), dtype=np.int64), 1, 0.95)[0]
+                    if len(late_in) else np.nan,
+                    "missed": int(missed_count.sum()),
+                    "best_streak": int(longest.max()) if count else 0,
+                },
+            }
+    return result
+
+def format_lateness(seconds) -> str:
+    if seconds != seconds:  # nan, no doses
+        return "-"
+    if seconds < 120 * 60:
+        return f"{seconds / 60:.0f}m"
+    if seconds < 48 * 3600:
+        return f"{seconds / 3600:.1f}h"
+    return f"{seconds / 86400:.1f}d"
+
+def format_percent(fraction) -> str:
+    return "-" if fraction != fraction else f"{fraction * 100:.1f}%"
+
+def format_report(result: dict, title: str = "") -> str:
+    names = [name if len(name) <= 24 else name[:23] + "…" for name in result["names"]]
+    width = max([len(name) for name in names] + [len("All medications")])
+    when = datetime.datetime.fromtimestamp(result["now"]).strftime("%Y-%m-%d %H:%M")
+    lines = [f"Adherence report{' for ' + title if title else ''}, {when}",
+             f"on time = taken within {result['grace'] // 60} minutes of due"]
+    header = f"{'doses':>6} {'on time':>8} {'mean late':>10} {'p95 late':>9} {'missed':>7} {'best streak':>12}"
+    for days, window in result["windows"].items():
+        lines.append("")
+        lines.append(f"{'Last ' + str(days) + (' day' if days == 1 else ' days'):<{width}} {header}")
+        rows = [(names[row], window["doses"][row], window["on_time"][row], window["mean_late"][row],
+                 window["p95_late"][row], window["missed"][row], window["best_streak"][row])
+                for row in range(len(names))]
+        total = window["all"]
+        rows.append(("All medications", total["doses"], total["on_time"], total["mean_late"],
+                     total["p95_late"], total["missed"], total["best_streak"]))
+        for name, doses, on_time, mean_late, p95_late, missed, streak in rows:
+            lines.append(f"{name:<{width}} {doses:>6} {format_percent(on_time):>8} {format_lateness(mean_late):>10} "
+                         f"{format_lateness(p95_late):>9} {missed:>7} {streak:>12}")
+    lines.append("")
+    lines.append("Current streak (doses on time in a row): " +
+                 (", ".join(f"{name} {streak}" for name, streak in zip(names, result["current_streak"]))
+                  or "no medications"))
+    return "\n".join(lines)
+
+def run(engine: ReminderEngine, spec: str, title: str = ""):
+    # --report for the command line and forwarded commands: (exit code, text)
+    try:
+        windows = parse_windows(spec)
+    except ValueError as e:
+        return 2, f"rxnag: {e}"
+    try:
+        return 0, format_report(adherence(engine, windows), title)
+    except ImportError:
+        return 1, "rxnag: the adherence report needs NumPy (apt install python3-numpy)"
+
+def run_profile(profiles: ProfileManager, profile, spec: str):
+    # --for PROFILE or the active one; profiles are only named when there are several
+    name = profiles.lookup(profile)
+    if name is None:
+        return 1, f"No profile named {profile}"
+    return run(profiles.engine(name), spec, name if len(profiles.names()) > 1 else "")
+
+def main(args) -> int:
+    # standalone --report: loads only the profile reported on and writes nothing
+    profiles = ProfileManager(data_dir())
+    code, text = run_profile(profiles, args.profile_name, args.report)
+    for engine in profiles.engines.values():
+        engine.close()
+    print(text, file=sys.stderr if code else sys.stdout)
+    return code
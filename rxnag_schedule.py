@@ -0,0 +1,256 @@
+# rxnag - Medication reminder app
+# Copyright (c) 2024-2026 Solorvox solorvox (at) epic.geek.nz
+# Source: https://github.com/solorvox/rxnag
+# License: GPL-3 https://www.gnu.org/licenses/gpl-3.0.txt
+#
+# Schedules beyond "every N hours": intervals in minutes or days, fixed times
+# of day on chosen weekdays, tapering phases and as-needed (PRN) doses with a
+# minimum spacing.  A rule turns the last dose into the next due time in one
+# step, a bisect over sorted times of day or taper phase starts, never by
+# walking the calendar.  Rules are immutable and written back as the text
+# parse_schedule() reads.
+import re
+import bisect
+import datetime
+import functools
+
+early_dose_secs = 3600  # a dose taken up to this long before a fixed time counts for it
+weekday_names = ("mon", "tue", "wed", "thu", "fri", "sat", "sun")
+# "mon", "mond", ... "monday"
+weekday_words = {name[:length]: day for day, name in enumerate(
+    ("monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday"))
+    for length in range(3, len(name) + 1)}
+day_sets = {"daily": tuple(range(7)), "weekdays": tuple(range(5)), "weekends": (5, 6)}
+duration_units = {"m": 60, "min": 60, "mins": 60, "minute": 60, "minutes": 60,
+                  "h": 3600, "hr": 3600, "hrs": 3600, "hour": 3600, "hours": 3600,
+                  "d": 86400, "day": 86400, "days": 86400}
+duration_pattern = re.compile(r"(\d+(?:\.\d+)?)\s*([a-z]+)")
+time_pattern = re.compile(r"(\d{1,2}):(\d{2})")
+one_day = datetime.timedelta(days=1)
+
+def parse_duration(text: str) -> int:
+    match = duration_pattern.fullmatch(text.strip())
+    if match is None or match.group(2) not in duration_units:
+        raise ValueError(f"unrecognized duration \"{text.strip()}\", use e.g. 90m, 36h or 3d")
+    secs = int(float(match.group(1)) * duration_units[match.group(2)])
+    if not 60 <= secs <= 999 * 86400:
+        raise ValueError(f"\"{text.strip()}\" is out of range, use 1 minute to 999 days")
+    return secs
+
+def format_duration(secs: int) -> str:
+    for unit, size in (("d", 86400), ("h", 3600)):
+        if secs % size == 0:
+            return f"{secs // size}{unit}"
+    return f"{secs // 60}m"
+
+class Rule:
+    as_needed = False
+    _text = None
+
+    def next_due(self, last_taken: int, not_before: int = 0):
+        # due time of the dose after one taken at last_taken, no earlier than
+        # not_before; None when no dose is ever due again
+        raise NotImplementedError
+
+    def spacing(self, when: int) -> int:
+        # usual time between doses around when, for the adherence report
+        raise NotImplementedError
+
+    def describe(self) -> str:
+        raise NotImplementedError
+
+    def __str__(self):
+        # saved with every snapshot, so only built once
+        if self._text is None:
+            self._text = self.describe()
+        return self._text
+
+    def __eq__(self, other):
+        return isinstance(other, Rule) and str(self) == str(other)
+
+    def __hash__(self):
+        return hash(str(self))
+
+    def __repr__(self):
+        return f"{type(self).__name__}({str(self)!r})"
+
+class IntervalRule(Rule):
+    def __init__(self, secs: int):
+        self.secs = secs
+
+    def next_due(self, last_taken: int, not_before: int = 0):
+        return max(last_taken + self.secs, not_before)
+
+    def spacing(self, when: int) -> int:
+        return self.secs
+
+    def describe(self):
+        return f"every {format_duration(self.secs)}"
+
+class TimesRule(Rule):
+    # local times of day, on some days of the week
+    def __init__(self, times, days=day_sets["daily"]):
+        self.times = sorted(set(times))  # seconds since midnight
+        self.days = frozenset(days)  # 0 is Monday
+        # with doses close together, an early one mustn't count for the next slot
+        gaps = [later - earlier for earlier, later in zip(self.times, self.times[1:] + [self.times[0] + 86400])]
+        self.early = min(early_dose_secs, min(gaps) // 2)
+
+    @staticmethod
+    def at(day: datetime.date, secs: int) -> int:
+        return int(datetime.datetime.combine(day, datetime.time(secs // 3600, secs // 60 % 60)).timestamp())
+
+    def next_after(self, when: int) -> int:
+        moment = datetime.datetime.fromtimestamp(when)
+        day = moment.date()
+        index = bisect.bisect_right(self.times, moment.hour * 3600 + moment.minute * 60 + moment.second)
+        while True:  # at most a week of days
+            if day.weekday() in self.days:
+                for secs in self.times[index:]:
+                    due = self.at(day, secs)
+                    if due > when:  # a DST change can move a slot before when
+                        return due
+            day += one_day
+            index = 0
+
+    def slots(self, first: int, last: int) -> list:
+        # every due time after first, through the first one after last; the
+        # adherence report looks a whole history's due times up in these
+        end = self.next_after(last)
+        day = datetime.datetime.fromtimestamp(first).date()
+        slots = []
+        while True:
+            if day.weekday() in self.days:
+                for secs in self.times:
+                    due = self.at(day, secs)
+                    if due > first:
+                        slots.append(due)
+                        if due >= end:
+                            return slots
+            day += one_day
+
+    def next_due(self, last_taken: int, not_before: int = 0):
+        return self.next_after(max(last_taken + self.early, not_before - 1))
+
+    def spacing(self, when: int) -> int:
+        return 7 * 86400 // (len(self.times) * len(self.days))
+
+    def describe(self):
+        days = next((name for name, days in day_sets.items() if frozenset(days) == self.days),
+                    ",".join(weekday_names[day] for day in sorted(self.days)))
+        return days + " " + ",".join(f"{secs // 3600:02d}:{secs // 60 % 60:02d}" for secs in self.times)
+
+class AsNeededRule(Rule):
+    # never due, only allowed again after the minimum spacing
+    as_needed = True
+
+    def __init__(self, secs: int = 0):
+        self.secs = secs
+
+    def next_due(self, last_taken: int, not_before: int = 0):
+        return None
+
+    def allowed_at(self, last_taken: int) -> int:
+        return last_taken + self.secs
+
+    def spacing(self, when: int) -> int:
+        return self.secs
+
+    def describe(self):
+        return f"as needed, {format_duration(self.secs)} apart" if self.secs else "as needed"
+
+class TaperRule(Rule):
+    # phases that follow each other from a start time; the last one may run
+    # on forever, otherwise nothing is due once it ends
+    def __init__(self, start: int, phases: list):
+        self.phases = phases  # (rule, secs or None)
+        self.starts = []
+        self.ends = []
+        for rule, secs in phases:
+            self.starts.append(start)
+            start = None if secs is None else start + secs
+            self.ends.append(start)
+
+    def next_due(self, last_taken: int, not_before: int = 0):
+        first = max(0, bisect.bisect_right(self.starts, last_taken) - 1)
+        for index in range(first, len(self.phases)):
+            due = self.phases[index][0].next_due(last_taken, max(not_before, self.starts[index]))
+            if due is not None and (self.ends[index] is None or due < self.ends[index]):
+                return due
+        return None
+
+    def spacing(self, when: int) -> int:
+        index = max(0, bisect.bisect_right(self.starts, when) - 1)
+        return self.phases[index][0].spacing(when)
+
+    def describe(self):
+        start = datetime.datetime.fromtimestamp(self.starts[0])
+        phases = [str(rule) if secs is None else f"{rule} for {format_duration(secs)}" for rule, secs in self.phases]
+        return f"taper from {start:%Y-%m-%d %H:%M}: " + "; ".join(phases)
+
+def parse_times(text: str) -> TimesRule:
+    days = []
+    times = []
+    for word in re.split(r"[\s,]+", text.strip()):
+        if not word or word == "at":
+            continue
+        match = time_pattern.fullmatch(word)
+        if match:
+            hours, minutes = int(match.group(1)), int(match.group(2))
+            if hours > 23 or minutes > 59:
+                raise ValueError(f"\"{word}\" is not a time of day")
+            times.append(hours * 3600 + minutes * 60)
+        elif word in day_sets:
+            days.extend(day_sets[word])
+        elif word in weekday_words:
+            days.append(weekday_words[word])
+        elif "-" in word and all(part in weekday_words for part in word.split("-", 1)):
+            # mon-fri, fri-mon
+            first, last = (weekday_words[part] for part in word.split("-", 1))
+            days.extend(day % 7 for day in range(first, last + 1 if last >= first else last + 8))
+        else:
+            raise ValueError(f"unrecognized \"{word}\" in schedule \"{text.strip()}\"")
+    if not times:
+        raise ValueError(f"no time of day in \"{text.strip()}\", use e.g. 08:00,20:00")
+    return TimesRule(times, days or day_sets["daily"])
+
+def parse_rule(text: str) -> Rule:
+    text = text.strip()
+    if text.startswith(("as needed", "prn")):
+        rest = re.sub(r"^(as needed|prn)[ ,]*((every|at least|min(imum)?) )?", "", text)
+        rest = re.sub(r"(,? apart)$", "", rest).strip()
+        return AsNeededRule(parse_duration(rest) if rest else 0)
+    if re.match(r"every \d", text):
+        return IntervalRule(parse_duration(text[len("every "):]))
+    # "every day 08:00", "every weekday 09:00"
+    text = re.sub(r"^every (day|weekday|weekend)\b", lambda m: {"day": "daily"}.get(m[1], m[1] + "s"), text)
+    return parse_times(text)
+
+@functools.lru_cache(maxsize=256)
+def parse_schedule(text: str) -> Rule:
+    # schedule text from the edit dialog, config.json or an import to a rule,
+    # ValueError if it can't be read.  Rules are immutable, so medications on
+    # the same schedule share one.
+    spec = " ".join(text.lower().split())
+    if not spec:
+        raise ValueError("no schedule given")
+    if not spec.startswith("taper"):
+        return parse_rule(spec)
+    match = re.fullmatch(r"taper (?:from )?(\d{4}-\d{2}-\d{2}(?:[ t]\d{1,2}:\d{2})?) ?: ?(.+)", spec)
+    if match is None:
+        raise ValueError("use e.g. \"taper from 2026-11-01 08:00: every 8h for 3d; every 12h for 3d\"")
+    try:
+        start = int(datetime.datetime.fromisoformat(match.group(1).replace("t", " ")).timestamp())
+    except ValueError:
+        raise ValueError(f"unrecognized start \"{match.group(1)}\", use YYYY-MM-DD HH:MM") from None
+    parts = [part.strip() for part in match.group(2).split(";") if part.strip()]
+    phases = []
+    for number, part in enumerate(parts, 1):
+        phase = re.fullmatch(r"(.+?) for (\S+(?: \S+)?)", part)
+        if phase is None and number < len(parts):
+            raise ValueError(f"taper phase \"{part}\" needs a length, e.g. \"for 3d\"")
+        rule = parse_rule(phase.group(1) if phase else part)
+        if rule.as_needed:
+            raise ValueError("as needed can't be part of a taper")
+        phases.append((rule, parse_duration(phase.group(2)) if phase else None))
+    return TaperRule(start, phases)
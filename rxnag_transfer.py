@@ -0,0 +1,277 @@
+# rxnag - Medication reminder app
+# Copyright (c) 2024-2026 Solorvox solorvox (at) epic.geek.nz
+# Source: https://github.com/solorvox/rxnag
+# License: GPL-3 https://www.gnu.org/licenses/gpl-3.0.txt
+#
+# --export / --import: medications and dose history as CSV or JSON Lines,
+# and upcoming doses as iCalendar events.  Both directions stream a record at
+# a time; an import upserts medications by name and saves once at the end.
+import os
+import sys
+import csv
+import json
+import datetime
+import rxnag_core
+from rxnag_core import ProfileManager, ReminderEngine, data_dir
+from rxnag_schedule import parse_schedule
+
+csv_fields = ("type", "name", "interval", "muted", "last_taken", "schedule", "taken_at")
+ics_days = 7  # how far ahead --export to .ics lists doses
+ics_max_events = 50000
+
+def guess_format(path: str, given=None) -> str:
+    if given:
+        return given
+    if path == "-":
+        raise ValueError("use --format csv, jsonl or ics with -")
+    extension = os.path.splitext(path)[1].lower().lstrip(".")
+    if extension in ("csv", "ics"):
+        return extension
+    if extension in ("jsonl", "ndjson", "json"):
+        return "jsonl"
+    raise ValueError(f"can't tell the format of {path}, use --format csv, jsonl or ics")
+
+def format_timestamp(when: int) -> str:
+    return datetime.datetime.fromtimestamp(when).astimezone().isoformat(timespec="seconds")
+
+def parse_time(value, clock) -> int:
+    # epoch seconds or anything parse_timestamp reads
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return int(value)
+    text = str(value).strip()
+    if text.isdigit():
+        return int(text)
+    return rxnag_core.parse_timestamp(text, clock)
+
+def parse_bool(value) -> bool:
+    if isinstance(value, bool):
+        return value
+    return str(value).strip().lower() in ("1", "true", "yes", "y", "on", "muted")
+
+# export
+
+def iter_rows(engine: ReminderEngine):
+    # medications first so an import always knows a name before its doses
+    store = engine.store
+    names = dict(zip(store.ids, store.names))
+    for row in range(len(store)):
+        yield {"type": "medication", "name": store.names[row], "interval": store.intervals[row],
+               "muted": int(store.is_muted(row)), "last_taken": format_timestamp(store.last_taken[row]),
+               "schedule": store.schedule_text(row)}
+    for seq, med_id, taken_at in engine.journal.iter_doses():
+        name = names.get(med_id)
+        if name is not None:
+            yield {"type": "dose", "name": name, "taken_at": format_timestamp(taken_at)}
+
+def write_csv(engine: ReminderEngine, out) -> int:
+    writer = csv.DictWriter(out, fieldnames=csv_fields)
+    writer.writeheader()
+    count = 0
+    for row in iter_rows(engine):
+        writer.writerow(row)
+        count += 1
+    return count
+
+def write_jsonl(engine: ReminderEngine, out) -> int:
+    count = 0
+    for row in iter_rows(engine):
+        out.write(json.dumps(row, ensure_ascii=False) + "\n")
+        count += 1
+    return count
+
+def ics_text(text: str) -> str:
+    return text.replace("\\", "\\\\").replace(";", "\\;").replace(",", "\\,").replace("\n", "\\n")
+
+def ics_time(when: int) -> str:
+    return datetime.datetime.fromtimestamp(when, datetime.timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+
+def write_ics(engine: ReminderEngine, out) -> int:
+    # each unmuted medication's doses over the next ics_days, due from now on
+    store = engine.store
+    now = engine.clock.now()
+    end = now + ics_days * 86400
+    stamp = ics_time(now)
+    out.write("BEGIN:VCALENDAR\r\nVERSION:2.0\r\nPRODID:-//RxNag//Medication Reminder//EN\r\n"
+              "CALSCALE:GREGORIAN\r\n")
+    count = 0
+    for row in range(len(store)):
+        if store.is_muted(row):
+            continue
+        due = max(store.next_due(row), now)
+        while due < end and count < ics_max_events:
+            out.write(f"BEGIN:VEVENT\r\nUID:rxnag-{store.ids[row]}-{due}@rxnag\r\nDTSTAMP:{stamp}\r\n"
+                      f"DTSTART:{ics_time(due)}\r\nDURATION:PT15M\r\n"
+                      f"SUMMARY:{ics_text('Take ' + store.names[row])}\r\nEND:VEVENT\r\n")
+            count += 1
+            due = store.following_due(row, due)
+    out.write("END:VCALENDAR\r\n")
+    return count
+
+writers = {"csv": write_csv, "jsonl": write_jsonl, "ics": write_ics}
+
+# import
+
+def read_csv(f):
+    for row in csv.DictReader(f):
+        yield {key.strip().lower(): value for key, value in row.items() if key}
+
+def read_jsonl(f):
+    for number, line in enumerate(f, 1):
+        if line.strip():
+            record = json.loads(line)
+            if not isinstance(record, dict):
+                raise ValueError(f"line {number} is not an object")
+            yield record
+
+readers = {"csv": read_csv, "jsonl": read_jsonl}
+
+class Importer:
+    # Upserts medications through the store directly (no save per row) and
+    # hands doses to the engine in chunks; run() saves once at the end.
+    # Records that can't be read are counted and skipped.
+    def __init__(self, engine: ReminderEngine, default_interval: int = 6):
+        self.engine = engine
+        self.default_interval = default_interval
+        store = engine.store
+        self.rows = {}
+        for row, name in enumerate(store.names):
+            self.rows.setdefault(name, row)
+            self.rows.setdefault(name.casefold(), row)
+        self.latest = {}  # row -> latest imported dose
+        self.added = self.updated = self.doses = self.known = self.skipped = 0
+
+    def row_of(self, name: str):
+        row = self.rows.get(name)
+        return self.rows.get(name.casefold()) if row is None else row
+
+    def medication(self, record: dict):
+        store = self.engine.store
+        clock = self.engine.clock
+        name = str(record.get("name") or "").strip()
+        if not name:
+            self.skipped += 1
+            return
+        row = self.row_of(name)
+        interval = record.get("interval")
+        interval = max(1, min(999, int(interval))) if interval not in (None, "") else None
+        last_taken = record.get("last_taken")
+        last_taken = parse_time(last_taken, clock) if last_taken not in (None, "") else None
+        muted = record.get("muted")
+        muted = parse_bool(muted) if muted not in (None, "") else None
+        # a blank schedule is a plain interval, no schedule field leaves it as is
+        schedule = record.get("schedule")
+        scheduled = {} if schedule is None else \
+            {"schedule": parse_schedule(str(schedule)) if str(schedule).strip() else None}
+        if row is None:
+            row = store.add(name, clock.now() if last_taken is None else last_taken,
+                            self.default_interval if interval is None else interval, bool(muted), **scheduled)
+            self.rows[name] = row
+            self.rows.setdefault(name.casefold(), row)
+            self.added += 1
+        else:
+            if last_taken is not None:
+                last_taken = max(last_taken, store.last_taken[row])
+            store.update(row, last_taken=last_taken, interval=interval, muted=muted, **scheduled)
+            self.updated += 1
+
+    def dose(self, record: dict):
+        row = self.row_of(str(record.get("name") or "").strip())
+        taken_at = record.get("taken_at")
+        if row is None or taken_at in (None, ""):
+            return None
+        taken_at = parse_time(taken_at, self.engine.clock)
+        if taken_at > self.latest.get(row, taken_at - 1):
+            self.latest[row] = taken_at
+        self.known += 1  # less the new ones, once they are written
+        return self.engine.store.ids[row], taken_at
+
+    def run(self, records):
+        def doses():
+            for record in records:
+                kind = str(record.get("type") or "").strip().lower()
+                if not kind:
+                    kind = "dose" if record.get("taken_at") not in (None, "") else "medication"
+                try:
+                    if kind == "medication":
+                        self.medication(record)
+                        continue
+                    dose = self.dose(record) if kind == "dose" else None
+                except (ValueError, TypeError, OverflowError):
+                    dose = None
+                if dose is None:
+                    self.skipped += 1
+                else:
+                    yield dose
+        store = self.engine.store
+        with store.bulk():
+            self.doses = self.engine.import_doses(doses())
+            self.known -= self.doses
+            # a newer dose than last_taken moves the next due time along
+            for row, taken_at in self.latest.items():
+                if taken_at > store.last_taken[row]:
+                    store.update(row, last_taken=taken_at)
+        for med_id in store.ids:
+            self.engine.schedule_reminder(med_id)
+        self.engine.save_config()
+
+    def summary(self) -> str:
+        text = f"Imported {self.added} new and {self.updated} updated medications, {self.doses} doses"
+        if self.known:
+            text += f", {self.known} already recorded"
+        return text + (f" ({self.skipped} records skipped)" if self.skipped else "")
+
+def export_to(engine: ReminderEngine, path: str, fmt: str) -> str:
+    write = writers[fmt]
+    if path == "-":
+        count = write(engine, sys.stdout)
+        sys.stdout.flush()
+    else:
+        # newline="" keeps csv from doubling line ends; .ics writes its own CRLF
+        with open(path, "w", encoding="utf-8", newline="") as out:
+            count = write(engine, out)
+    what = "events" if fmt == "ics" else "records"
+    return f"Exported {count} {what} to {'stdout' if path == '-' else path}"
+
+def import_from(engine: ReminderEngine, path: str, fmt: str) -> str:
+    if fmt not in readers:
+        raise ValueError(f"{fmt} is export only")
+    engine.check_writable()
+    importer = Importer(engine)
+    if path == "-":
+        importer.run(readers[fmt](sys.stdin))
+    else:
+        with open(path, "r", encoding="utf-8-sig", newline="") as f:
+            importer.run(readers[fmt](f))
+    return importer.summary()
+
+def run_profile(profiles: ProfileManager, args, cwd=None):
+    # --export/--import for --for PROFILE or the active one: (exit code, message).
+    # cwd is the launching shell's for forwarded commands, which can't use stdin/stdout.
+    name = profiles.lookup(args.profile_name)
+    if name is None:
+        return 1, f"No profile named {args.profile_name}"
+    engine = profiles.engine(name)
+    messages = []
+    for path, transfer in ((args.import_file, import_from), (args.export, export_to)):
+        if not path:
+            continue
+        if path == "-" and cwd is not None:
+            return 2, "rxnag: - only works when RxNag isn't already running, give a file name"
+        try:
+            fmt = guess_format(path, args.format)
+            if path != "-":
+                path = os.path.join(cwd or os.getcwd(), path)
+            messages.append(transfer(engine, path, fmt))
+        except (OSError, ValueError, csv.Error, UnicodeDecodeError) as e:
+            messages.append(f"rxnag: {path}: {e}")
+            return 1, "\n".join(messages)
+    return 0, "\n".join(messages)
+
+def main(args) -> int:
+    # standalone --export/--import, no other instance running
+    profiles = ProfileManager(data_dir())
+    code, message = run_profile(profiles, args)
+    profiles.close()
+    if message:
+        print(message, file=sys.stderr if code or args.export == "-" else sys.stdout)
+    return code
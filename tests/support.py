@@ -0,0 +1,45 @@
+# rxnag - Medication reminder app
+# Copyright (c) 2024-2026 Solorvox solorvox (at) epic.geek.nz
+# Source: https://github.com/solorvox/rxnag
+# License: GPL-3 https://www.gnu.org/licenses/gpl-3.0.txt
+#
+# Scaffold shared by the tests: the repo on sys.path, a temporary data dir
+# and a simulated clock per test, and an engine opened on them.
+import os
+import sys
+import json
+import shutil
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+from rxnag_core import ReminderEngine, SimulatedClock
+
+start_time = 1_700_000_000
+
+class DataDirTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix="rxnag-test-")
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+        self.clock = SimulatedClock(start_time)
+
+    def open(self) -> ReminderEngine:
+        engine = ReminderEngine(self.directory, self.clock)
+        engine.load_config()
+        return engine
+
+    def config(self) -> dict:
+        with open(os.path.join(self.directory, "config.json")) as f:
+            return json.load(f)
+
+class EngineTestCase(DataDirTestCase):
+    # self.engine is open on the data dir and closed after the test
+    def setUp(self):
+        super().setUp()
+        self.engine = self.open()
+        self.addCleanup(lambda: self.engine.close())
+
+    def reopen(self) -> ReminderEngine:
+        self.engine.close()
+        self.engine = self.open()
+        return self.engine
@@ -0,0 +1,214 @@
+# rxnag - Medication reminder app
+# Copyright (c) 2024-2026 Solorvox solorvox (at) epic.geek.nz
+# Source: https://github.com/solorvox/rxnag
+# License: GPL-3 https://www.gnu.org/licenses/gpl-3.0.txt
+#
+# The Qt-free store, scheduler and engine, on a simulated clock:
+#   python3 -m unittest discover tests   (or python3 -m pytest tests)
+import datetime
+import unittest
+import contextlib
+
+from support import DataDirTestCase, EngineTestCase, start_time
+import rxnag_core
+from rxnag_core import MedicationStore, ProfileManager, ReminderScheduler, SimulatedClock
+
+try:
+    import dateutil
+except ImportError:
+    dateutil = None
+
+def at(*args) -> int:
+    return int(datetime.datetime(*args).timestamp())
+
+class ParseTimestampTest(unittest.TestCase):
+    def test_fixed_formats(self):
+        for text in ("2026-10-16 08:30", "2026-10-16T08:30:00", "2026/10/16 08:30", "2026/10/16 08:30:00",
+                     "16.10.2026 08:30", "20261016 0830", "  2026-10-16 08:30 "):
+            with self.subTest(text=text):
+                self.assertEqual(rxnag_core.parse_timestamp(text), at(2026, 10, 16, 8, 30))
+
+    def test_time_of_day_is_today_by_the_clock(self):
+        clock = SimulatedClock(at(2026, 10, 16, 12, 0))
+        self.assertEqual(rxnag_core.parse_timestamp("21:15", clock), at(2026, 10, 16, 21, 15))
+        self.assertEqual(rxnag_core.parse_timestamp("07:05:30", clock), at(2026, 10, 16, 7, 5, 30))
+
+    @unittest.skipIf(dateutil is None, "dateutil is not installed")
+    def test_free_form_falls_back_to_dateutil(self):
+        self.assertEqual(rxnag_core.parse_timestamp("Oct 16 2026 8:30 pm"), at(2026, 10, 16, 20, 30))
+
+    def test_errors(self):
+        for text in ("", "   ", "25:99", "not a date", "2026-13-45 08:00"):
+            with self.subTest(text=text):
+                with self.assertRaises(ValueError):
+                    rxnag_core.parse_timestamp(text)
+
+class ReminderMessageTest(unittest.TestCase):
+    def test_join_names(self):
+        join = rxnag_core.Utils.join_names
+        self.assertEqual(join([]), "")
+        self.assertEqual(join(["A"]), "A")
+        self.assertEqual(join(["A", "B"]), "A and B")
+        self.assertEqual(join(["A", "B", "C"]), "A, B and C")
+        self.assertEqual(join(["A", "B", "C", "D", "E"]), "A, B and 3 more")
+        self.assertEqual(join(["A", "B", "C"], limit=2), "A and 2 more")
+
+    def test_one_message_per_cycle(self):
+        message = rxnag_core.Utils.reminder_message
+        self.assertEqual(message([("default", ["A", "B"])]), "💊 Time to take A and B")
+        # other profiles are named, one line each
+        self.assertEqual(message([("Ann", ["A"])]), "💊 Ann: A")
+        self.assertEqual(message([("default", ["A"]), ("Ann", ["B", "C"])]), "💊 default: A\n💊 Ann: B and C")
+        due = [(f"P{i}", ["A"]) for i in range(5)]
+        self.assertEqual(message(due).splitlines(), ["💊 P0: A", "💊 P1: A", "💊 P2: A", "and 2 more profiles"])
+
+class ClockJumpDetectorTest(unittest.TestCase):
+    def setUp(self):
+        self.clock = SimulatedClock(start_time)
+        self.detector = rxnag_core.ClockJumpDetector(self.clock)
+
+    def test_time_passing_is_no_jump(self):
+        self.clock.advance(3600)
+        self.assertEqual(self.detector.check(), 0.0)
+
+    def test_suspend_and_clock_steps(self):
+        self.clock.set(self.clock.time() + 8 * 3600)  # wall time moved, monotonic didn't
+        self.assertEqual(self.detector.check(), 8 * 3600)
+        self.assertEqual(self.detector.check(), 0.0)  # measured from the last check
+        self.clock.advance(60)
+        self.clock.set(self.clock.time() - 600)
+        self.assertEqual(self.detector.check(), -600)
+
+    def test_drift_within_tolerance(self):
+        self.clock.advance(300)
+        self.clock.set(self.clock.time() + 1.5)
+        self.assertEqual(self.detector.check(), 0.0)
+
+    def test_clock_change_watch_opens_or_is_unavailable(self):
+        watch = rxnag_core.ClockChangeWatch.open()
+        if watch is None:
+            self.skipTest("no timerfd here")
+        self.assertGreaterEqual(watch.fileno(), 0)
+        watch.acknowledge()  # nothing to read yet, re-arms
+        watch.close()
+        self.assertEqual(watch.fileno(), -1)
+
+class ReminderSchedulerTest(unittest.TestCase):
+    def test_reschedule_leaves_stale_entry_behind(self):
+        scheduler = ReminderScheduler()
+        scheduler.schedule("a", 100)
+        scheduler.schedule("a", 300)
+        scheduler.schedule("b", 200)
+        self.assertEqual(scheduler.next_due(), 200)
+        self.assertEqual(scheduler.pop_due(250), ["b"])
+        self.assertEqual(scheduler.pop_due(250), [])
+        self.assertEqual(scheduler.due("a"), 300)
+        self.assertEqual(scheduler.pop_due(300), ["a"])
+        self.assertEqual(len(scheduler), 0)
+        self.assertIsNone(scheduler.next_due())
+
+    def test_unschedule_skips_entry_at_top(self):
+        scheduler = ReminderScheduler()
+        scheduler.schedule("a", 100)
+        scheduler.schedule("b", 200)
+        scheduler.unschedule("a")
+        self.assertNotIn("a", scheduler)
+        self.assertEqual(scheduler.next_due(), 200)
+        self.assertEqual(scheduler.pop_due(1000), ["b"])
+
+    def test_stale_entries_are_compacted(self):
+        scheduler = ReminderScheduler()
+        for due in range(10000):
+            scheduler.schedule("a", due)
+        self.assertLessEqual(len(scheduler._heap), 2 * len(scheduler) + 65)
+        self.assertEqual(scheduler.pop_due(10 ** 6), ["a"])
+
+class MedicationStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.clock = SimulatedClock(start_time)
+        self.store = MedicationStore(self.clock)
+        self.events = []
+        self.store.subscribe(lambda event, row: self.events.append((event, row)))
+
+    def test_due_follows_last_taken_and_interval(self):
+        row = self.store.add("A", start_time - 7200, 4)
+        self.assertEqual(self.store.next_due(row), start_time + 7200)
+        self.assertFalse(self.store.due[row])
+        self.assertFalse(self.store.refresh_due(row, start_time + 7199))
+        self.assertTrue(self.store.refresh_due(row, start_time + 7200))
+        self.assertTrue(self.store.due[row])
+        self.assertEqual(self.events[-1], (rxnag_core.CHANGED, row))
+
+    def test_ids_stay_stable_when_rows_shift(self):
+        for name in ("A", "B", "C"):
+            self.store.add(name, start_time, 6)
+        b = self.store.ids[1]
+        self.store.remove(0)
+        self.assertEqual(self.store.row_of(b), 0)
+        row = self.store.add("D", start_time, 6)
+        self.assertNotIn(self.store.ids[row], (b, 1))
+        self.assertEqual(self.store.names, ["B", "C", "D"])
+
+    def test_bulk_sends_one_reset(self):
+        with self.store.bulk():
+            for name in ("A", "B"):
+                self.store.add(name, start_time, 6)
+        self.assertEqual(self.events, [(rxnag_core.ABOUT_TO_RESET, -1), (rxnag_core.RESET, -1)])
+
+    def test_muted_overdue_is_not_rescheduled(self):
+        row = self.store.add("A", start_time - 86400, 6, muted=True)
+        self.assertIsNone(self.store.reminder_time(row, start_time))
+
+class ReminderEngineTest(EngineTestCase):
+    def test_nags_until_taken(self):
+        engine = self.engine
+        row = engine.add("A", start_time - 6 * 3600, 6)
+        self.assertEqual(engine.check_reminders(start_time, 300), ["A"])
+        self.assertEqual(engine.next_due(), start_time + 300)
+        self.clock.advance(300)
+        self.assertEqual(engine.check_reminders(self.clock.now(), 300), ["A"])
+        engine.mark_taken(row)
+        self.assertEqual(engine.next_due(), self.clock.now() + 6 * 3600)
+        self.assertEqual(engine.check_reminders(self.clock.now() + 300, 300), [])
+
+    def test_edits_survive_reopen(self):
+        engine = self.engine
+        row = engine.add("A", start_time - 3600, 6)
+        engine.mark_taken(row, start_time)
+        engine.set_muted(row, True)
+        engine.edit(row, "B", start_time - 60, 8)
+        engine = self.reopen()
+        self.assertEqual(engine.store.names, ["B"])
+        self.assertEqual(list(engine.store.last_taken), [start_time - 60])
+        self.assertEqual(list(engine.store.intervals), [8])
+        self.assertTrue(engine.store.is_muted(0))
+
+    def test_reschedule_after_clock_jump(self):
+        engine = self.engine
+        engine.add("A", start_time, 6)
+        self.clock.advance(7 * 3600)
+        engine.reschedule()
+        self.assertEqual(engine.next_due(), self.clock.now())
+        self.assertTrue(engine.store.due[0])
+
+class ProfileManagerTest(DataDirTestCase):
+    def test_front_end_hooks_time_sweeps_and_saves(self):
+        timed = []
+        saved = []
+
+        @contextlib.contextmanager
+        def timer(name):
+            timed.append(name)
+            yield
+
+        profiles = ProfileManager(self.directory, self.clock, timer=timer,
+                                  on_save=lambda seconds, size: saved.append(size))
+        profiles.load()
+        profiles.default.add("A", start_time - 6 * 3600, 6)
+        self.assertEqual(profiles.check_reminders(start_time, 300), [("default", ["A"])])
+        profiles.close()
+        self.assertEqual(timed, ["sweep_seconds"])
+        self.assertTrue(saved and min(saved) > 0)
+
+if __name__ == "__main__":
+    unittest.main()
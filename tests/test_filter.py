@@ -0,0 +1,100 @@
+# rxnag - Medication reminder app
+# Copyright (c) 2024-2026 Solorvox solorvox (at) epic.geek.nz
+# Source: https://github.com/solorvox/rxnag
+# License: GPL-3 https://www.gnu.org/licenses/gpl-3.0.txt
+#
+# The filter box: MedicationIndex, and the list model following store
+# changes under a filter (skipped without PyQt5).
+import unittest
+
+from support import start_time
+from rxnag_core import MedicationIndex, MedicationStore, SimulatedClock
+
+try:
+    import rxnag
+except ImportError:
+    rxnag = None
+
+names = ("Aspirin", "Aspen", "Wasp", "Paracetamol", "Ibuprofen")
+
+class MedicationIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.clock = SimulatedClock(start_time)
+        self.store = MedicationStore(self.clock)
+        for name in names:
+            self.store.add(name, start_time - 3600, 6)
+        self.index = MedicationIndex(self.store)
+        self.store.subscribe(self.index.on_store_changed)
+
+    def search(self, text: str) -> list:
+        return sorted(self.store.names[self.store.row_of(med_id)] for med_id in self.index.search(text))
+
+    def test_every_query_matches_anywhere_in_the_name(self):
+        self.assertEqual(self.search("as"), ["Aspen", "Aspirin", "Wasp"])
+        self.assertEqual(self.search("ol"), ["Paracetamol"])
+        self.assertEqual(self.search("pol"), [])
+        self.assertEqual(self.search(" PARA"), ["Paracetamol"])
+        for med_id in self.index.search("p"):
+            self.assertTrue(self.index.matches("p", med_id))
+
+    def test_typing_only_narrows(self):
+        previous = None
+        for query in ("a", "as", "asp", "aspi", "aspir"):
+            found = self.search(query)
+            if previous is not None:
+                self.assertLessEqual(set(found), set(previous), query)
+            previous = found
+        self.assertEqual(previous, ["Aspirin"])
+        self.assertEqual(self.search("a"), ["Aspen", "Aspirin", "Paracetamol", "Wasp"])  # backspaced
+
+    def test_follows_store_changes(self):
+        self.assertEqual(self.search("asp"), ["Aspen", "Aspirin", "Wasp"])
+        self.store.update(self.store.names.index("Wasp"), name="Wax")
+        self.store.remove(self.store.names.index("Aspen"))
+        self.store.add("Clasp", start_time, 6)
+        self.assertEqual(self.search("asp"), ["Aspirin", "Clasp"])
+        self.assertEqual(self.search("wa"), ["Wax"])
+
+    def test_quick_filters(self):
+        row = self.store.names.index("Ibuprofen")
+        self.store.update(row, last_taken=start_time - 6 * 3600, muted=True)
+        ibuprofen = self.store.ids[row]
+        self.assertEqual(self.index.due_by(start_time), {ibuprofen})
+        self.assertEqual(self.index.due_by(start_time + 5 * 3600), set(self.store.ids))
+        self.assertEqual(self.index.muted(), {ibuprofen})
+
+@unittest.skipIf(rxnag is None, "the list model needs PyQt5")
+class MedicationListModelTest(unittest.TestCase):
+    def setUp(self):
+        self.clock = SimulatedClock(start_time)
+        self.store = MedicationStore(self.clock)
+        for name in names:
+            self.store.add(name, start_time - 3600, 6)
+        self.model = rxnag.MedicationListModel(self.store)
+
+    def shown(self) -> list:
+        return [self.model.data(self.model.index(row)) for row in range(self.model.rowCount())]
+
+    def test_rows_follow_the_store_under_a_filter(self):
+        self.model.set_filter(text="as")
+        self.assertEqual(self.shown(), ["Aspirin", "Aspen", "Wasp"])
+        self.store.add("Clasp", start_time, 6)
+        self.store.add("Zinc", start_time, 6)
+        self.store.remove(self.store.names.index("Aspirin"))
+        self.store.update(self.store.names.index("Ibuprofen"), name="Ibuprofen gas")
+        self.store.update(self.store.names.index("Wasp"), name="Wax")
+        self.assertEqual(self.shown(), ["Aspen", "Ibuprofen gas", "Clasp"])
+        self.assertEqual([self.store.names[self.model.store_row(self.model.index(row))]
+                          for row in range(self.model.rowCount())], self.shown())
+
+    def test_quick_filter_with_text(self):
+        self.store.update(self.store.names.index("Wasp"), last_taken=start_time - 6 * 3600)
+        self.model.set_filter(text="as", quick_filter="due")
+        self.assertEqual(self.shown(), ["Wasp"])
+        self.model.set_filter(text="")
+        self.assertEqual(self.shown(), ["Wasp"])
+        self.model.set_filter(quick_filter=None)
+        self.assertEqual(self.shown(), list(names))
+
+if __name__ == "__main__":
+    unittest.main()
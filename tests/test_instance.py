@@ -0,0 +1,114 @@
+# rxnag - Medication reminder app
+# Copyright (c) 2024-2026 Solorvox solorvox (at) epic.geek.nz
+# Source: https://github.com/solorvox/rxnag
+# License: GPL-3 https://www.gnu.org/licenses/gpl-3.0.txt
+#
+# One running instance: the lock, forwarding a command line over the
+# socket, and where the two live.
+import io
+import os
+import socket
+import tempfile
+import threading
+import unittest
+import contextlib
+
+from support import DataDirTestCase
+import rxnag_core
+from rxnag_core import SingleInstance, encode_message, decode_message
+
+class SingleInstanceTest(DataDirTestCase):
+    def test_only_one_holds_the_lock(self):
+        first = SingleInstance(self.directory)
+        self.assertTrue(first.acquire())
+        self.assertFalse(SingleInstance(self.directory).acquire())
+        first._lock_file.close()  # as when the first process exits
+        self.assertTrue(SingleInstance(self.directory).acquire())
+
+    def test_forward_prints_the_reply(self):
+        instance = SingleInstance(self.directory)
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        server.bind(instance.socket_path)
+        server.listen(1)
+        server.settimeout(5)  # a failing forward mustn't hang the test
+        self.addCleanup(server.close)
+        received = []
+
+        def serve():
+            conn, _ = server.accept()
+            with conn:
+                request = b""
+                while not request.endswith(b"\n"):
+                    request += conn.recv(4096)
+                received.append(decode_message(request))
+                conn.sendall(encode_message({"code": 3, "message": "No medication named X"}))
+
+        thread = threading.Thread(target=serve)
+        thread.start()
+        output = io.StringIO()
+        with contextlib.redirect_stderr(output):
+            code = instance.forward(["--take", "X"])
+        thread.join()
+        self.assertEqual(code, 3)
+        self.assertEqual(output.getvalue(), "No medication named X\n")
+        self.assertEqual(received[0]["argv"], ["--take", "X"])
+        self.assertEqual(received[0]["cwd"], os.getcwd())
+
+    def test_forward_gives_up_when_nobody_answers(self):
+        with contextlib.redirect_stderr(io.StringIO()):
+            self.assertEqual(SingleInstance(self.directory).forward(["--show"], timeout=0.2), 1)
+
+    def test_messages(self):
+        self.assertEqual(decode_message(encode_message({"code": 0})), {"code": 0})
+        for line in (b"[1, 2]\n", b"{not json\n"):
+            with self.subTest(line=line):
+                with self.assertRaises(ValueError):
+                    decode_message(line)
+
+class RuntimeDirTest(DataDirTestCase):
+    def setUp(self):
+        super().setUp()
+        for name, value in (("XDG_RUNTIME_DIR", None), ("HOME", self.directory)):
+            self.addCleanup(self.restore, name, os.environ.get(name))
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+        self.addCleanup(setattr, tempfile, "tempdir", tempfile.tempdir)
+        tempfile.tempdir = self.directory
+        self.private = os.path.join(self.directory, f"rxnag-{os.getuid()}")
+
+    @staticmethod
+    def restore(name, value):
+        if value is None:
+            os.environ.pop(name, None)
+        else:
+            os.environ[name] = value
+
+    def test_xdg_runtime_dir_first(self):
+        os.environ["XDG_RUNTIME_DIR"] = self.directory
+        self.assertEqual(rxnag_core.runtime_dir(), self.directory)
+
+    def test_private_temp_dir(self):
+        with contextlib.redirect_stderr(io.StringIO()) as output:
+            self.assertEqual(rxnag_core.runtime_dir(), self.private)
+        self.assertEqual(os.stat(self.private).st_mode & 0o777, 0o700)
+        self.assertEqual(output.getvalue(), "")
+
+    def test_someone_elses_directory_is_not_used(self):
+        os.mkdir(self.private, 0o755)
+        os.chmod(self.private, 0o755)
+        with contextlib.redirect_stderr(io.StringIO()) as output:
+            self.assertEqual(rxnag_core.runtime_dir(), rxnag_core.data_dir())
+        self.assertIn("isn't a private directory", output.getvalue())
+        self.assertTrue(rxnag_core.data_dir().startswith(self.directory))
+
+    def test_symlink_is_not_followed(self):
+        target = os.path.join(self.directory, "elsewhere")
+        os.mkdir(target, 0o700)
+        os.symlink(target, self.private)
+        with contextlib.redirect_stderr(io.StringIO()):
+            self.assertEqual(rxnag_core.runtime_dir(), rxnag_core.data_dir())
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,138 @@
+# rxnag - Medication reminder app
+# Copyright (c) 2024-2026 Solorvox solorvox (at) epic.geek.nz
+# Source: https://github.com/solorvox/rxnag
+# License: GPL-3 https://www.gnu.org/licenses/gpl-3.0.txt
+#
+# The dose journal: replay after a crash mid-append, and compaction while
+# the GUI thread keeps appending.
+import os
+import time
+import threading
+import unittest
+
+from support import DataDirTestCase, start_time
+from rxnag_core import DoseJournal, DoseHistoryFile
+from rxnag_core import JOURNAL_RECORD, OP_TAKEN, OP_MUTED
+
+class DoseJournalTest(DataDirTestCase):
+    def setUp(self):
+        super().setUp()
+        self.journal = self.open_journal()
+        self.addCleanup(lambda: self.journal.close())
+
+    def open_journal(self):
+        history = DoseHistoryFile(os.path.join(self.directory, "doses.dat"))
+        return DoseJournal(os.path.join(self.directory, "journal.dat"), history)
+
+    def test_replay_ignores_torn_record(self):
+        for taken_at in (100, 200, 300):
+            self.journal.append(1, OP_TAKEN, taken_at)
+        self.journal.close()
+        with open(self.journal.path, "ab") as f:
+            f.write(JOURNAL_RECORD.pack(4, 1, OP_TAKEN, 400)[:7])  # crash mid-append
+
+        journal = self.open_journal()
+        records = journal.replay(0)
+        self.assertEqual([value for seq, med_id, op, value in records], [100, 200, 300])
+        self.assertEqual(journal.last_seq, 3)
+        # the next append cuts the torn bytes off instead of writing after them
+        journal.append(1, OP_TAKEN, 500)
+        journal.close()
+        self.assertEqual([record[3] for record in self.open_journal().replay(0)], [100, 200, 300, 500])
+
+    def test_replay_skips_records_the_snapshot_covers(self):
+        for taken_at in (100, 200, 300):
+            self.journal.append(1, OP_TAKEN, taken_at)
+        self.assertEqual([record[0] for record in self.open_journal().replay(2)], [3])
+
+    def test_compaction_with_concurrent_appends(self):
+        appended = []
+        done = threading.Event()
+
+        def append():
+            for taken_at in range(2000):
+                op = OP_MUTED if taken_at % 10 == 0 else OP_TAKEN
+                appended.append((self.journal.append(7, op, taken_at), op, taken_at))
+            done.set()
+
+        thread = threading.Thread(target=append)
+        thread.start()
+        compactions = 0
+        while not done.is_set() or compactions == 0:
+            # like a snapshot taken now and written a moment later
+            self.journal.compact(self.journal.last_seq)
+            compactions += 1
+        thread.join()
+
+        # every taken record is either archived or still in the journal, once
+        archived = [(seq, value) for seq, med_id, value in self.journal.history.read_all()]
+        pending = [(seq, value) for seq, med_id, op, value in self.open_journal().replay(0) if op == OP_TAKEN]
+        taken = [(seq, value) for seq, op, value in appended if op == OP_TAKEN]
+        self.assertEqual(sorted(archived + pending), sorted(taken))
+        self.assertEqual(len(set(archived) & set(pending)), 0)
+
+    def test_interrupted_compaction_does_not_archive_twice(self):
+        for taken_at in (100, 200):
+            self.journal.append(1, OP_TAKEN, taken_at)
+        # archived, then a crash before the journal was rewritten
+        self.journal.history.archive([(1, 1, 100), (2, 1, 200)])
+        self.journal.compact(2)
+        self.assertEqual(len(self.journal.history.read_all()), 2)
+        self.assertEqual(self.open_journal().replay(0), [])
+
+    def test_archive_skips_seqs_it_already_holds(self):
+        history = self.journal.history
+        history.archive([(1, 1, 100), (3, 1, 300)])
+        # seq 2 is below the last archived seq but not in the file yet
+        history.archive([(2, 1, 200), (3, 1, 300)])
+        self.assertEqual(sorted(history.read_all()), [(1, 1, 100), (2, 1, 200), (3, 1, 300)])
+
+class EngineJournalTest(DataDirTestCase):
+    def test_doses_after_the_snapshot_are_replayed(self):
+        engine = self.open()
+        row = engine.add("A", start_time - 3600, 6)
+        engine.flush()
+        engine.mark_taken(row, start_time)
+        engine.set_muted(row, True)
+        # no snapshot after these, as if RxNag was killed
+        engine.saver._take_pending()
+        engine.journal.close()
+
+        engine = self.open()
+        self.assertEqual(list(engine.store.last_taken), [start_time])
+        self.assertTrue(engine.store.is_muted(0))
+        self.assertEqual(engine.journal.doses(engine.store.ids[0]), [start_time])
+        engine.close()
+
+    def test_appends_are_synced_off_the_calling_thread(self):
+        synced = []
+        fsync = os.fsync
+        self.addCleanup(setattr, os, "fsync", fsync)
+
+        def record(fd):
+            synced.append(threading.current_thread().name)
+            fsync(fd)
+
+        engine = self.open()
+        self.addCleanup(engine.close)
+        row = engine.add("A", start_time - 3600, 6)
+        engine.flush()
+        os.fsync = record
+        for minutes in range(3):
+            engine.mark_taken(row, start_time + minutes * 60)
+        self.assertNotIn(threading.current_thread().name, synced)
+        deadline = time.monotonic() + 5
+        while engine.journal._unsynced and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertFalse(engine.journal._unsynced)
+        self.assertEqual(synced, ["rxnag-saver"])  # one fsync for all three
+
+    def test_close_syncs(self):
+        journal = DoseJournal(os.path.join(self.directory, "journal.dat"), None)
+        journal.append(1, OP_TAKEN, start_time)
+        self.assertTrue(journal._unsynced)
+        journal.close()
+        self.assertFalse(journal._unsynced)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,94 @@
+# rxnag - Medication reminder app
+# Copyright (c) 2024-2026 Solorvox solorvox (at) epic.geek.nz
+# Source: https://github.com/solorvox/rxnag
+# License: GPL-3 https://www.gnu.org/licenses/gpl-3.0.txt
+#
+# The adherence report.  Skipped without NumPy, like the report itself.
+import random
+import unittest
+
+from support import EngineTestCase, start_time
+from rxnag_core import never_due
+from rxnag_schedule import parse_schedule
+import rxnag_report
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+@unittest.skipIf(np is None, "the report needs NumPy")
+class RuleArrayTest(unittest.TestCase):
+    def test_due_times_match_the_rules(self):
+        rng = random.Random(7)
+        previous = np.array(sorted(start_time + rng.randrange(-200 * 86400, 200 * 86400) for _ in range(2000)),
+                            dtype=np.int64)
+        for spec in ("every 36h", "08:00,14:00,20:00", "mon,wed,fri 09:30", "as needed, 4h apart",
+                     "taper from 2023-11-10 08:00: every 6h for 3d; daily 08:00,20:00 for 7d; weekdays 08:00",
+                     "taper from 2023-11-10 08:00: every 8h for 2d; every 12h for 2d"):
+            with self.subTest(spec=spec):
+                rule = parse_schedule(spec)
+                due = rxnag_report._next_due(rule, previous, np.zeros(len(previous), dtype=np.int64))
+                expected = [rule.next_due(int(when)) for when in previous]
+                self.assertEqual(due.tolist(), [never_due if when is None else when for when in expected])
+                spacing = rxnag_report._spacing(rule, previous)
+                self.assertEqual(spacing.tolist(), [rule.spacing(int(when)) for when in previous])
+
+class ParseWindowsTest(unittest.TestCase):
+    def test_windows(self):
+        self.assertEqual(rxnag_report.parse_windows(""), rxnag_report.default_windows)
+        self.assertEqual(rxnag_report.parse_windows("1, 14,"), (1, 14))
+        for spec in ("week", "0", ","):
+            with self.subTest(spec=spec):
+                with self.assertRaises(ValueError):
+                    rxnag_report.parse_windows(spec)
+
+@unittest.skipIf(np is None, "the report needs NumPy")
+class AdherenceTest(EngineTestCase):
+    def setUp(self):
+        super().setUp()
+        hour = 3600
+        first = start_time - 48 * hour
+        # on time, 10 minutes late, 2 hours late, 13 hours late (2 doses
+        # missed), on time; the last one under three hours ago
+        self.engine.add("A", first, 6)
+        for taken_at in (first, first + 6 * hour, first + 12 * hour + 600, first + 20 * hour + 600,
+                         first + 39 * hour + 600, first + 45 * hour + 600):
+            self.engine.mark_taken(0, taken_at)
+        # as needed is never late, and nothing in the last day
+        self.engine.add("B", first, 6, schedule=parse_schedule("as needed"))
+        for taken_at in (first, first + hour, first + 20 * hour):
+            self.engine.mark_taken(1, taken_at)
+
+    def test_numbers(self):
+        result = rxnag_report.adherence(self.engine, (1, 7))
+        self.assertEqual(result["names"], ["A", "B"])
+        week = result["windows"][7]
+        self.assertEqual(week["doses"].tolist(), [5, 2])
+        self.assertEqual(week["on_time"].tolist(), [0.6, 1.0])
+        self.assertEqual(week["mean_late"][0], (600 + 7200 + 46800) / 5)
+        self.assertEqual(week["missed"].tolist(), [2, 0])
+        self.assertEqual(week["best_streak"].tolist(), [2, 2])
+        self.assertEqual(result["current_streak"].tolist(), [1, 2])
+        self.assertEqual(week["all"]["doses"], 7)
+        self.assertEqual(week["all"]["missed"], 2)
+        day = result["windows"][1]
+        self.assertEqual(day["doses"].tolist(), [2, 0])
+        self.assertEqual(day["on_time"][0], 0.5)
+        self.assertTrue(np.isnan(day["on_time"][1]))
+
+    def test_overdue_ends_the_current_streak(self):
+        self.clock.advance(7 * 3600)  # A was due 4 hours ago
+        result = rxnag_report.adherence(self.engine, (7,))
+        self.assertEqual(result["current_streak"].tolist(), [0, 2])
+        self.assertEqual(result["windows"][7]["missed"].tolist(), [2, 0])
+
+    def test_run(self):
+        code, text = rxnag_report.run(self.engine, "7", "Ann")
+        self.assertEqual(code, 0)
+        self.assertIn("Adherence report for Ann", text)
+        self.assertIn("Current streak (doses on time in a row): A 1, B 2", text)
+        self.assertEqual(rxnag_report.run(self.engine, "soon")[0], 2)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,103 @@
+# rxnag - Medication reminder app
+# Copyright (c) 2024-2026 Solorvox solorvox (at) epic.geek.nz
+# Source: https://github.com/solorvox/rxnag
+# License: GPL-3 https://www.gnu.org/licenses/gpl-3.0.txt
+#
+# Schedule text round trips and next due times.  Times of day are local, so
+# expected values are built with datetime the same way.
+import datetime
+import unittest
+
+from support import start_time
+from rxnag_schedule import parse_schedule, parse_duration, AsNeededRule
+
+def at(*args) -> int:
+    return int(datetime.datetime(*args).timestamp())
+
+class ParseScheduleTest(unittest.TestCase):
+    def test_round_trips(self):
+        specs = {
+            "every 36 hours": "every 36h",
+            "Every 1.5h": "every 90m",
+            "every 2 days": "every 2d",
+            "20:00, 8:00": "daily 08:00,20:00",
+            "every day at 08:00": "daily 08:00",
+            "every weekday 09:00": "weekdays 09:00",
+            "mon-fri 07:30": "weekdays 07:30",
+            "sat sunday 10:00": "weekends 10:00",
+            "mon,wed,fri at 9:00": "mon,wed,fri 09:00",
+            "fri-mon 12:00": "mon,fri,sat,sun 12:00",
+            "prn": "as needed",
+            "as needed, at least 4h apart": "as needed, 4h apart",
+            "PRN every 30 min": "as needed, 30m apart",
+            "taper from 2026-11-01 08:00: every 8h for 3d; every 12h for 3 days; daily 08:00 for 4d":
+                "taper from 2026-11-01 08:00: every 8h for 3d; every 12h for 3d; daily 08:00 for 4d",
+            "taper 2026-11-01: every 24h for 2d; weekdays 08:00":
+                "taper from 2026-11-01 00:00: every 1d for 2d; weekdays 08:00",
+        }
+        for text, expected in specs.items():
+            with self.subTest(text=text):
+                rule = parse_schedule(text)
+                self.assertEqual(str(rule), expected)
+                self.assertEqual(parse_schedule(str(rule)), rule)
+
+    def test_errors(self):
+        for text in ("", "weekdays", "25:00", "08:00 sometimes", "every 0m", "every 1000d",
+                     "taper from 2026-11-01: every 8h; every 12h", "taper from soon: every 8h",
+                     "taper from 2026-11-01: prn 4h for 2d"):
+            with self.subTest(text=text):
+                with self.assertRaises(ValueError):
+                    parse_schedule(text)
+
+    def test_durations(self):
+        self.assertEqual(parse_duration("90m"), 5400)
+        self.assertEqual(parse_duration("1.5 hours"), 5400)
+        self.assertEqual(parse_duration("3d"), 3 * 86400)
+
+class NextDueTest(unittest.TestCase):
+    def test_times_of_day_skip_the_weekend(self):
+        rule = parse_schedule("weekdays 08:00,20:00")
+        self.assertEqual(rule.next_due(at(2026, 10, 16, 8, 5)), at(2026, 10, 16, 20, 0))  # Friday
+        self.assertEqual(rule.next_due(at(2026, 10, 16, 20, 10)), at(2026, 10, 19, 8, 0))  # Monday
+        # taken a little early still counts for that time
+        self.assertEqual(rule.next_due(at(2026, 10, 19, 7, 30)), at(2026, 10, 19, 20, 0))
+
+    def test_close_times_shrink_the_early_window(self):
+        rule = parse_schedule("08:00,08:30")
+        self.assertEqual(rule.next_due(at(2026, 10, 16, 7, 55)), at(2026, 10, 16, 8, 30))
+
+    def test_interval(self):
+        rule = parse_schedule("every 36h")
+        self.assertEqual(rule.next_due(start_time), start_time + 36 * 3600)
+
+    def test_as_needed_is_never_due(self):
+        rule = parse_schedule("as needed 4h")
+        self.assertIsInstance(rule, AsNeededRule)
+        self.assertIsNone(rule.next_due(1000))
+        self.assertEqual(rule.allowed_at(1000), 1000 + 4 * 3600)
+
+    def test_taper_phases(self):
+        rule = parse_schedule("taper from 2026-11-01 08:00: every 8h for 1d; every 12h for 1d; daily 09:00 for 2d")
+        doses = []
+        due = rule.next_due(0)
+        while due is not None:
+            doses.append(due)
+            due = rule.next_due(due)
+        self.assertEqual(doses, [
+            at(2026, 11, 1, 8, 0), at(2026, 11, 1, 16, 0), at(2026, 11, 2, 0, 0),
+            at(2026, 11, 2, 12, 0), at(2026, 11, 3, 0, 0),
+            at(2026, 11, 3, 9, 0), at(2026, 11, 4, 9, 0),
+        ])
+
+    def test_store_uses_the_rule(self):
+        from rxnag_core import MedicationStore, SimulatedClock, never_due
+        store = MedicationStore(SimulatedClock(at(2026, 10, 16, 12, 0)))
+        timed = store.add("A", at(2026, 10, 16, 8, 0), 6, schedule=parse_schedule("08:00,20:00"))
+        prn = store.add("B", at(2026, 10, 16, 8, 0), 6, schedule="as needed, 6h apart")
+        self.assertEqual(store.next_due(timed), at(2026, 10, 16, 20, 0))
+        self.assertEqual(store.next_due(prn), never_due)
+        self.assertIsNone(store.reminder_time(prn, store.clock.now()))
+        self.assertEqual(store.next_dose_text(prn, store.clock.now()), "As needed: allowed in 2 Hours")
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,154 @@
+# rxnag - Medication reminder app
+# Copyright (c) 2024-2026 Solorvox solorvox (at) epic.geek.nz
+# Source: https://github.com/solorvox/rxnag
+# License: GPL-3 https://www.gnu.org/licenses/gpl-3.0.txt
+#
+# Switching between config.json/doses.dat and rxnag.db, and the saver
+# surviving a database it can't write to.
+import sqlite3
+import unittest
+
+from support import DataDirTestCase, EngineTestCase, start_time
+import rxnag_core
+from rxnag_core import ProfileManager, StorageUnavailable, database_retry_secs
+
+class StorageSwitchTest(EngineTestCase):
+    def add_history(self):
+        engine = self.engine
+        for name in ("A", "B"):
+            engine.add(name, start_time - 86400, 6)
+        engine.flush()  # the first doses reach doses.dat, the last stay in the journal
+        for taken_at in (start_time - 7200, start_time - 3600):
+            engine.mark_taken(0, taken_at)
+        engine.save_config()
+        engine.flush()
+        engine.mark_taken(1, start_time)
+
+    def doses(self, engine) -> list:
+        return sorted((med_id, taken_at) for seq, med_id, taken_at in engine.journal.all_doses())
+
+    def test_json_to_sqlite_and_back(self):
+        self.add_history()
+        expected = self.doses(self.engine)
+        self.assertEqual(len(expected), 3)
+
+        self.engine.set_storage("sqlite")
+        engine = self.reopen()
+        self.assertEqual(engine.storage, "sqlite")
+        self.assertIsNotNone(engine.database)
+        self.assertNotIn("medications", self.config())
+        self.assertEqual(engine.store.names, ["A", "B"])
+        self.assertEqual(self.doses(engine), expected)
+        engine.mark_taken(1, start_time + 60)
+        expected.append((engine.store.ids[1], start_time + 60))
+
+        engine.set_storage("json")
+        engine = self.reopen()
+        self.assertEqual(engine.storage, "json")
+        self.assertEqual([medication["name"] for medication in self.config()["medications"]], ["A", "B"])
+        self.assertEqual(self.doses(engine), sorted(expected))
+        self.assertEqual(list(engine.store.last_taken), [start_time - 3600, start_time + 60])
+
+    def test_saver_survives_locked_database(self):
+        self.add_history()
+        self.engine.set_storage("sqlite")
+        engine = self.engine
+        engine.database._conn.execute("PRAGMA busy_timeout=50")
+        other = sqlite3.connect(engine.database_file, isolation_level=None)
+        other.execute("BEGIN IMMEDIATE")
+        try:
+            engine.mark_taken(0, start_time + 120)
+            engine.save_config()
+            engine.flush()  # fails, doesn't raise
+            self.assertIsNotNone(engine.saver._pending)
+        finally:
+            other.execute("ROLLBACK")
+            other.close()
+        engine.add("C", start_time, 6)
+        engine.flush()
+        self.assertIsNone(engine.saver._pending)
+        self.assertTrue(engine.saver._thread.is_alive())
+        engine = self.reopen()
+        self.assertEqual(engine.store.names, ["A", "B", "C"])
+        self.assertIn((engine.store.ids[0], start_time + 120), self.doses(engine))
+
+class ProfileStorageTest(DataDirTestCase):
+    def test_every_profile_switches(self):
+        profiles = ProfileManager(self.directory, self.clock)
+        profiles.load()
+        profiles.create("Ann").add("A", start_time, 6)
+        self.assertEqual(profiles.set_storage("sqlite"), [])
+        self.assertEqual(profiles.create("Bob").storage, "sqlite")  # new ones follow
+        profiles.close()
+        profiles = ProfileManager(self.directory, self.clock)
+        profiles.load()
+        self.assertEqual([profiles.engine(name).storage for name in profiles.names()], ["sqlite"] * 3)
+        self.assertEqual(profiles.engine("Ann").store.names, ["A"])
+        profiles.close()
+
+class UnopenableDatabaseTest(EngineTestCase):
+    def setUp(self):
+        super().setUp()
+        for name in ("A", "B", "C"):
+            self.engine.add(name, start_time - 3600, 6)
+        self.engine.set_storage("sqlite")
+        self.engine.flush()
+
+    def fail_to_open(self, times: int):
+        # the next `times` attempts to open rxnag.db fail, as if it were locked
+        opened = rxnag_core.DoseDatabase
+        failures = [times]
+
+        def database(path):
+            if failures[0]:
+                failures[0] -= 1
+                raise sqlite3.OperationalError("database is locked")
+            return opened(path)
+
+        rxnag_core.DoseDatabase = database
+        self.addCleanup(setattr, rxnag_core, "DoseDatabase", opened)
+        return failures
+
+    def stored_names(self) -> list:
+        with sqlite3.connect(self.engine.database_file) as conn:
+            return [name for name, in conn.execute("SELECT name FROM medications ORDER BY row")]
+
+    def test_nothing_is_saved_over_the_database(self):
+        failures = self.fail_to_open(1000)
+        engine = self.reopen()
+        self.assertTrue(engine.read_only)
+        self.assertEqual(engine.storage, "sqlite")
+        self.assertEqual(engine.store.names, [])
+        engine.save_config()
+        engine.flush()
+        with self.assertRaises(StorageUnavailable):
+            engine.set_storage("json")
+        with self.assertRaises(StorageUnavailable):
+            engine.add("D", start_time, 6)
+        self.assertEqual(engine.take(["A"])[0], 1)
+        engine.close()
+        self.assertEqual(self.config()["storage"], "sqlite")
+
+        failures[0] = 0
+        engine = self.reopen()
+        self.assertFalse(engine.read_only)
+        self.assertEqual(engine.store.names, ["A", "B", "C"])
+        engine.set_storage("json")
+        self.assertEqual(self.stored_names(), ["A", "B", "C"])
+
+    def test_read_only_profile_retries(self):
+        self.fail_to_open(1)
+        engine = self.reopen()
+        self.assertTrue(engine.read_only)
+        self.assertEqual(engine.next_due(), start_time + database_retry_secs)
+        self.clock.advance(database_retry_secs)
+        engine.check_reminders(self.clock.now(), 300)
+        self.assertFalse(engine.read_only)
+        self.assertEqual(engine.store.names, ["A", "B", "C"])
+        engine.add("D", start_time, 6)
+        self.assertEqual(len(set(engine.store.ids)), 4)
+        engine.flush()
+        self.assertEqual(self.stored_names(), ["A", "B", "C", "D"])
+
+if __name__ == "__main__":
+    unittest.main()
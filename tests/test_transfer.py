@@ -0,0 +1,90 @@
+# rxnag - Medication reminder app
+# Copyright (c) 2024-2026 Solorvox solorvox (at) epic.geek.nz
+# Source: https://github.com/solorvox/rxnag
+# License: GPL-3 https://www.gnu.org/licenses/gpl-3.0.txt
+#
+# --export/--import round trips into the same profile.
+import io
+import unittest
+
+from support import EngineTestCase, start_time
+import rxnag_core
+import rxnag_transfer
+
+class ImportTest(EngineTestCase):
+    def export(self) -> str:
+        out = io.StringIO()
+        rxnag_transfer.write_csv(self.engine, out)
+        return out.getvalue()
+
+    def run_import(self, records) -> rxnag_transfer.Importer:
+        importer = rxnag_transfer.Importer(self.engine)
+        importer.run(records)
+        return importer
+
+    def test_reimporting_an_export_adds_nothing(self):
+        engine = self.engine
+        engine.add("A", start_time - 86400, 6)
+        engine.add("B", start_time - 86400, 8)
+        for row, taken_at in ((0, start_time - 7200), (1, start_time - 3600), (0, start_time)):
+            engine.mark_taken(row, taken_at)
+        exported = self.export()
+        importer = self.run_import(rxnag_transfer.read_csv(io.StringIO(exported)))
+        self.assertEqual((importer.added, importer.doses, importer.known), (0, 0, 3))
+        self.assertEqual(self.export(), exported)
+
+    def test_duplicates_within_one_file(self):
+        records = [{"type": "medication", "name": "C", "interval": 4}] + \
+                  [{"type": "dose", "name": "C", "taken_at": start_time}] * 2
+        importer = self.run_import(records)
+        self.assertEqual((importer.added, importer.doses, importer.known), (1, 1, 1))
+
+    def test_new_medications_are_saved_before_their_doses(self):
+        records = [{"type": "medication", "name": "C", "interval": 4},
+                   {"type": "dose", "name": "C", "taken_at": start_time}]
+        history = self.engine.journal.history
+        archive = history.archive
+
+        def interrupted(doses):
+            archive(doses)
+            if any(taken_at == start_time for seq, med_id, taken_at in doses):
+                raise KeyboardInterrupt
+
+        history.archive = interrupted
+        with self.assertRaises(KeyboardInterrupt):
+            self.run_import(records)
+        history.archive = archive
+        self.engine.saver._take_pending()  # killed before the final save
+        self.reopen()
+        self.assertEqual(self.engine.store.names, ["C"])
+        row = self.engine.add("D", start_time, 6)
+        self.assertEqual(self.engine.journal.doses(self.engine.store.ids[row]), [])
+
+    def test_import_stops_when_the_journal_can_not_be_compacted(self):
+        engine = self.engine
+        engine.add("A", start_time - 86400, 6)
+        engine.flush()
+        engine.mark_taken(0, start_time)  # only in the journal so far
+        dose = [{"type": "dose", "name": "A", "taken_at": start_time + 60}]
+        write = rxnag_core.atomic_write
+
+        def disk_full(path, data):
+            raise OSError("No space left on device")
+
+        rxnag_core.atomic_write = disk_full
+        try:
+            with self.assertRaises(OSError):
+                self.run_import(dose)
+        finally:
+            rxnag_core.atomic_write = write
+        self.engine.saver._take_pending()  # killed before the next save
+
+        engine = self.reopen()
+        med_id = engine.store.ids[0]
+        self.assertEqual(engine.journal.doses(med_id), [start_time])
+        self.assertEqual(self.run_import(dose).doses, 1)
+        engine = self.reopen()
+        self.assertEqual(engine.journal.doses(med_id), [start_time, start_time + 60])
+
+if __name__ == "__main__":
+    unittest.main()